@@ -0,0 +1,95 @@
+"""Connection set-up cost: request-shaped cycles with and without persistent connections."""
+
+import asyncio
+import time
+from typing import Dict, Optional
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from .harness import percentile
+
+SERVERS = ('wsgi', 'asgi')
+
+
+def _request_cycle(alias: str) -> None:
+    request_started.send(sender=None)
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    request_finished.send(sender=None)
+
+
+async def _asgi_cycle(alias: str) -> None:
+    # Like ASGIHandler: each request's sync code runs in a thread of its own, which holds its own connection
+    async with ThreadSensitiveContext():
+        await sync_to_async(_request_cycle)(alias)
+
+
+def bench_connection_reuse(iterations: int, conn_max_age: Optional[int], health_checks: bool,
+                           alias: str = 'default', server: str = 'wsgi') -> Dict:
+    """Time `iterations` cycles of request_started, SELECT 1, request_finished on one database.
+
+    Django opens and closes connections on those signals, so with conn_max_age=0
+    every cycle pays the TCP/TLS/authentication handshake, and with persistence
+    only the first one does (plus a ping per cycle when health checks are on).
+    With server='asgi' each cycle runs in a new thread as under the ASGI handler,
+    where persistent connections are never reused and stay open after their
+    request instead (Django ticket #33497); `connections_left_open` counts them.
+    """
+    if server not in SERVERS:
+        raise ValueError(f"server must be one of {', '.join(SERVERS)}")
+    connection = connections[alias]
+    # Shared by every thread's connection to the alias
+    settings_dict = connection.settings_dict
+    saved = {key: settings_dict.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+    opened = []
+
+    def count(sender, connection, **kwargs):
+        if connection.alias == alias:
+            opened.append(connection)
+
+    connection.close()
+    settings_dict.update(CONN_MAX_AGE=conn_max_age, CONN_HEALTH_CHECKS=health_checks)
+    connection_created.connect(count)
+    latencies = []
+    left_open = 0
+
+    async def run_asgi() -> None:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await _asgi_cycle(alias)
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        if server == 'asgi':
+            asyncio.run(run_asgi())
+        else:
+            for _ in range(iterations):
+                started = time.perf_counter()
+                _request_cycle(alias)
+                latencies.append(time.perf_counter() - started)
+    finally:
+        connection_created.disconnect(count)
+        for wrapper in opened:
+            if wrapper.connection is not None:
+                left_open += 1
+                # Connections of finished request threads are closed from here
+                wrapper.inc_thread_sharing()
+                wrapper.close()
+                wrapper.dec_thread_sharing()
+        connection.close()
+        settings_dict.update(saved)
+
+    latencies.sort()
+    return {
+        'name': 'connection',
+        'params': {'conn_max_age': conn_max_age, 'health_checks': health_checks, 'server': server},
+        'iterations': iterations,
+        'connections_opened': len(opened),
+        'connections_left_open': left_open,
+        'mean_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+        'p50_ms': 1000 * percentile(latencies, 0.50),
+        'p95_ms': 1000 * percentile(latencies, 0.95),
+        'p99_ms': 1000 * percentile(latencies, 0.99),
+    }
@@ -0,0 +1,256 @@
+"""Benchmark scenarios for plan_route, the list endpoints and LogGenerator.
+
+Every scenario returns a dict with latency percentiles, throughput, and the
+database queries and memory allocated by one profiled call, so results can
+be written as JSON and compared between commits with `compare()`.
+"""
+
+import math
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, time as clock_time
+from typing import Callable, Dict, Iterator, List, Sequence
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from ..models import Trip, LogSheet
+from ..services import geocoding, routing
+from ..services.geocode_cache import geocode_cache
+from ..services.log_generator import LogGenerator
+from ..services.route_cache import route_cache
+from ..services.route_planner import duration_matrix_cache
+from .standins import StandInServer
+
+
+def percentile(samples: Sequence[float], quantile: float) -> float:
+    """Nearest-rank percentile of a sorted sample"""
+    if not samples:
+        return 0.0
+    return samples[max(0, math.ceil(quantile * len(samples)) - 1)]
+
+
+def measure(name: str, call: Callable[[int], None], iterations: int, concurrency: int = 1, **params) -> Dict:
+    """Profile call(0) once for queries and allocations, then time call(1..iterations)"""
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            call(0)
+        allocated, peak = tracemalloc.get_traced_memory()
+        # Count now: later requests reset the connection's query log
+        query_count = len(queries)
+    finally:
+        tracemalloc.stop()
+
+    latencies = []
+    failures = []
+
+    def timed(iteration: int) -> None:
+        started = time.perf_counter()
+        try:
+            call(iteration)
+        except Exception as e:
+            failures.append(e)
+        finally:
+            latencies.append(time.perf_counter() - started)
+            if concurrency > 1:
+                connections.close_all()
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='benchmark') as executor:
+            list(executor.map(timed, range(1, iterations + 1)))
+    else:
+        for iteration in range(1, iterations + 1):
+            timed(iteration)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'name': name,
+        'params': params,
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'errors': len(failures),
+        'mean_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+        'p50_ms': 1000 * percentile(latencies, 0.50),
+        'p95_ms': 1000 * percentile(latencies, 0.95),
+        'p99_ms': 1000 * percentile(latencies, 0.99),
+        'throughput_rps': iterations / elapsed if elapsed else 0.0,
+        'queries': query_count,
+        'allocated_kb': allocated / 1024,
+        'peak_kb': peak / 1024,
+    }
+
+
+@contextmanager
+def standin_upstreams(standin: StandInServer) -> Iterator[StandInServer]:
+    """Point the HTTP geocoders and router at a running stand-in, with empty caches"""
+    redirected = [(geocoder, geocoder.url) for geocoder in geocoding.geocoders
+                  if isinstance(geocoder, geocoding.NominatimGeocoder)]
+    table_url = None
+    if isinstance(routing.router, routing.OSRMRoutingBackend):
+        redirected.append((routing.router, routing.router.url))
+        table_url, routing.router.table_url = routing.router.table_url, standin.osrm_table_url
+    # The stand-in is local, so Nominatim's rate limit does not apply to it
+    limiters = [(geocoder, geocoder.limiter) for geocoder, _ in redirected if geocoder is not routing.router]
+    for service, _ in redirected:
+        service.url = standin.osrm_url if service is routing.router else standin.nominatim_url
+    for geocoder, _ in limiters:
+        geocoder.limiter = None
+    geocode_cache.clear()
+    route_cache.clear()
+    duration_matrix_cache.clear()
+    try:
+        yield standin
+    finally:
+        for service, url in redirected:
+            service.url = url
+        if table_url is not None:
+            routing.router.table_url = table_url
+        for geocoder, limiter in limiters:
+            geocoder.limiter = limiter
+        geocode_cache.clear()
+        route_cache.clear()
+        duration_matrix_cache.clear()
+
+
+def _trip_places(standin: StandInServer, miles: float, key: str, index: int = 0) -> Dict:
+    """Register origin, pickup and dropoff `miles` apart along a parallel and return a plan_route payload.
+
+    Each index starts ~1 km further north so that its route is not in the route cache either.
+    """
+    lat, lon = 39.0 + index * 0.01, -100.0
+    degrees_per_mile = 1 / (69.17 * math.cos(math.radians(lat)))
+    pickup_miles = min(50.0, miles / 4)
+    names = {role: f"Bench {key} {role}" for role in ('origin', 'pickup', 'dropoff')}
+    standin.add_place(names['origin'], lat, lon)
+    standin.add_place(names['pickup'], lat, lon + pickup_miles * degrees_per_mile)
+    # Route distances include the stand-in's road factor, so scale the straight line down
+    standin.add_place(names['dropoff'], lat, lon + miles * degrees_per_mile / 1.2)
+    return {
+        'current_location': names['origin'],
+        'pickup_location': names['pickup'],
+        'dropoff_location': names['dropoff'],
+        'current_cycle_hours': 10,
+    }
+
+
+def bench_plan_route(standin: StandInServer, miles: float, iterations: int, concurrency: int = 1,
+                     warm: bool = False) -> Dict:
+    """POST plan_route; cold runs use new locations every call so each one reaches the upstreams.
+
+    Every call sends its own Idempotency-Key, so warm runs repeating one payload are planned
+    each time (with warm caches) instead of replaying the first response.
+    """
+    url = reverse('trip-plan-route')
+    if not warm:
+        geocode_cache.clear()
+        route_cache.clear()
+    payloads = [_trip_places(standin, miles, f"{miles:g} {'warm' if warm else index}", index)
+                for index in range(1 if warm else iterations + 1)]
+
+    def call(iteration: int) -> None:
+        response = APIClient().post(url, payloads[0 if warm else iteration], format='json',
+                                    HTTP_IDEMPOTENCY_KEY=f"benchmark-{uuid.uuid4()}")
+        if response.status_code != 200:
+            raise RuntimeError(f"plan_route returned {response.status_code}: {response.content[:200]!r}")
+
+    return measure('plan_route', call, iterations, concurrency, miles=miles, warm=warm)
+
+
+def seed_trips(count: int, days: int = 5) -> List[Trip]:
+    """Insert `count` trips with `days` log sheets each, outside any measurement"""
+    trips = Trip.objects.bulk_create([
+        Trip(current_location=f"Seed {index} origin", pickup_location=f"Seed {index} pickup",
+             dropoff_location=f"Seed {index} dropoff", current_cycle_hours=10,
+             total_distance=500.0, estimated_duration=9.0)
+        for index in range(count)
+    ])
+    LogSheet.objects.bulk_create([
+        LogSheet(trip=trip, date=date(2025, 1, 1 + day), start_time=clock_time(0, 0), end_time=clock_time(0, 0),
+                 status_grid=[[0, 480, 'OFF'], [480, 1140, 'D'], [1140, 1440, 'OFF']])
+        for trip in trips for day in range(days)
+    ])
+    return trips
+
+
+def bench_list_endpoints(trips: List[Trip], iterations: int, concurrency: int = 1) -> List[Dict]:
+    """GET a page of trips with nested log sheets, and one trip's log sheets"""
+    trip_list = reverse('trip-list')
+    logsheet_list = reverse('logsheet-list')
+
+    def list_trips(iteration: int) -> None:
+        response = APIClient().get(trip_list, {'page_size': 50})
+        if response.status_code != 200:
+            raise RuntimeError(f"trip list returned {response.status_code}")
+
+    def list_logsheets(iteration: int) -> None:
+        response = APIClient().get(logsheet_list, {'trip': trips[iteration % len(trips)].id})
+        if response.status_code != 200:
+            raise RuntimeError(f"log sheet list returned {response.status_code}")
+
+    return [
+        measure('trip_list', list_trips, iterations, concurrency, trips=len(trips)),
+        measure('logsheet_list', list_logsheets, iterations, concurrency, trips=len(trips)),
+    ]
+
+
+def bench_log_generator(hours: float, iterations: int) -> Dict:
+    """Build (without saving) the log sheets of a trip with `hours` of driving"""
+    generator = LogGenerator()
+    trip = Trip(current_location='A', pickup_location='B', dropoff_location='C', current_cycle_hours=0)
+
+    def call(iteration: int) -> None:
+        generator.build_logs(trip, {'total_duration': hours})
+
+    return measure('log_generator', call, iterations, hours=hours)
+
+
+def run_suite(trip_miles: Sequence[float] = (250, 1000, 2500), concurrency: Sequence[int] = (1, 8),
+              iterations: int = 50, latency: float = 0.05, seed_count: int = 200,
+              log_hours: Sequence[float] = (10, 100, 500), progress: Callable[[Dict], None] = None) -> List[Dict]:
+    """Run every scenario against stand-in upstreams and return the list of results"""
+    results = []
+
+    def record(result: Dict) -> None:
+        results.append(result)
+        if progress:
+            progress(result)
+
+    with StandInServer(latency=latency) as standin, standin_upstreams(standin):
+        for miles in trip_miles:
+            for workers in concurrency:
+                record(bench_plan_route(standin, miles, iterations, workers))
+            record(bench_plan_route(standin, miles, iterations, warm=True))
+
+    trips = seed_trips(seed_count)
+    for workers in concurrency:
+        for result in bench_list_endpoints(trips, iterations, workers):
+            record(result)
+    for hours in log_hours:
+        record(bench_log_generator(hours, iterations))
+    return results
+
+
+def result_key(result: Dict) -> tuple:
+    return result['name'], result['concurrency'], tuple(sorted(result['params'].items()))
+
+
+def compare(results: List[Dict], baseline: List[Dict], threshold: float = 0.2) -> List[str]:
+    """Describe every scenario whose p95 latency grew by more than `threshold` or that runs more queries"""
+    previous = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None:
+            continue
+        label = f"{result['name']} {result['params']} x{result['concurrency']}"
+        if before['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{label}: p95 {before['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result['queries'] > before['queries']:
+            regressions.append(f"{label}: queries {before['queries']} -> {result['queries']}")
+    return regressions
@@ -0,0 +1,142 @@
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit, unquote
+from ..services.route_geometry import encode
+
+GEOMETRY_SPACING_METERS = 1000  # distance between points of the stand-in route lines
+
+ROAD_FACTOR = 1.2  # road distance over great-circle distance
+SPEED_MPS = 26.8  # ~60 mph
+
+
+def haversine_meters(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(h))
+
+
+class StandInServer:
+    """Local HTTP server answering like Nominatim (/search) and OSRM (/route/v1/driving/..., /table/v1/driving/...).
+
+    Places must be registered before they can be geocoded; routes are a fixed
+    factor longer than the great-circle distance and driven at a constant speed.
+    Every response is delayed by `latency` seconds to emulate the network.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.places: Dict[str, Tuple[float, float]] = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def nominatim_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/search"
+
+    @property
+    def osrm_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/route/v1/driving"
+
+    @property
+    def osrm_table_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/table/v1/driving"
+
+    def add_place(self, name: str, lat: float, lon: float) -> None:
+        self.places[' '.join(name.lower().split())] = (lat, lon)
+
+    def start(self) -> 'StandInServer':
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with standin._lock:
+                    standin.requests += 1
+                if standin.latency:
+                    time.sleep(standin.latency)
+                url = urlsplit(self.path)
+                if url.path == '/search':
+                    status, body = standin._search(parse_qs(url.query).get('q', [''])[0])
+                elif url.path.startswith('/table/v1/driving/'):
+                    status, body = standin._table(unquote(url.path[len('/table/v1/driving/'):]))
+                elif url.path.startswith('/route/v1/driving/'):
+                    status, body = standin._route(unquote(url.path[len('/route/v1/driving/'):]),
+                                                  parse_qs(url.query).get('overview', ['simplified'])[0])
+                else:
+                    status, body = 404, {'message': 'Not found'}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='standin-http', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self) -> 'StandInServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _search(self, query: str):
+        coordinates = self.places.get(' '.join(query.lower().split()))
+        if coordinates is None:
+            return 200, []
+        return 200, [{'lat': str(coordinates[0]), 'lon': str(coordinates[1]), 'display_name': query}]
+
+    def _points(self, waypoints: str):
+        return [(float(lat), float(lon)) for lon, lat in (waypoint.split(',') for waypoint in waypoints.split(';'))]
+
+    def _table(self, waypoints: str):
+        try:
+            points = self._points(waypoints)
+        except ValueError:
+            return 400, {'code': 'InvalidQuery', 'message': 'Query string malformed'}
+        return 200, {
+            'code': 'Ok',
+            'durations': [[haversine_meters(a, b) * ROAD_FACTOR / SPEED_MPS for b in points] for a in points],
+        }
+
+    def _route(self, waypoints: str, overview: str = 'simplified'):
+        try:
+            points = self._points(waypoints)
+        except ValueError:
+            return 400, {'code': 'InvalidQuery', 'message': 'Query string malformed'}
+        legs = []
+        line = points[:1]
+        for a, b in zip(points, points[1:]):
+            distance = haversine_meters(a, b) * ROAD_FACTOR
+            legs.append({'distance': distance, 'duration': distance / SPEED_MPS})
+            # A straight line with a point every GEOMETRY_SPACING_METERS, about as dense as OSRM's
+            steps = max(1, int(distance // GEOMETRY_SPACING_METERS))
+            line.extend((a[0] + (b[0] - a[0]) * step / steps, a[1] + (b[1] - a[1]) * step / steps)
+                        for step in range(1, steps + 1))
+        geometry = {'full': line, 'simplified': [points[0], points[-1]]}.get(overview)
+        route = {
+            'distance': sum(leg['distance'] for leg in legs),
+            'duration': sum(leg['duration'] for leg in legs),
+            'legs': legs,
+        }
+        if geometry is not None:
+            route['geometry'] = encode(geometry)
+        return 200, {'code': 'Ok', 'routes': [route]}
@@ -0,0 +1,183 @@
+"""Cold-start benchmark: how long a fresh process takes to load Django and answer its first request.
+
+Each sample is a new Python process (as a serverless function instance would
+be) that builds the ASGI application, then sends one request straight to it.
+The processes share a throwaway SQLite database and the local Nominatim/OSRM
+stand-in, so only the start-up cost of the settings profile being measured
+differs between them.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+from django.conf import settings
+from .harness import _trip_places
+from .standins import StandInServer
+
+ENDPOINTS = {
+    'plan_route': ('POST', '/api/trips/plan_route/'),
+    'trips': ('GET', '/api/trips/'),
+    'logsheets': ('GET', '/api/logsheets/'),
+}
+
+# Runs in the child: stdlib and Django only, timed from the first line
+_CHILD = r'''
+import time
+started = time.perf_counter()
+import asyncio, json, sys
+from django.core.asgi import get_asgi_application
+application = get_asgi_application()
+loaded = time.perf_counter()
+method, path, body = json.loads(sys.argv[1])
+body = body.encode()
+
+async def request():
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+        'method': method, 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode())],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+status = asyncio.run(request())
+answered = time.perf_counter()
+print(json.dumps({'load_ms': 1000 * (loaded - started), 'first_response_ms': 1000 * (answered - loaded),
+                  'status': status, 'modules': len(sys.modules)}))
+'''
+
+_SETUP = r'''
+import django
+django.setup()
+from datetime import date, time
+from django.core.management import call_command
+from api.models import Trip, LogSheet
+call_command('migrate', verbosity=0)
+for index in range(20):
+    trip = Trip.objects.create(current_location='New York, NY', pickup_location='Boston, MA',
+                               dropoff_location='Philadelphia, PA', current_cycle_hours=5.5)
+    LogSheet.objects.bulk_create(
+        LogSheet(trip=trip, date=date(2025, 1, day), start_time=time(0, 0), end_time=time(0, 0),
+                 status_grid=[[0, 480, 'OFF'], [480, 1440, 'D']])
+        for day in range(1, 6)
+    )
+'''
+
+
+class StartupBenchmark:
+    """Spawns processes against a scratch database; use as a context manager"""
+
+    def __init__(self, latency: float = 0.0):
+        self.standin = StandInServer(latency=latency)
+        self.directory = None
+        self.trips = 0
+
+    def __enter__(self) -> 'StartupBenchmark':
+        self.directory = tempfile.TemporaryDirectory(prefix='eld-startup-')
+        self.standin.start()
+        self._run(_SETUP, 'eld_backend.settings')
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.standin.stop()
+        self.directory.cleanup()
+
+    def _settings_module(self, profile: str) -> str:
+        """A settings module importing `profile` with the scratch database swapped in"""
+        name = 'startup_' + profile.replace('.', '_')
+        path = os.path.join(self.directory.name, f'{name}.py')
+        if not os.path.exists(path):
+            database = os.path.join(self.directory.name, 'db.sqlite3')
+            with open(path, 'w') as f:
+                f.write(f"from {profile} import *  # noqa\n"
+                        f"DATABASES = {{'default': {{'ENGINE': 'django.db.backends.sqlite3', 'NAME': {database!r}}}}}\n")
+        return name
+
+    def _run(self, code: str, profile: str, *args: str, python_flags: Sequence[str] = ()):
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': self._settings_module(profile),
+            # Required by the settings; the generated module swaps in the scratch database anyway
+            'DATABASE_URL': f"sqlite:///{os.path.join(self.directory.name, 'db.sqlite3')}",
+            'PYTHONPATH': os.pathsep.join([self.directory.name, str(settings.BASE_DIR)]),
+            'NOMINATIM_URL': self.standin.nominatim_url,
+            'OSRM_URL': self.standin.osrm_url,
+            'NOMINATIM_RATE_LIMIT': '0',
+            'TIMING_SAMPLE_RATE': '0',
+        }
+        return subprocess.run([sys.executable, *python_flags, '-c', code, *args], cwd=str(settings.BASE_DIR),
+                              env=env, capture_output=True, text=True, check=True)
+
+    def _request(self, endpoint: str) -> List:
+        method, path = ENDPOINTS[endpoint]
+        body = ''
+        if method == 'POST':
+            # New place names every time, so neither the geocode cache nor idempotency replays help
+            self.trips += 1
+            body = json.dumps(_trip_places(self.standin, 600, f'startup {self.trips}', index=self.trips))
+        return [method, path, body]
+
+    def sample(self, profile: str, endpoint: str) -> Dict:
+        """One cold process: module loading, first response, and wall time including interpreter start-up"""
+        started = time.perf_counter()
+        completed = self._run(_CHILD, profile, json.dumps(self._request(endpoint)))
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        result['process_ms'] = 1000 * (time.perf_counter() - started)
+        return result
+
+    def import_profile(self, profile: str, endpoint: str, top: int) -> List[Dict]:
+        """The modules with the largest self import time in a cold process, from `python -X importtime`"""
+        completed = self._run(_CHILD, profile, json.dumps(self._request(endpoint)), python_flags=['-X', 'importtime'])
+        modules = []
+        for line in completed.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            modules.append({'module': name.strip(), 'self_ms': int(self_us) / 1000,
+                            'cumulative_ms': int(cumulative_us) / 1000})
+        return sorted(modules, key=lambda module: module['self_ms'], reverse=True)[:top]
+
+
+def run_startup_suite(profiles: Sequence[str], endpoints: Sequence[str], runs: int, latency: float = 0.0,
+                      progress: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """Median cold-start timings for every (settings profile, endpoint) pair"""
+    results = []
+    with StartupBenchmark(latency=latency) as benchmark:
+        for profile in profiles:
+            for endpoint in endpoints:
+                samples = [benchmark.sample(profile, endpoint) for _ in range(runs)]
+                result = {
+                    'profile': profile,
+                    'endpoint': endpoint,
+                    'runs': runs,
+                    'statuses': sorted({sample['status'] for sample in samples}),
+                    'modules': samples[-1]['modules'],
+                }
+                for field in ('load_ms', 'first_response_ms', 'process_ms'):
+                    result[field] = statistics.median(sample[field] for sample in samples)
+                results.append(result)
+                if progress:
+                    progress(result)
+    return results
+
+
+def run_import_profile(profile: str, endpoint: str, top: int) -> List[Dict]:
+    with StartupBenchmark() as benchmark:
+        return benchmark.import_profile(profile, endpoint, top)
@@ -0,0 +1,33 @@
+"""Database connection helpers for PostgreSQL behind a transaction-mode pooler."""
+
+# libpq / psycopg transaction status of a connection with no transaction open on the server
+_IDLE = 0
+
+
+class TransactionStatementTimeout:
+    """Execute wrapper issuing SET LOCAL statement_timeout as the first statement of every transaction.
+
+    Behind a transaction-mode pooler, session settings would leak to whichever
+    client gets the server connection next, so the limit is scoped to each
+    transaction. Statements run outside transaction.atomic() (autocommit) are
+    not covered; give the database role a default for those, e.g.
+    ALTER ROLE ... SET statement_timeout = '30s'.
+    """
+
+    def __init__(self, timeout_ms: int):
+        self.timeout_ms = int(timeout_ms)
+
+    def __call__(self, execute, sql, params, many, context):
+        connection = context['connection']
+        if (connection.in_atomic_block
+                and connection.connection.info.transaction_status == _IDLE):
+            # psycopg sends BEGIN ahead of this statement, which then opens the transaction. The
+            # DB-API cursor is used directly so the statement does not pass through the wrappers again.
+            context['cursor'].cursor.execute(f"SET LOCAL statement_timeout = {self.timeout_ms}")
+        return execute(sql, params, many, context)
+
+
+def install_statement_timeout(connection, timeout_ms: int) -> None:
+    """Add the per-transaction timeout to a newly opened PostgreSQL connection, once per wrapper"""
+    if not any(isinstance(wrapper, TransactionStatementTimeout) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(TransactionStatementTimeout(timeout_ms))
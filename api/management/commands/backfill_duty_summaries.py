@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from ...services.duty_summary import backfill
+
+class Command(BaseCommand):
+    help = (
+        "Write the duty-status summary of every log sheet that lacks one, e.g. sheets saved before the summary "
+        "table existed; --rebuild recomputes them all after sheets were changed with QuerySet.update()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Sheets read and written per query (default DUTY_SUMMARY_BATCH_SIZE)")
+        parser.add_argument('--rebuild', action='store_true', help="Recompute existing summaries too")
+        parser.add_argument('--trip', type=int, action='append', default=[],
+                            help="Only this trip's sheets; repeat for several trips")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = backfill(options['batch_size'], rebuild=options['rebuild'], trip_ids=options['trip'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} summar{'y' if written == 1 else 'ies'} in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,102 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from ...benchmarks.harness import run_suite, compare
+
+
+def _numbers(kind):
+    def parse(value):
+        try:
+            return [kind(part) for part in value.split(',') if part.strip()]
+        except ValueError:
+            raise CommandError(f"Expected a comma-separated list of numbers, got {value!r}")
+    return parse
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark plan_route, the list endpoints and LogGenerator against local Nominatim/OSRM "
+        "stand-ins. Runs in a throwaway test database, like `manage.py test`. Concurrent runs need a "
+        "server database: SQLite's shared in-memory test database rejects concurrent writers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help="Timed calls per scenario")
+        parser.add_argument('--concurrency', type=_numbers(int), default=[1, 8],
+                            help="Comma-separated worker counts, e.g. 1,8")
+        parser.add_argument('--trip-miles', type=_numbers(float), default=[250, 1000, 2500],
+                            help="Comma-separated trip lengths for plan_route")
+        parser.add_argument('--log-hours', type=_numbers(float), default=[10, 100, 500],
+                            help="Comma-separated driving hours for LogGenerator")
+        parser.add_argument('--latency-ms', type=float, default=50, help="Delay added by the stand-in upstreams")
+        parser.add_argument('--seed-trips', type=int, default=200, help="Trips in the database for list endpoints")
+        parser.add_argument('--output', help="Write results as JSON to this file")
+        parser.add_argument('--baseline', help="Compare against a previous --output file")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Allowed p95 growth over the baseline before reporting a regression")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)['results']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Could not read the baseline: {e}")
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = run_suite(
+                trip_miles=options['trip_miles'],
+                concurrency=options['concurrency'],
+                iterations=options['iterations'],
+                latency=options['latency_ms'] / 1000,
+                seed_count=options['seed_trips'],
+                log_hours=options['log_hours'],
+                progress=self._report,
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'meta': self._meta(options), 'results': results}, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f"Regression: {regression}"))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def _report(self, result):
+        params = ' '.join(f"{key}={value}" for key, value in result['params'].items())
+        self.stdout.write(
+            f"{result['name']:<14} {params:<24} x{result['concurrency']:<3} "
+            f"p50 {result['p50_ms']:8.1f}ms  p95 {result['p95_ms']:8.1f}ms  p99 {result['p99_ms']:8.1f}ms  "
+            f"{result['throughput_rps']:7.1f}/s  {result['queries']:3d} queries  "
+            f"{result['allocated_kb']:8.1f} KiB  errors {result['errors']}"
+        )
+
+    def _meta(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                    check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'latency_ms': options['latency_ms'],
+            'iterations': options['iterations'],
+        }
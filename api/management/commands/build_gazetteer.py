@@ -0,0 +1,34 @@
+import csv
+import time
+from django.core.management.base import BaseCommand, CommandError
+from ...services.gazetteer import build_gazetteer
+
+class Command(BaseCommand):
+    help = (
+        "Build a memory-mapped place-name index for the 'gazetteer' geocoder. "
+        "Input columns: name,state,lat,lon and an optional population; state is a USPS code such as MA."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('places', help="CSV of places")
+        parser.add_argument('output', help="Path of the index file to write")
+        parser.add_argument('--delimiter', default=',', help="Field delimiter, e.g. '\\t' for tab-separated files")
+
+    def handle(self, *args, **options):
+        delimiter = '\t' if options['delimiter'] in ('\\t', 'tab') else options['delimiter']
+        try:
+            with open(options['places'], newline='', encoding='utf-8') as f:
+                places = [
+                    (row['name'], row.get('state') or '', float(row['lat']), float(row['lon']),
+                     int(float(row.get('population') or 0)))
+                    for row in csv.DictReader(f, delimiter=delimiter)
+                ]
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f"Could not read the places file: {e}")
+
+        started = time.monotonic()
+        summary = build_gazetteer(places, options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']}: {summary['places']} places under {summary['keys']} keys "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,41 @@
+import csv
+import time
+from django.core.management.base import BaseCommand, CommandError
+from ...services.road_graph import build_road_graph
+
+class Command(BaseCommand):
+    help = (
+        "Build a memory-mapped road graph for ROUTING_BACKEND='graph'. "
+        "Nodes CSV columns: id,lat,lon. Edges CSV columns: source,target,distance (meters),"
+        "duration (seconds) and an optional oneway (1/0); edges are two-way unless oneway is 1."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('nodes', help="CSV of graph nodes")
+        parser.add_argument('edges', help="CSV of road segments between nodes")
+        parser.add_argument('output', help="Path of the graph file to write")
+        parser.add_argument('--landmarks', type=int, default=8,
+                            help="Landmarks to precompute for A* (more is faster to query, slower to build)")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['nodes'], newline='') as f:
+                nodes = [(row['id'], float(row['lat']), float(row['lon'])) for row in csv.DictReader(f)]
+            with open(options['edges'], newline='') as f:
+                edges = [
+                    (row['source'], row['target'], float(row['distance']), float(row['duration']),
+                     row.get('oneway') in ('1', 'true', 'yes'))
+                    for row in csv.DictReader(f)
+                ]
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f"Could not read the graph input: {e}")
+
+        started = time.monotonic()
+        try:
+            summary = build_road_graph(nodes, edges, options['output'], options['landmarks'])
+        except KeyError as e:
+            raise CommandError(f"Edge refers to unknown node {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']}: {summary['nodes']} nodes, {summary['edges']} directed edges, "
+            f"{summary['landmarks']} landmarks in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,70 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from ...benchmarks.connections import SERVERS, bench_connection_reuse
+
+
+def _max_ages(value):
+    try:
+        # 'none' keeps connections open indefinitely, like CONN_MAX_AGE = None
+        return [None if part.strip().lower() == 'none' else int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise CommandError(f"Expected comma-separated seconds or 'none', got {value!r}")
+
+
+def _servers(value):
+    servers = [part.strip().lower() for part in value.split(',') if part.strip()]
+    unknown = set(servers) - set(SERVERS)
+    if unknown or not servers:
+        raise CommandError(f"Expected a comma-separated list of {', '.join(SERVERS)}, got {value!r}")
+    return servers
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-request connection handshakes (CONN_MAX_AGE=0) with persistent connections by timing "
+        "request-shaped cycles of one query against the configured database, the way the WSGI and the ASGI "
+        "handler run requests. Runs against the real database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help="Database alias to measure")
+        parser.add_argument('--iterations', type=int, default=100, help="Request cycles per setting")
+        parser.add_argument('--max-age', type=_max_ages, default=[0, 60],
+                            help="Comma-separated CONN_MAX_AGE values to compare, e.g. 0,60,none")
+        parser.add_argument('--server', type=_servers, default=list(SERVERS),
+                            help="Comma-separated request handlers to imitate: wsgi (one thread) and/or asgi "
+                                 "(a thread per request)")
+        parser.add_argument('--no-health-checks', action='store_true',
+                            help="Reuse persistent connections without pinging them first")
+        parser.add_argument('--output', help="Write results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options['database'] not in connections:
+            raise CommandError(f"Unknown database alias: {options['database']}")
+        results = []
+        for server in options['server']:
+            for max_age in options['max_age']:
+                result = bench_connection_reuse(options['iterations'], max_age, not options['no_health_checks'],
+                                                alias=options['database'], server=server)
+                results.append(result)
+                self.stdout.write(
+                    f"{server.upper()}  CONN_MAX_AGE={str(max_age):<5} "
+                    f"health checks {'on ' if result['params']['health_checks'] else 'off'}  "
+                    f"p50 {result['p50_ms']:7.2f}ms  p95 {result['p95_ms']:7.2f}ms  p99 {result['p99_ms']:7.2f}ms  "
+                    f"{result['connections_opened']} connection(s) opened, "
+                    f"{result['connections_left_open']} left open"
+                )
+
+            fresh = [result for result in results if result['params']['server'] == server
+                     and result['params']['conn_max_age'] == 0]
+            reused = [result for result in results if result['params']['server'] == server
+                      and result['params']['conn_max_age'] != 0]
+            if fresh and reused:
+                saved = fresh[0]['p50_ms'] - min(result['p50_ms'] for result in reused)
+                self.stdout.write(f"{server.upper()}: persistent connections save about {saved:.2f}ms per request (p50)")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'database': connections[options['database']].vendor, 'results': results}, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
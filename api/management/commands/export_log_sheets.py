@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from ...services.log_export import CONTENT_TYPES, export_log_sheets, export_queryset
+
+
+def _date(value):
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise CommandError(f"Expected a YYYY-MM-DD date, got {value!r}")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Write log sheets as CSV or NDJSON, streaming them in chunks so memory use stays flat"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file-format', choices=list(CONTENT_TYPES), default='csv')
+        parser.add_argument('--trip', type=int, action='append', dest='trips', help="Trip id; repeat for several")
+        parser.add_argument('--date-from', type=_date, help="First date to include, YYYY-MM-DD")
+        parser.add_argument('--date-to', type=_date, help="Last date to include, YYYY-MM-DD")
+        parser.add_argument('--chunk-size', type=int, help="Log sheets fetched per query")
+        parser.add_argument('--output', help="File to write; defaults to standard output")
+
+    def handle(self, *args, **options):
+        queryset = export_queryset(options['trips'], options['date_from'], options['date_to'])
+        lines = export_log_sheets(queryset, options['file_format'], options['chunk_size'])
+        if not options['output']:
+            for part in lines:
+                self.stdout.write(part, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+            for part in lines:
+                f.write(part)
+        self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}"))
@@ -0,0 +1,44 @@
+import signal
+import threading
+from django.core.management.base import BaseCommand
+from django.db import connections
+from ...services.plan_jobs import PlanJobWorker
+
+class Command(BaseCommand):
+    help = "Process plan_route jobs queued with ?mode=async, using a pool of worker threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Jobs processed concurrently")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds an idle worker waits before checking the queue again")
+        parser.add_argument('--drain', action='store_true', help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        workers = [PlanJobWorker(poll_interval=options['poll_interval']) for _ in range(max(1, options['workers']))]
+        processed = []
+
+        def work(worker):
+            try:
+                processed.append(worker.run(drain=options['drain']))
+            finally:
+                # Each thread has its own database connection
+                connections.close_all()
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping after the current jobs...")
+            for worker in workers:
+                worker.stop()
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, stop)
+            signal.signal(signal.SIGTERM, stop)
+
+        threads = [threading.Thread(target=work, args=(worker,), name=f'plan-job-worker-{index}')
+                   for index, worker in enumerate(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            # Join with a timeout so the main thread stays responsive to signals
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+        self.stdout.write(self.style.SUCCESS(f"Processed {sum(processed)} job(s)"))
@@ -0,0 +1,8 @@
+from django.core.management.base import BaseCommand
+from ...services.idempotency import purge_expired
+
+class Command(BaseCommand):
+    help = "Delete stored plan_route responses older than IDEMPOTENCY_KEY_WINDOW / IDEMPOTENCY_FINGERPRINT_WINDOW"
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"Deleted {purge_expired()} expired record(s)"))
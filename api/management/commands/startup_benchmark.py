@@ -0,0 +1,55 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from ...benchmarks.startup import ENDPOINTS, run_import_profile, run_startup_suite
+
+
+def _names(value):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure cold starts: for each settings profile and endpoint, start fresh processes that load the "
+        "ASGI application and answer one request, against a scratch SQLite database and local upstream stand-ins."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=_names, default=['eld_backend.settings', 'eld_backend.settings_serverless'],
+                            help="Comma-separated settings modules to compare")
+        parser.add_argument('--endpoints', type=_names, default=list(ENDPOINTS),
+                            help=f"Comma-separated endpoints to request first: {', '.join(ENDPOINTS)}")
+        parser.add_argument('--runs', type=int, default=5, help="Cold processes per profile and endpoint")
+        parser.add_argument('--latency-ms', type=float, default=0, help="Delay added by the stand-in upstreams")
+        parser.add_argument('--import-profile', type=int, default=0, metavar='N',
+                            help="Also list the N slowest module imports of the last profile's first endpoint")
+        parser.add_argument('--output', help="Write results as JSON to this file")
+
+    def handle(self, *args, **options):
+        unknown = [endpoint for endpoint in options['endpoints'] if endpoint not in ENDPOINTS]
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(unknown)}")
+
+        results = run_startup_suite(options['profiles'], options['endpoints'], max(1, options['runs']),
+                                    latency=options['latency_ms'] / 1000, progress=self._report)
+        output = {'results': results}
+
+        if options['import_profile']:
+            profile, endpoint = options['profiles'][-1], options['endpoints'][0]
+            modules = run_import_profile(profile, endpoint, options['import_profile'])
+            self.stdout.write(f"Slowest imports ({profile}, {endpoint}):")
+            for module in modules:
+                self.stdout.write(f"  {module['self_ms']:7.1f}ms self {module['cumulative_ms']:7.1f}ms total  "
+                                  f"{module['module']}")
+            output['imports'] = modules
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(output, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def _report(self, result):
+        self.stdout.write(
+            f"{result['profile']:<34} {result['endpoint']:<10} load {result['load_ms']:7.1f}ms  "
+            f"first response {result['first_response_ms']:7.1f}ms  process {result['process_ms']:7.1f}ms  "
+            f"{result['modules']} modules  status {','.join(map(str, result['statuses']))}"
+        )
@@ -0,0 +1,66 @@
+import random
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from .services.timing import metrics, start_request, end_request
+
+
+class TimingMiddleware:
+    """Times a sample of requests, adding a Server-Timing header and feeding /metrics.
+
+    TIMING_SAMPLE_RATE (0 to 1) is the fraction of requests timed; the rest
+    pass straight through.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'TIMING_SAMPLE_RATE', 0.0)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        timer, token = start_request()
+        try:
+            with connection.execute_wrapper(timer.execute_wrapper):
+                response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self._finish(request, response, timer, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        # Queries run on sync_to_async threads here, so only phase durations are recorded
+        started = time.perf_counter()
+        timer, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self._finish(request, response, timer, time.perf_counter() - started)
+
+    def _sampled(self) -> bool:
+        return self.sample_rate >= 1 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def _finish(self, request, response, timer, total: float):
+        response['Server-Timing'] = timer.server_timing(total)
+        match = getattr(request, 'resolver_match', None)
+        labels = {
+            'method': request.method,
+            'route': match.route if match else 'unmatched',
+            'status': str(response.status_code),
+        }
+        metrics.observe('eld_request_duration_seconds', labels, total)
+        metrics.increment('eld_request_queries_total', labels, timer.queries)
+        return response
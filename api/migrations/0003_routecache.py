@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_geocodecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('distance', models.FloatField()),
+                ('duration', models.FloatField()),
+                ('legs', models.JSONField(default=list)),
+                ('geometry', models.TextField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,70 @@
+from django.db import migrations
+
+STATUSES = ('OFF', 'SB', 'D', 'ON')
+
+
+def hourly_to_intervals(grid):
+    if not isinstance(grid, dict) or len(grid) != 24:
+        return None
+    try:
+        statuses = {int(hour): status for hour, status in grid.items()}
+    except (TypeError, ValueError):
+        return None
+    if sorted(statuses) != list(range(24)) or not all(status in STATUSES for status in statuses.values()):
+        return None
+
+    intervals = []
+    for hour in range(24):
+        status = statuses[hour]
+        if intervals and intervals[-1][2] == status:
+            intervals[-1][1] = (hour + 1) * 60
+        else:
+            intervals.append([hour * 60, (hour + 1) * 60, status])
+    return intervals
+
+
+def intervals_to_hourly(grid):
+    if not isinstance(grid, list) or not grid:
+        return None
+    try:
+        grid_statuses = {}
+        for hour in range(24):
+            minute = hour * 60 + 30
+            grid_statuses[str(hour)] = next(status for start, end, status in grid if start <= minute < end)
+    except (TypeError, ValueError, StopIteration):
+        return None
+    return grid_statuses
+
+
+def convert(apps, converter):
+    LogSheet = apps.get_model('api', 'LogSheet')
+    batch = []
+    for log_sheet in LogSheet.objects.only('id', 'status_grid').iterator(chunk_size=500):
+        converted = converter(log_sheet.status_grid)
+        if converted is not None:
+            log_sheet.status_grid = converted
+            batch.append(log_sheet)
+        if len(batch) >= 500:
+            LogSheet.objects.bulk_update(batch, ['status_grid'])
+            batch = []
+    if batch:
+        LogSheet.objects.bulk_update(batch, ['status_grid'])
+
+
+def forwards(apps, schema_editor):
+    convert(apps, hourly_to_intervals)
+
+
+def backwards(apps, schema_editor):
+    convert(apps, intervals_to_hourly)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_routecache'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_status_grid_intervals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='logsheet',
+            name='trip',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='log_sheets', to='api.trip'),
+        ),
+        migrations.AddIndex(
+            model_name='logsheet',
+            index=models.Index(fields=['trip', 'date'], name='api_logsheet_trip_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logsheet',
+            index=models.Index(fields=['date'], name='api_logsheet_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['created_at'], name='api_trip_created_at_idx'),
+        ),
+    ]
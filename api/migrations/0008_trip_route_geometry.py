@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='route_geometry',
+            field=models.TextField(null=True),
+        ),
+    ]
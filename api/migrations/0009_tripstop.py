@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_trip_route_geometry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripStop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveSmallIntegerField()),
+                ('kind', models.CharField(choices=[('pickup', 'Pickup'), ('dropoff', 'Dropoff')], max_length=8)),
+                ('location', models.CharField(max_length=255)),
+                ('shipment', models.CharField(max_length=64, null=True)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('trip', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stops', to='api.trip')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tripstop',
+            constraint=models.UniqueConstraint(fields=('trip', 'sequence'), name='api_tripstop_trip_sequence_uniq'),
+        ),
+    ]
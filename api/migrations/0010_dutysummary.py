@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_tripstop'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DutySummary',
+            fields=[
+                ('log_sheet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='api.logsheet')),
+                ('date', models.DateField()),
+                ('off_duty_minutes', models.PositiveIntegerField(default=0)),
+                ('sleeper_berth_minutes', models.PositiveIntegerField(default=0)),
+                ('driving_minutes', models.PositiveIntegerField(default=0)),
+                ('on_duty_minutes', models.PositiveIntegerField(default=0)),
+                ('trip', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.trip')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trip', 'date'], name='api_dutysummary_trip_date_idx'), models.Index(fields=['date'], include=('trip', 'off_duty_minutes', 'sleeper_berth_minutes', 'driving_minutes', 'on_duty_minutes'), name='api_dutysummary_date_idx')],
+            },
+        ),
+    ]
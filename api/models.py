@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 
 class Trip(models.Model):
@@ -8,10 +9,110 @@ class Trip(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     total_distance = models.FloatField(null=True)
     estimated_duration = models.FloatField(null=True)  # in hours
+    route_geometry = models.TextField(null=True)  # Encoded polyline of the full route, served by the geometry endpoint
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='api_trip_created_at_idx'),
+        ]
+
+class TripStop(models.Model):
+    """A pickup or dropoff of a trip planned with a list of stops, in driving order"""
+    PICKUP = 'pickup'
+    DROPOFF = 'dropoff'
+    KIND_CHOICES = [(PICKUP, 'Pickup'), (DROPOFF, 'Dropoff')]
+
+    # Lookups by trip use the (trip, sequence) constraint's index
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='stops', db_index=False)
+    sequence = models.PositiveSmallIntegerField()  # 1 for the first stop after the current location
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    location = models.CharField(max_length=255)
+    shipment = models.CharField(max_length=64, null=True)  # Pickups of a shipment precede its dropoffs
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trip', 'sequence'], name='api_tripstop_trip_sequence_uniq'),
+        ]
 
 class LogSheet(models.Model):
-    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='log_sheets')
+    # Lookups by trip use the (trip, date) index, so the FK needs no index of its own
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='log_sheets', db_index=False)
     date = models.DateField()
     start_time = models.TimeField()
     end_time = models.TimeField()
-    status_grid = models.JSONField()  # Stores the 24-hour grid data 
\ No newline at end of file
+    status_grid = models.JSONField()  # [[start_minute, end_minute, status], ...] covering the day
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trip', 'date'], name='api_logsheet_trip_date_idx'),
+            models.Index(fields=['date'], name='api_logsheet_date_idx'),
+        ]
+
+class DutySummary(models.Model):
+    """Minutes a log sheet spends in each duty status, kept in step with the sheet for fleet aggregates"""
+    log_sheet = models.OneToOneField(LogSheet, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    # Copied from the sheet so aggregates never join or read the JSON grid; lookups by trip use (trip, date)
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='+', db_index=False)
+    date = models.DateField()
+    off_duty_minutes = models.PositiveIntegerField(default=0)
+    sleeper_berth_minutes = models.PositiveIntegerField(default=0)
+    driving_minutes = models.PositiveIntegerField(default=0)
+    on_duty_minutes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trip', 'date'], name='api_dutysummary_trip_date_idx'),
+            # Covering on PostgreSQL, so date-range sums are index-only scans; a plain index elsewhere
+            models.Index(fields=['date'], name='api_dutysummary_date_idx',
+                         include=['trip', 'off_duty_minutes', 'sleeper_berth_minutes',
+                                  'driving_minutes', 'on_duty_minutes']),
+        ]
+
+class GeocodeCache(models.Model):
+    query = models.CharField(max_length=255, unique=True)  # Normalized location string
+    latitude = models.FloatField(null=True)  # Null when the location does not exist
+    longitude = models.FloatField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class RouteCache(models.Model):
+    key = models.CharField(max_length=255, unique=True)  # Quantized waypoint coordinates
+    distance = models.FloatField()  # in meters
+    duration = models.FloatField()  # in seconds
+    legs = models.JSONField(default=list)
+    geometry = models.TextField(null=True)  # Encoded polyline, when stored
+    updated_at = models.DateTimeField(auto_now=True)
+
+class PlanJob(models.Model):
+    """A plan_route request queued for the plan_jobs_worker command"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    payload = models.JSONField()  # The plan_route request body
+    result = models.JSONField(null=True)  # The plan_route response body, once succeeded
+    errors = models.JSONField(null=True)  # The plan_route error list, once failed
+    trip = models.ForeignKey(Trip, on_delete=models.SET_NULL, null=True, related_name='+')
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest queued (or expired running) job
+            models.Index(fields=['status', 'created_at'], name='api_planjob_status_idx'),
+        ]
+
+class IdempotencyRecord(models.Model):
+    """The stored response of a plan_route request, replayed for repeats of the same request"""
+    key = models.CharField(max_length=300, unique=True)  # 'key:<Idempotency-Key>' or 'fingerprint:<hash>'
+    fingerprint = models.CharField(max_length=64)  # Hash of the request payload
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True)  # Null while the first request is still being planned
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -0,0 +1,15 @@
+from rest_framework.pagination import CursorPagination
+
+class TripCursorPagination(CursorPagination):
+    """Newest trips first; the cursor is stable while new trips are being added"""
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+class LogSheetCursorPagination(CursorPagination):
+    """Latest dates first, matching the (trip, date) and date indexes; id breaks ties"""
+    ordering = ('-date', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
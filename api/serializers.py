@@ -1,14 +1,74 @@
 from rest_framework import serializers
-from .models import Trip, LogSheet
+from .models import Trip, TripStop, LogSheet, PlanJob
+from .services.status_grid import STATUSES, is_hourly_grid, is_interval_grid, from_hourly_grid, to_hourly_grid
 
-class LogSheetSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Lets clients pick the top-level fields of a read with ?fields=a,b or drop some with ?omit=a,b"""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD') or not is_top_level(self):
+            return fields
+        included = requested_fields(request, fields)
+        return {name: field for name, field in fields.items() if name in included}
+
+def is_top_level(serializer) -> bool:
+    """Whether a serializer renders the response itself rather than a nested field"""
+    parent = serializer.parent
+    if parent is None:
+        return True
+    return isinstance(parent, serializers.ListSerializer) and parent.parent is None
+
+def requested_fields(request, field_names) -> set:
+    """The subset of field_names that ?fields / ?omit leave in the response"""
+    included = set(field_names)
+    if request.query_params.get('fields'):
+        included &= set(request.query_params['fields'].split(','))
+    if request.query_params.get('omit'):
+        included -= set(request.query_params['omit'].split(','))
+    return included
+
+class LogSheetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = LogSheet
         fields = '__all__'
 
-class TripSerializer(serializers.ModelSerializer):
+    def validate_status_grid(self, value):
+        # Store legacy hourly grids in the compact interval encoding
+        if is_hourly_grid(value):
+            return from_hourly_grid(value)
+        if not is_interval_grid(value):
+            raise serializers.ValidationError(
+                "Must be [start_minute, end_minute, status] intervals covering minutes 0 to 1440 in order, "
+                f"with statuses from {', '.join(STATUSES)}, or a {{hour: status}} dict of all 24 hours"
+            )
+        return value
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Emit the legacy {hour: status} shape when the client asks for ?grid_format=hourly
+        request = self.context.get('request')
+        if (request is not None and request.query_params.get('grid_format') == 'hourly'
+                and is_interval_grid(data.get('status_grid'))):
+            data['status_grid'] = to_hourly_grid(data['status_grid'])
+        return data
+
+class TripSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     log_sheets = LogSheetSerializer(many=True, read_only=True)
 
     class Meta:
         model = Trip
-        fields = '__all__' 
\ No newline at end of file
+        # The route line is served, simplified, by the trip geometry endpoint
+        exclude = ['route_geometry']
+
+class TripStopSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TripStop
+        fields = ['sequence', 'kind', 'location', 'shipment', 'latitude', 'longitude']
+
+class PlanJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PlanJob
+        fields = ['id', 'status', 'result', 'errors', 'trip', 'attempts', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
@@ -0,0 +1,97 @@
+import asyncio
+from functools import partial
+from typing import Dict, List
+from asgiref.sync import sync_to_async
+from .geocode_cache import geocode_cache
+from .route_cache import route_cache, route_cache_key
+from .geocoding import GeocoderBusy
+from .route_planner import RoutePlanner, LocationNotFound
+from .throttle import AsyncSingleFlight, ThrottledError
+from .timing import span
+
+geocode_flights_async = AsyncSingleFlight('geocode')
+
+class AsyncRoutePlanner(RoutePlanner):
+    """RoutePlanner whose upstream calls run on the event loop instead of blocking a thread.
+
+    Validation, response parsing and stop calculation are shared with the
+    synchronous planner; only the I/O differs.
+    """
+
+    async def calculate_route_async(self, origin: str, pickup: str, destination: str, current_hours: float) -> Dict:
+        try:
+            # Validate locations
+            if not all([self._validate_location(loc) for loc in [origin, pickup, destination]]):
+                raise ValueError("One or more locations are invalid")
+
+            with span('geocode'):
+                coordinates = self._raise_geocode_errors(await self._geocode_many_async([origin, pickup, destination]))
+            waypoints = self._trip_waypoints(origin, pickup, destination, coordinates)
+            with span('route'):
+                route = await self._get_route_async(waypoints)
+            return self._build_route_result(route, waypoints, current_hours)
+        except ValueError as e:
+            raise e
+        except Exception:
+            raise ValueError("Location does not exist")
+
+    async def _geocode_many_async(self, locations: List[str]) -> Dict[str, object]:
+        """Async counterpart of _geocode_many: local index, then cache, then concurrent upstream lookups"""
+        unique = self._unique_locations(locations)
+        resolved = self._geocode_local(unique)
+        keys = [key for key in unique if key not in resolved]
+        if keys:
+            resolved.update(await sync_to_async(geocode_cache.get_many)(keys))
+            keys = [key for key in keys if key not in resolved]
+
+        fetched = {}
+        failed = {}
+        if keys:
+            outcomes = await asyncio.gather(
+                *(asyncio.wait_for(geocode_flights_async.do(key, partial(self._get_coordinates_async, unique[key])),
+                                   self.GEOCODE_TIMEOUT) for key in keys),
+                return_exceptions=True
+            )
+            for key, outcome in zip(keys, outcomes):
+                if isinstance(outcome, LocationNotFound):
+                    fetched[key] = None
+                elif isinstance(outcome, GeocoderBusy):
+                    failed[key] = outcome
+                elif isinstance(outcome, asyncio.TimeoutError):
+                    failed[key] = GeocoderBusy()
+                elif isinstance(outcome, BaseException):
+                    failed[key] = ValueError("Location does not exist")
+                else:
+                    fetched[key] = outcome
+            await sync_to_async(geocode_cache.set_many)(fetched)
+
+        resolved.update(fetched)
+        return self._geocode_results(locations, resolved, failed)
+
+    async def _get_coordinates_async(self, location: str) -> tuple:
+        try:
+            for geocoder in self.remote_geocoders:
+                try:
+                    return await geocoder.geocode_async(location)
+                except LocationNotFound:
+                    continue
+            raise LocationNotFound("Location does not exist")
+        except LocationNotFound:
+            raise
+        except ThrottledError:
+            raise GeocoderBusy()
+        except Exception:
+            raise ValueError("Location does not exist")
+
+    async def _get_route_async(self, coordinates: List[tuple]) -> Dict:
+        if not self.router.cacheable:
+            return await self._fetch_route_async(coordinates)
+        key = route_cache_key(coordinates)
+        route = await sync_to_async(route_cache.get)(key)
+        if route is None:
+            route = await self._fetch_route_async(coordinates)
+            await sync_to_async(route_cache.set)(key, route)
+        return route
+
+    async def _fetch_route_async(self, coordinates: List[tuple]) -> Dict:
+        return await self.router.route_async(coordinates)
@@ -0,0 +1,131 @@
+"""Per-sheet duty-status totals (the DutySummary table) and fleet-wide HOS aggregation.
+
+Each LogSheet has one DutySummary row with the minutes it spends in each duty
+status, written alongside the sheet: LogGenerator inserts both in bulk, and
+the LogSheet signals in api/signals.py refresh the row when a sheet is saved
+on its own. Aggregates over dates, trips or months are then a SUM over narrow
+indexed rows in the database instead of reading every sheet's JSON grid.
+Sheets changed with QuerySet.update() or written before the table existed
+are brought in line by `manage.py backfill_duty_summaries`.
+"""
+
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional
+from django.conf import settings
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from ..models import DutySummary, LogSheet
+from .status_grid import from_hourly_grid, is_hourly_grid, is_interval_grid
+
+# Duty status -> DutySummary column
+STATUS_FIELDS = {
+    'OFF': 'off_duty_minutes',
+    'SB': 'sleeper_berth_minutes',
+    'D': 'driving_minutes',
+    'ON': 'on_duty_minutes',
+}
+
+# ?group_by= value -> the expression rows are grouped on
+GROUPINGS = {
+    'date': F('date'),
+    'week': TruncWeek('date'),
+    'month': TruncMonth('date'),
+    'trip': F('trip_id'),
+    'total': None,
+}
+
+
+def status_minutes(status_grid) -> Dict[str, int]:
+    """Minutes in each DutySummary column for a grid in either encoding (all zero for anything else)"""
+    if is_hourly_grid(status_grid):
+        status_grid = from_hourly_grid(status_grid)
+    minutes = dict.fromkeys(STATUS_FIELDS.values(), 0)
+    # The API validates grids, but rows written through the ORM or before validation may hold anything
+    if is_interval_grid(status_grid):
+        for start, end, status in status_grid:
+            minutes[STATUS_FIELDS[status]] += end - start
+    return minutes
+
+
+def summary_for(sheet: LogSheet) -> DutySummary:
+    return DutySummary(log_sheet_id=sheet.pk, trip_id=sheet.trip_id, date=sheet.date,
+                       **status_minutes(sheet.status_grid))
+
+
+def save_summaries(sheets: Iterable[LogSheet]) -> List[DutySummary]:
+    """Insert the summaries of newly created sheets with one query"""
+    return DutySummary.objects.bulk_create([summary_for(sheet) for sheet in sheets])
+
+
+def refresh_summary(sheet: LogSheet) -> None:
+    """Write the summary of one sheet that was saved on its own"""
+    summary = summary_for(sheet)
+    DutySummary.objects.update_or_create(
+        log_sheet_id=sheet.pk,
+        defaults={field.attname: getattr(summary, field.attname)
+                  for field in DutySummary._meta.concrete_fields if not field.primary_key},
+    )
+
+
+def _sheet_batches(queryset, batch_size: int) -> Iterator[list]:
+    """LogSheets in id order, keyset-paginated like the log sheet export"""
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id')
+                     .only('id', 'trip_id', 'date', 'status_grid')[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].pk
+
+
+def backfill(batch_size: Optional[int] = None, rebuild: bool = False,
+             trip_ids: Optional[Iterable[int]] = None) -> int:
+    """Write summaries for sheets that have none, or recompute every one with `rebuild`; returns the count"""
+    batch_size = batch_size or getattr(settings, 'DUTY_SUMMARY_BATCH_SIZE', 2000)
+    queryset = LogSheet.objects.all()
+    if trip_ids:
+        queryset = queryset.filter(trip_id__in=list(trip_ids))
+    if not rebuild:
+        queryset = queryset.filter(summary__isnull=True)
+    written = 0
+    for batch in _sheet_batches(queryset, batch_size):
+        DutySummary.objects.bulk_create(
+            [summary_for(sheet) for sheet in batch],
+            update_conflicts=True,
+            unique_fields=['log_sheet'],
+            update_fields=['trip', 'date', *STATUS_FIELDS.values()],
+        )
+        written += len(batch)
+    return written
+
+
+def aggregate(group_by: str = 'date', date_from: Optional[date] = None, date_to: Optional[date] = None,
+              trip_ids: Optional[Iterable[int]] = None) -> List[Dict]:
+    """Hours in each duty status summed in the database, one row per group in group order"""
+    if group_by not in GROUPINGS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+    queryset = DutySummary.objects.all()
+    if trip_ids:
+        queryset = queryset.filter(trip_id__in=list(trip_ids))
+    if date_from is not None:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(date__lte=date_to)
+
+    totals = {field: Sum(field) for field in STATUS_FIELDS.values()}
+    totals['sheets'] = Count('log_sheet')
+    grouping = GROUPINGS[group_by]
+    if grouping is None:
+        rows = [queryset.aggregate(**totals)]
+    else:
+        rows = queryset.values(group=grouping).annotate(**totals).order_by('group')
+
+    results = []
+    for row in rows:
+        result = {group_by: row['group']} if grouping is not None else {}
+        for field in STATUS_FIELDS.values():
+            result[field.replace('_minutes', '_hours')] = round((row[field] or 0) / 60, 2)
+        result['sheets'] = row['sheets']
+        results.append(result)
+    return results
@@ -0,0 +1,160 @@
+"""Memory-mapped place-name index for offline geocoding.
+
+File layout (little-endian, every section aligned to 8 bytes):
+
+    header      magic b'ELDGAZET', version, entry count, key bytes (uint32 each)
+    offsets     uint32[entries + 1]   start of each key in the key blob
+    lat, lon    float64[entries]
+    population  uint32[entries]
+    keys        normalized place names (UTF-8), sorted bytewise
+
+Each place is stored under several keys ("boston ma", "boston massachusetts",
+"boston"); when places share a key only the most populous is kept.
+"""
+
+import array
+import mmap
+import re
+import struct
+import sys
+import unicodedata
+from typing import Dict, Iterable, Optional, Tuple
+
+MAGIC = b'ELDGAZET'
+VERSION = 1
+HEADER = struct.Struct('<8sIII')
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_SCAN = 256  # entries examined to find the most populous prefix match
+
+US_STATES = {
+    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas', 'CA': 'California',
+    'CO': 'Colorado', 'CT': 'Connecticut', 'DE': 'Delaware', 'DC': 'District of Columbia',
+    'FL': 'Florida', 'GA': 'Georgia', 'HI': 'Hawaii', 'ID': 'Idaho', 'IL': 'Illinois',
+    'IN': 'Indiana', 'IA': 'Iowa', 'KS': 'Kansas', 'KY': 'Kentucky', 'LA': 'Louisiana',
+    'ME': 'Maine', 'MD': 'Maryland', 'MA': 'Massachusetts', 'MI': 'Michigan', 'MN': 'Minnesota',
+    'MS': 'Mississippi', 'MO': 'Missouri', 'MT': 'Montana', 'NE': 'Nebraska', 'NV': 'Nevada',
+    'NH': 'New Hampshire', 'NJ': 'New Jersey', 'NM': 'New Mexico', 'NY': 'New York',
+    'NC': 'North Carolina', 'ND': 'North Dakota', 'OH': 'Ohio', 'OK': 'Oklahoma', 'OR': 'Oregon',
+    'PA': 'Pennsylvania', 'RI': 'Rhode Island', 'SC': 'South Carolina', 'SD': 'South Dakota',
+    'TN': 'Tennessee', 'TX': 'Texas', 'UT': 'Utah', 'VT': 'Vermont', 'VA': 'Virginia',
+    'WA': 'Washington', 'WV': 'West Virginia', 'WI': 'Wisconsin', 'WY': 'Wyoming',
+    'PR': 'Puerto Rico',
+}
+
+_COUNTRY_SUFFIXES = ('united states of america', 'united states', 'usa', 'us')
+
+
+def normalize_place(text: str) -> str:
+    """Lowercase, strip accents and punctuation, and drop a trailing ZIP code or country"""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    text = ' '.join(re.sub(r'[^a-z0-9]+', ' ', text).split())
+    for suffix in _COUNTRY_SUFFIXES:
+        if text.endswith(' ' + suffix):
+            text = text[:-len(suffix) - 1]
+            break
+    return re.sub(r' \d{5}(?: \d{4})?$', '', text)
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def build_gazetteer(places: Iterable[Tuple[str, str, float, float, int]], path: str) -> Dict[str, int]:
+    """Write an index from (name, state code, lat, lon, population) places"""
+    entries = {}
+    place_count = 0
+    for name, state, lat, lon, population in places:
+        place_count += 1
+        keys = {normalize_place(name)}
+        if state:
+            keys.add(normalize_place(f"{name} {state}"))
+            if state.upper() in US_STATES:
+                keys.add(normalize_place(f"{name} {US_STATES[state.upper()]}"))
+        for key in keys:
+            if key and (key not in entries or population > entries[key][2]):
+                entries[key] = (lat, lon, population)
+
+    keys = sorted(key.encode('utf-8') for key in entries)
+    offsets = array.array('I', [0])
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+    values = [entries[key.decode('utf-8')] for key in keys]
+    sections = [
+        offsets,
+        array.array('d', (value[0] for value in values)),
+        array.array('d', (value[1] for value in values)),
+        array.array('I', (min(value[2], 2 ** 32 - 1) for value in values)),
+    ]
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(keys), offsets[-1]))
+        for section in sections:
+            f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+            if sys.byteorder != 'little':
+                section = array.array(section.typecode, section)
+                section.byteswap()
+            section.tofile(f)
+        f.write(b''.join(keys))
+    return {'places': place_count, 'keys': len(keys)}
+
+
+class Gazetteer:
+    """Read-only view of an index file answering exact and prefix place-name lookups"""
+
+    def __init__(self, path: str):
+        if sys.byteorder != 'little':
+            raise ValueError("Gazetteer files can only be memory-mapped on little-endian hosts")
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, key_bytes = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} gazetteer file")
+
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+        sections = []
+        for typecode, length in (('I', self.count + 1), ('d', self.count), ('d', self.count), ('I', self.count)):
+            offset = _aligned(offset)
+            size = length * struct.calcsize(typecode)
+            sections.append(view[offset:offset + size].cast(typecode))
+            offset += size
+        self.offsets, self.lat, self.lon, self.population = sections
+        self.keys = view[offset:offset + key_bytes]
+
+    def lookup(self, query: str) -> Optional[Tuple[float, float]]:
+        """(lat, lon) for an exact key match, else the most populous place the query is a prefix of"""
+        key = normalize_place(query).encode('utf-8')
+        if not key:
+            return None
+        position = self._bisect(key)
+        if position < self.count and self._key(position) == key:
+            return self.lat[position], self.lon[position]
+        if len(key) < MIN_PREFIX_LENGTH:
+            return None
+
+        best = None
+        for candidate in range(position, min(position + MAX_PREFIX_SCAN, self.count)):
+            if not self._key(candidate).startswith(key):
+                break
+            if best is None or self.population[candidate] > self.population[best]:
+                best = candidate
+        if best is None:
+            return None
+        return self.lat[best], self.lon[best]
+
+    def _key(self, position: int) -> bytes:
+        return bytes(self.keys[self.offsets[position]:self.offsets[position + 1]])
+
+    def _bisect(self, key: bytes) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def close(self) -> None:
+        for section in (self.offsets, self.lat, self.lon, self.population, self.keys):
+            section.release()
+        self._mmap.close()
@@ -0,0 +1,118 @@
+import logging
+import threading
+from datetime import timedelta
+from typing import Dict, Iterable, Optional
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from ..models import GeocodeCache as GeocodeCacheEntry
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class GeocodeCache:
+    """Two-tier geocode cache: an in-process LRU in front of the GeocodeCache table.
+
+    Keys are normalized location strings. A value of None records that the
+    location does not exist (negative caching).
+    """
+
+    def __init__(self):
+        self.TTL = getattr(settings, 'GEOCODE_CACHE_TTL', 30 * 24 * 3600)
+        self.NEGATIVE_TTL = getattr(settings, 'GEOCODE_NEGATIVE_CACHE_TTL', 24 * 3600)
+        self.memory = LRUCache(
+            max_size=getattr(settings, 'GEOCODE_CACHE_SIZE', 1024),
+            ttl=getattr(settings, 'GEOCODE_CACHE_MEMORY_TTL', 3600),
+        )
+        self.db_hits = 0
+        self.db_misses = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Optional[tuple]]:
+        """Return cached coordinates (or None for known-missing locations) for the given keys"""
+        found = {}
+        pending = []
+        for key in keys:
+            value = self.memory.get(key, _MISSING)
+            if value is _MISSING:
+                pending.append(key)
+            else:
+                found[key] = value
+
+        if pending:
+            from_db = self._get_from_db(pending)
+            for key, value in from_db.items():
+                self.memory.set(key, value, ttl=self._memory_ttl(value))
+            found.update(from_db)
+            with self._lock:
+                self.db_hits += len(from_db)
+                self.db_misses += len(pending) - len(from_db)
+
+        return found
+
+    def set_many(self, values: Dict[str, Optional[tuple]]) -> None:
+        """Store resolved coordinates, or None for locations that do not exist"""
+        if not values:
+            return
+        for key, value in values.items():
+            self.memory.set(key, value, ttl=self._memory_ttl(value))
+
+        entries = [
+            GeocodeCacheEntry(
+                query=key,
+                latitude=value[0] if value else None,
+                longitude=value[1] if value else None,
+            )
+            for key, value in values.items()
+        ]
+        try:
+            GeocodeCacheEntry.objects.bulk_create(
+                entries,
+                update_conflicts=True,
+                unique_fields=['query'],
+                update_fields=['latitude', 'longitude', 'updated_at'],
+            )
+        except DatabaseError:
+            logger.warning("Could not persist geocode cache entries", exc_info=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'memory_hits': self.memory.hits,
+            'memory_misses': self.memory.misses,
+            'memory_size': len(self.memory),
+            'db_hits': self.db_hits,
+            'db_misses': self.db_misses,
+        }
+
+    def clear(self) -> None:
+        self.memory.clear()
+        with self._lock:
+            self.db_hits = 0
+            self.db_misses = 0
+
+    def _memory_ttl(self, value: Optional[tuple]) -> float:
+        return self.memory.ttl if value else min(self.memory.ttl, self.NEGATIVE_TTL)
+
+    def _get_from_db(self, keys: list) -> Dict[str, Optional[tuple]]:
+        now = timezone.now()
+        try:
+            rows = GeocodeCacheEntry.objects.filter(
+                query__in=keys,
+                updated_at__gte=now - timedelta(seconds=max(self.TTL, self.NEGATIVE_TTL)),
+            ).values_list('query', 'latitude', 'longitude', 'updated_at')
+            rows = list(rows)
+        except DatabaseError:
+            logger.warning("Could not read geocode cache entries", exc_info=True)
+            return {}
+
+        found = {}
+        for query, latitude, longitude, updated_at in rows:
+            value = (latitude, longitude) if latitude is not None else None
+            ttl = self.TTL if value else self.NEGATIVE_TTL
+            if updated_at >= now - timedelta(seconds=ttl):
+                found[query] = value
+        return found
+
+geocode_cache = GeocodeCache()
@@ -0,0 +1,131 @@
+import threading
+from typing import List, Optional
+from django.conf import settings
+from .throttle import TokenBucket
+from .upstream import upstream, async_upstream
+
+class LocationNotFound(ValueError):
+    """Raised when the geocoder has no result for a location"""
+
+
+class GeocoderBusy(ValueError):
+    """Raised when a lookup was turned away by the rate limit or ran out of time; the location may well exist"""
+
+    def __init__(self, message: str = "Geocoding is busy, try again later"):
+        super().__init__(message)
+
+
+class Geocoder:
+    """Turns a location string into (lat, lon).
+
+    Raises LocationNotFound when the geocoder has no result, or ValueError
+    when the lookup itself failed.
+    """
+
+    # Local geocoders answer in-process: they are asked before the geocode cache and never cached
+    local = False
+
+    def geocode(self, location: str) -> tuple:
+        raise NotImplementedError
+
+    async def geocode_async(self, location: str) -> tuple:
+        """Geocoders without I/O answer directly on the event loop"""
+        return self.geocode(location)
+
+
+class NominatimGeocoder(Geocoder):
+    """Geocodes with a Nominatim HTTP server"""
+
+    def __init__(self, url: str = "https://nominatim.openstreetmap.org/search", limiter: Optional[TokenBucket] = None):
+        self.url = url
+        self.headers = {'User-Agent': 'ELD Backend/1.0'}
+        # Shared by the sync and async paths so the whole process stays within the usage policy
+        self.limiter = limiter
+
+    def geocode(self, location: str) -> tuple:
+        return self.parse_response(upstream.get(self.url, params=self.params(location), headers=self.headers,
+                                                limiter=self.limiter))
+
+    async def geocode_async(self, location: str) -> tuple:
+        return self.parse_response(await async_upstream.get(self.url, params=self.params(location),
+                                                            headers=self.headers, limiter=self.limiter))
+
+    def params(self, location: str) -> dict:
+        return {'q': location, 'format': 'json'}
+
+    def parse_response(self, response) -> tuple:
+        response.raise_for_status()
+
+        data = response.json()
+        if not data:
+            raise LocationNotFound("Location does not exist")
+
+        # Get the first result
+        result = data[0]
+        lat = float(result['lat'])
+        lon = float(result['lon'])
+
+        return lat, lon
+
+
+class GazetteerGeocoder(Geocoder):
+    """Geocodes from a memory-mapped place index built by `manage.py build_gazetteer`"""
+
+    local = True
+
+    def __init__(self, path: str):
+        if not path:
+            raise ValueError("GAZETTEER_PATH must be set to use the gazetteer geocoder")
+        self.path = path
+        self._gazetteer = None
+        self._lock = threading.Lock()
+
+    @property
+    def gazetteer(self):
+        # Map the file on first use so importing this module never touches the disk
+        if self._gazetteer is None:
+            with self._lock:
+                if self._gazetteer is None:
+                    from .gazetteer import Gazetteer
+                    self._gazetteer = Gazetteer(self.path)
+        return self._gazetteer
+
+    def geocode(self, location: str) -> tuple:
+        coordinates = self.gazetteer.lookup(location)
+        if coordinates is None:
+            raise LocationNotFound("Location does not exist")
+        return coordinates
+
+
+GEOCODERS = {
+    'nominatim': NominatimGeocoder,
+    'gazetteer': GazetteerGeocoder,
+}
+
+def get_geocoders() -> List[Geocoder]:
+    """The geocoders named in the GEOCODERS setting, in the order they are tried"""
+    geocoders = []
+    for name in getattr(settings, 'GEOCODERS', ['nominatim']):
+        try:
+            geocoder_class = GEOCODERS[name]
+        except KeyError:
+            raise ValueError(f"Unknown geocoder: {name}")
+        options = {}
+        if name == 'gazetteer':
+            options['path'] = getattr(settings, 'GAZETTEER_PATH', None)
+        else:
+            if getattr(settings, 'NOMINATIM_URL', None):
+                options['url'] = settings.NOMINATIM_URL
+            rate = getattr(settings, 'NOMINATIM_RATE_LIMIT', 1.0)
+            if rate > 0:
+                options['limiter'] = TokenBucket(
+                    rate,
+                    burst=getattr(settings, 'NOMINATIM_BURST', 1),
+                    max_waiters=getattr(settings, 'NOMINATIM_MAX_WAITERS', 32),
+                    max_wait=getattr(settings, 'NOMINATIM_MAX_WAIT', 10),
+                    name='nominatim',
+                )
+        geocoders.append(geocoder_class(**options))
+    return geocoders
+
+geocoders = get_geocoders()
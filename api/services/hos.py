@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+class HOSSimulator:
+    """Builds a trip's duty-status timeline under the property-carrying HOS rules.
+
+    The simulation advances one segment at a time: drive until the next limit
+    (11-hour driving, 14-hour window, 8 hours before a 30-minute break, or the
+    70-hour/8-day cycle), then take the rest that limit requires. Work is
+    proportional to the number of segments, not to the trip's length in hours.
+
+    Each segment is a dict with 'status' (OFF, SB, D or ON), 'kind'
+    (driving, pickup, dropoff, break, rest or restart), and 'start'/'end' datetimes.
+    """
+
+    def __init__(self):
+        self.STATUS_OFF_DUTY = 'OFF'
+        self.STATUS_SLEEPER = 'SB'
+        self.STATUS_DRIVING = 'D'
+        self.STATUS_ON_DUTY = 'ON'
+        self.MAX_DRIVING_MINUTES = 11 * 60
+        self.MAX_ON_DUTY_WINDOW_MINUTES = 14 * 60
+        self.BREAK_AFTER_DRIVING_MINUTES = 8 * 60
+        self.BREAK_MINUTES = 30
+        self.REQUIRED_REST_MINUTES = 10 * 60
+        self.MAX_CYCLE_MINUTES = 70 * 60
+        self.RESTART_MINUTES = 34 * 60
+        self.PICKUP_MINUTES = 60
+        self.DROPOFF_MINUTES = 60
+
+    def simulate(self, legs: List[Tuple[float, str]], cycle_hours_used: float = 0,
+                 start: Optional[datetime] = None) -> List[Dict]:
+        """Simulate a trip given as (driving_hours, stop_kind) legs.
+
+        Each leg is driven and then followed by on-duty time at its stop
+        ('pickup' or 'dropoff'), e.g. [(2.5, 'pickup'), (30.0, 'dropoff')].
+        """
+        self.time = (start or datetime.now()).replace(second=0, microsecond=0)
+        self.segments = []
+        self.driving_in_shift = 0
+        self.shift_start = None
+        self.driving_since_break = 0
+        self.cycle_used = round(cycle_hours_used * 60)
+
+        if self.cycle_used >= self.MAX_CYCLE_MINUTES:
+            self._rest(self.RESTART_MINUTES, 'restart')
+
+        for hours, stop_kind in legs:
+            self._drive(round(hours * 60))
+            self._on_duty(self.PICKUP_MINUTES if stop_kind == 'pickup' else self.DROPOFF_MINUTES, stop_kind)
+        return self.segments
+
+    def _drive(self, minutes: int) -> None:
+        remaining = minutes
+        while remaining > 0:
+            if self.shift_start is None:
+                self.shift_start = self.time
+            window_used = int((self.time - self.shift_start).total_seconds() // 60)
+            limits = {
+                'rest': min(self.MAX_DRIVING_MINUTES - self.driving_in_shift,
+                            self.MAX_ON_DUTY_WINDOW_MINUTES - window_used),
+                'break': self.BREAK_AFTER_DRIVING_MINUTES - self.driving_since_break,
+                'restart': self.MAX_CYCLE_MINUTES - self.cycle_used,
+            }
+            available = min(limits.values())
+            if available <= 0:
+                # Take the longest rest any exhausted limit requires; it also satisfies the shorter ones
+                if limits['restart'] <= 0:
+                    self._rest(self.RESTART_MINUTES, 'restart')
+                elif limits['rest'] <= 0:
+                    self._rest(self.REQUIRED_REST_MINUTES, 'rest')
+                else:
+                    self._rest(self.BREAK_MINUTES, 'break')
+                continue
+
+            driven = min(remaining, available)
+            self._append(self.STATUS_DRIVING, 'driving', driven)
+            self.driving_in_shift += driven
+            self.driving_since_break += driven
+            self.cycle_used += driven
+            remaining -= driven
+
+    def _on_duty(self, minutes: int, kind: str) -> None:
+        if self.cycle_used + minutes > self.MAX_CYCLE_MINUTES:
+            self._rest(self.RESTART_MINUTES, 'restart')
+        if self.shift_start is None:
+            self.shift_start = self.time
+        self._append(self.STATUS_ON_DUTY, kind, minutes)
+        self.cycle_used += minutes
+        # Any 30 consecutive minutes not driving count as the required break
+        if minutes >= self.BREAK_MINUTES:
+            self.driving_since_break = 0
+
+    def _rest(self, minutes: int, kind: str) -> None:
+        status = self.STATUS_SLEEPER if kind == 'rest' else self.STATUS_OFF_DUTY
+        self._append(status, kind, minutes)
+        self.driving_since_break = 0
+        if minutes >= self.REQUIRED_REST_MINUTES:
+            self.driving_in_shift = 0
+            self.shift_start = None
+        if minutes >= self.RESTART_MINUTES:
+            self.cycle_used = 0
+
+    def _append(self, status: str, kind: str, minutes: int) -> None:
+        end = self.time + timedelta(minutes=minutes)
+        self.segments.append({'status': status, 'kind': kind, 'start': self.time, 'end': end})
+        self.time = end
+
+def required_stops(segments: List[Dict]) -> List[Dict]:
+    """Every non-driving segment of a timeline, in the planner's stop format"""
+    return [
+        {
+            'type': segment['kind'],
+            'duration': (segment['end'] - segment['start']).total_seconds() / 3600,
+            'time': segment['start'].strftime('%Y-%m-%d %H:%M:%S')
+        }
+        for segment in segments if segment['kind'] != 'driving'
+    ]
+
+def serialize_timeline(segments: List[Dict]) -> List[Dict]:
+    """JSON-friendly copy of a timeline with ISO 8601 times"""
+    return [{**segment, 'start': segment['start'].isoformat(), 'end': segment['end'].isoformat()}
+            for segment in segments]
+
+def parse_timeline(segments: List[Dict]) -> List[Dict]:
+    """Inverse of serialize_timeline"""
+    return [{**segment, 'start': datetime.fromisoformat(segment['start']),
+             'end': datetime.fromisoformat(segment['end'])}
+            for segment in segments]
@@ -0,0 +1,107 @@
+import hashlib
+import json
+from datetime import timedelta
+from typing import Optional, Tuple
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from ..models import IdempotencyRecord
+
+# A request that has not finished after this many seconds is assumed to have died
+IN_PROGRESS_TIMEOUT = 120
+
+
+class IdempotencyConflict(Exception):
+    """Raised when a repeated request cannot be answered from its record"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def request_fingerprint(path: str, data) -> str:
+    """Hash of the endpoint and payload; key order and insignificant whitespace do not matter"""
+    canonical = json.dumps({'path': path, 'data': data}, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def begin(idempotency_key: Optional[str], fingerprint: str) -> Tuple[Optional[IdempotencyRecord], bool]:
+    """Claim a request before doing its work.
+
+    Returns (record, True) when this request should do the work and then call
+    finish(), (record, False) when a finished response can be replayed, and
+    (None, False) when idempotency is off for this request. Raises
+    IdempotencyConflict when the same request is still in progress or an
+    Idempotency-Key is reused with a different payload.
+    """
+    if idempotency_key:
+        if len(idempotency_key) > 255:
+            raise IdempotencyConflict("Idempotency-Key must be at most 255 characters", 400)
+        key = f"key:{idempotency_key}"
+        window = getattr(settings, 'IDEMPOTENCY_KEY_WINDOW', 24 * 3600)
+    else:
+        key = f"fingerprint:{fingerprint}"
+        window = getattr(settings, 'IDEMPOTENCY_FINGERPRINT_WINDOW', 300)
+    if window <= 0:
+        return None, False
+
+    # First sight of a request is the common case: one insert, no lookup
+    record = _claim(key, fingerprint)
+    if record is not None:
+        return record, True
+
+    now = timezone.now()
+    record = IdempotencyRecord.objects.filter(key=key).first()
+    if record is None:
+        # Finished with an error and deleted in the meantime
+        return _claim_or_conflict(key, fingerprint), True
+    expired = record.created_at < now - timedelta(seconds=window)
+    if record.fingerprint != fingerprint and not expired:
+        raise IdempotencyConflict("Idempotency-Key was already used with a different payload", 422)
+    abandoned = record.response is None and record.created_at < now - timedelta(seconds=IN_PROGRESS_TIMEOUT)
+    if not expired and not abandoned:
+        if record.response is None:
+            raise IdempotencyConflict("An identical request is already in progress", 409)
+        return record, False
+    IdempotencyRecord.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+    return _claim_or_conflict(key, fingerprint), True
+
+
+def _claim(key: str, fingerprint: str) -> Optional[IdempotencyRecord]:
+    try:
+        with transaction.atomic():
+            return IdempotencyRecord.objects.create(key=key, fingerprint=fingerprint)
+    except IntegrityError:
+        return None
+
+
+def _claim_or_conflict(key: str, fingerprint: str) -> IdempotencyRecord:
+    record = _claim(key, fingerprint)
+    if record is None:
+        # A concurrent identical request claimed the key first
+        raise IdempotencyConflict("An identical request is already in progress", 409)
+    return record
+
+
+def finish(record: Optional[IdempotencyRecord], status_code: int, body) -> None:
+    """Store a successful response for replay; forget failed ones so the request can be retried"""
+    if record is None:
+        return
+    if 200 <= status_code < 300:
+        record.status_code = status_code
+        record.response = body
+        record.save(update_fields=['status_code', 'response'])
+    else:
+        record.delete()
+
+
+def purge_expired() -> int:
+    """Delete records older than their replay window; returns how many were removed"""
+    now = timezone.now()
+    expired = Q()
+    for prefix, setting, default in (('key:', 'IDEMPOTENCY_KEY_WINDOW', 24 * 3600),
+                                     ('fingerprint:', 'IDEMPOTENCY_FINGERPRINT_WINDOW', 300)):
+        window = max(getattr(settings, setting, default), IN_PROGRESS_TIMEOUT)
+        expired |= Q(key__startswith=prefix, created_at__lt=now - timedelta(seconds=window))
+    return IdempotencyRecord.objects.filter(expired).delete()[0]
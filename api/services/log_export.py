@@ -0,0 +1,96 @@
+"""Streaming CSV / NDJSON export of log sheets for audits.
+
+Rows are read in keyset-paginated chunks (id > last id seen, ordered by id), so
+memory use is bounded by the chunk size however many sheets match, and the
+queries work the same with or without server-side cursors. Under ASGI the
+async variant streams the same lines without collecting them first.
+"""
+
+import csv
+import io
+import json
+from datetime import date
+from typing import AsyncIterator, Iterable, Iterator, Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from ..models import LogSheet
+
+COLUMNS = ['id', 'trip', 'date', 'start_time', 'end_time', 'status_grid']
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_queryset(trip_ids: Optional[Iterable[int]] = None, date_from: Optional[date] = None,
+                    date_to: Optional[date] = None):
+    queryset = LogSheet.objects.all()
+    if trip_ids:
+        queryset = queryset.filter(trip_id__in=list(trip_ids))
+    if date_from is not None:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(date__lte=date_to)
+    return queryset
+
+
+def iter_chunks(queryset, chunk_size: Optional[int] = None) -> Iterator[list]:
+    """Lists of (id, trip_id, date, start_time, end_time, status_grid) tuples in id order"""
+    chunk_size = chunk_size or getattr(settings, 'LOG_EXPORT_CHUNK_SIZE', 2000)
+    rows = queryset.order_by('id').values_list('id', 'trip_id', 'date', 'start_time', 'end_time', 'status_grid')
+    last_id = 0
+    while True:
+        chunk = list(rows.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+def _csv_lines(chunks: Iterator[list]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            (sheet_id, trip_id, day.isoformat(), start.isoformat(), end.isoformat(),
+             json.dumps(grid, separators=(',', ':')))
+            for sheet_id, trip_id, day, start, end, grid in chunk
+        )
+        yield buffer.getvalue()
+
+
+def _ndjson_lines(chunks: Iterator[list]) -> Iterator[str]:
+    for chunk in chunks:
+        yield ''.join(
+            json.dumps(dict(zip(COLUMNS, (sheet_id, trip_id, day.isoformat(), start.isoformat(),
+                                          end.isoformat(), grid))), separators=(',', ':')) + '\n'
+            for sheet_id, trip_id, day, start, end, grid in chunk
+        )
+
+
+def export_log_sheets(queryset, file_format: str, chunk_size: Optional[int] = None) -> Iterator[str]:
+    """Yield the export one chunk of rows at a time; file_format is 'csv' or 'ndjson'"""
+    if file_format not in CONTENT_TYPES:
+        raise ValueError(f"file_format must be one of {', '.join(CONTENT_TYPES)}")
+    chunks = iter_chunks(queryset, chunk_size)
+    return _csv_lines(chunks) if file_format == 'csv' else _ndjson_lines(chunks)
+
+
+async def aexport_log_sheets(queryset, file_format: str, chunk_size: Optional[int] = None) -> AsyncIterator[str]:
+    """export_log_sheets for ASGI responses, which collect sync iterators in full before sending them.
+
+    Each chunk is read in a worker thread and sent before the next one is read.
+    """
+    lines = export_log_sheets(queryset, file_format, chunk_size)
+    read = sync_to_async(next)
+    while True:
+        line = await read(lines, None)
+        if line is None:
+            return
+        yield line
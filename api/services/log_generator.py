@@ -1,6 +1,10 @@
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 from typing import Dict, List
 from ..models import Trip, LogSheet
+from .duty_summary import save_summaries
+from .hos import HOSSimulator, parse_timeline
+from .status_grid import merge_intervals, MINUTES_PER_DAY
+from .timing import span
 
 class LogGenerator:
     def __init__(self):
@@ -10,38 +14,58 @@ class LogGenerator:
         self.STATUS_ON_DUTY = 'ON'
 
     def generate_logs(self, trip: Trip, route_data: Dict) -> List[LogSheet]:
-        log_sheets = []
-        current_time = datetime.now()
-        remaining_duration = route_data['total_duration']
-        
-        while remaining_duration > 0:
-            # Create daily log sheet
-            status_grid = self._initialize_status_grid()
-            start_time = current_time.replace(hour=0, minute=0, second=0)
-            
-            # Fill status grid based on driving and rest periods
-            hours_in_day = min(24, remaining_duration)
-            current_hour = current_time.hour
-            
-            while current_hour < 24 and hours_in_day > 0:
-                if hours_in_day >= 1:
-                    status_grid[current_hour] = self.STATUS_DRIVING
-                    hours_in_day -= 1
-                current_hour += 1
-            
-            log_sheet = LogSheet.objects.create(
+        """Build the trip's daily log sheets and save them, and their duty summaries, with one bulk insert each"""
+        with span('log_sheets'):
+            log_sheets = LogSheet.objects.bulk_create(self.build_logs(trip, route_data))
+            save_summaries(log_sheets)
+            return log_sheets
+
+    def build_logs(self, trip: Trip, route_data: Dict) -> List[LogSheet]:
+        """Build unsaved daily log sheets for a trip from its duty-status timeline"""
+        if 'duty_timeline' in route_data:
+            timeline = parse_timeline(route_data['duty_timeline'])
+        else:
+            timeline = HOSSimulator().simulate([(0, 'pickup'), (route_data['total_duration'], 'dropoff')],
+                                               trip.current_cycle_hours)
+
+        return [
+            LogSheet(
                 trip=trip,
-                date=current_time.date(),
-                start_time=start_time.time(),
-                end_time=(start_time + timedelta(hours=24)).time(),
+                date=day,
+                start_time=time(0, 0),
+                end_time=time(0, 0),  # Sheets cover the full 24 hours from midnight
                 status_grid=status_grid
             )
-            log_sheets.append(log_sheet)
-            
-            remaining_duration -= 24
-            current_time += timedelta(days=1)
-        
-        return log_sheets
+            for day, status_grid in self.daily_status_grids(timeline)
+        ]
+
+    def daily_status_grids(self, timeline: List[Dict]) -> List[tuple]:
+        """Split a timeline at midnight into (date, intervals) pairs, one per calendar day.
+
+        Time not covered by the timeline (before the trip starts and after it ends) is off duty.
+        """
+        pieces = {}
+        for segment in timeline:
+            cursor = segment['start']
+            while cursor < segment['end']:
+                midnight = datetime.combine(cursor.date(), time(0, 0))
+                piece_end = min(segment['end'], midnight + timedelta(days=1))
+                start_minute = int((cursor - midnight).total_seconds() // 60)
+                end_minute = int((piece_end - midnight).total_seconds() // 60)
+                pieces.setdefault(cursor.date(), []).append([start_minute, end_minute, segment['status']])
+                cursor = piece_end
 
-    def _initialize_status_grid(self) -> Dict[int, str]:
-        return {hour: self.STATUS_OFF_DUTY for hour in range(24)} 
\ No newline at end of file
+        grids = []
+        day = timeline[0]['start'].date()
+        last_day = (timeline[-1]['end'] - timedelta(minutes=1)).date()
+        while day <= last_day:
+            intervals = []
+            position = 0
+            for start, end, status in pieces.get(day, []):
+                intervals.append([position, start, self.STATUS_OFF_DUTY])
+                intervals.append([start, end, status])
+                position = end
+            intervals.append([position, MINUTES_PER_DAY, self.STATUS_OFF_DUTY])
+            grids.append((day, merge_intervals(intervals)))
+            day += timedelta(days=1)
+        return grids
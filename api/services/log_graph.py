@@ -0,0 +1,253 @@
+"""SVG and PDF rendering of the FMCSA-style daily log graph for a LogSheet.
+
+The grid, hour ruler and row labels are the same on every sheet, so they are
+drawn once into a base layer: an SVG <g> referenced with <use>, and a PDF form
+XObject drawn with Do. A sheet only adds its overlay (title, duty-status line
+and row totals), which is cached per sheet and per format. Cached overlays
+are dropped by the LogSheet signals in api/signals.py and are also checked
+against the sheet's current contents, so another process's edits are never
+served stale.
+"""
+
+import functools
+from typing import Iterable, List, Tuple
+from django.conf import settings
+from .cache import LRUCache
+from .status_grid import from_hourly_grid, is_hourly_grid, is_interval_grid
+
+WIDTH = 840
+HEIGHT = 210
+GRID_LEFT = 140
+HOUR_WIDTH = 26
+GRID_RIGHT = GRID_LEFT + 24 * HOUR_WIDTH
+GRID_TOP = 50
+ROW_HEIGHT = 30
+TOTALS_X = (GRID_RIGHT + WIDTH) / 2
+
+ROWS = [('OFF', '1. Off Duty'), ('SB', '2. Sleeper Berth'), ('D', '3. Driving'), ('ON', '4. On Duty (not driving)')]
+ROW_INDEX = {status: index for index, (status, _) in enumerate(ROWS)}
+GRID_BOTTOM = GRID_TOP + len(ROWS) * ROW_HEIGHT
+
+CONTENT_TYPES = {
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf',
+}
+
+# Drawing primitives shared by both formats: lines are lists of (x, y) points in
+# SVG coordinates (y down); texts are (x, y, text, size, anchor)
+Line = List[Tuple[float, float]]
+Text = Tuple[float, float, str, int, str]
+
+
+def _x(minute: float) -> float:
+    return GRID_LEFT + minute * HOUR_WIDTH / 60
+
+
+def _row_y(status: str) -> float:
+    return GRID_TOP + (ROW_INDEX[status] + 0.5) * ROW_HEIGHT
+
+
+@functools.lru_cache(maxsize=None)
+def _base_primitives() -> Tuple[Tuple[Line, ...], Tuple[Text, ...]]:
+    lines = [[(GRID_LEFT, GRID_TOP), (GRID_RIGHT, GRID_TOP), (GRID_RIGHT, GRID_BOTTOM),
+              (GRID_LEFT, GRID_BOTTOM), (GRID_LEFT, GRID_TOP)]]
+    for row in range(1, len(ROWS)):
+        y = GRID_TOP + row * ROW_HEIGHT
+        lines.append([(GRID_LEFT, y), (GRID_RIGHT, y)])
+    for hour in range(1, 24):
+        lines.append([(_x(hour * 60), GRID_TOP), (_x(hour * 60), GRID_BOTTOM)])
+    # Quarter-hour ticks hang from the top of each row, the half hour longer than the quarters
+    for row in range(len(ROWS)):
+        top = GRID_TOP + row * ROW_HEIGHT
+        for hour in range(24):
+            for quarter, length in ((15, 5), (30, 10), (45, 5)):
+                x = _x(hour * 60 + quarter)
+                lines.append([(x, top), (x, top + length)])
+
+    texts = []
+    for hour in range(25):
+        label = 'Mid' if hour in (0, 24) else 'Noon' if hour == 12 else str(hour % 12)
+        texts.append((_x(hour * 60), GRID_TOP - 6, label, 8, 'middle'))
+    for index, (_, label) in enumerate(ROWS):
+        texts.append((8, GRID_TOP + (index + 0.5) * ROW_HEIGHT + 3, label, 10, 'start'))
+    texts.append((TOTALS_X, GRID_TOP - 6, 'Total Hours', 8, 'middle'))
+    texts.append((GRID_RIGHT, GRID_BOTTOM + 25, 'Total', 10, 'end'))
+    return tuple(lines), tuple(texts)
+
+
+def _overlay_primitives(sheet) -> Tuple[List[Line], List[Text]]:
+    grid = from_hourly_grid(sheet.status_grid) if is_hourly_grid(sheet.status_grid) else sheet.status_grid
+    if not is_interval_grid(grid):
+        # Saved through the ORM or before grids were validated: draw the sheet with no duty line
+        grid = []
+    line = []
+    totals = dict.fromkeys(ROW_INDEX, 0)
+    for start, end, status in grid:
+        y = _row_y(status)
+        line.append((_x(start), y))
+        line.append((_x(end), y))
+        totals[status] += end - start
+
+    texts = [
+        (GRID_LEFT, 24, f"Driver's Daily Log - {sheet.date.isoformat()}", 14, 'start'),
+        (GRID_RIGHT, 24, f"Trip #{sheet.trip_id}", 10, 'end'),
+    ]
+    for status, minutes in totals.items():
+        texts.append((TOTALS_X, _row_y(status) + 4, f"{minutes / 60:.2f}", 10, 'middle'))
+    texts.append((TOTALS_X, GRID_BOTTOM + 25, f"{sum(totals.values()) / 60:.2f}", 10, 'middle'))
+    return [line] if line else [], texts
+
+
+# SVG
+
+def _svg_escape(text: str) -> str:
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _svg_path(lines: Iterable[Line], css_class: str) -> str:
+    d = ''.join('M' + 'L'.join(f"{x:g} {y:g}" for x, y in line) for line in lines)
+    return f'<path class="{css_class}" d="{d}"/>'
+
+
+def _svg_texts(texts: Iterable[Text]) -> str:
+    return ''.join(
+        f'<text x="{x:g}" y="{y:g}" font-size="{size}" text-anchor="{anchor}">{_svg_escape(text)}</text>'
+        for x, y, text, size, anchor in texts
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def svg_base_layer() -> str:
+    """The <defs> holding the grid every sheet is drawn on"""
+    lines, texts = _base_primitives()
+    return (
+        '<defs><style>.grid{fill:none;stroke:#000;stroke-width:0.75}'
+        '.duty{fill:none;stroke:#1c4fd6;stroke-width:2.5;stroke-linejoin:round}'
+        'text{font-family:Helvetica,Arial,sans-serif}</style>'
+        f'<g id="log-base">{_svg_path(lines, "grid")}{_svg_texts(texts)}</g></defs>'
+    )
+
+
+def _svg_overlay(sheet) -> str:
+    lines, texts = _overlay_primitives(sheet)
+    return f'<use href="#log-base"/>{_svg_path(lines, "duty")}{_svg_texts(texts)}'
+
+
+def svg_document(overlays: List[str]) -> bytes:
+    """Stack sheet overlays vertically over copies of the base layer"""
+    height = HEIGHT * max(len(overlays), 1)
+    body = ''.join(f'<g transform="translate(0 {index * HEIGHT})">{overlay}</g>'
+                   for index, overlay in enumerate(overlays))
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{height}" '
+        f'viewBox="0 0 {WIDTH} {height}">{svg_base_layer()}{body}</svg>'
+    ).encode('utf-8')
+
+
+# PDF
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _pdf_lines(lines: Iterable[Line], width: float) -> str:
+    ops = [f"{width:g} w"]
+    for line in lines:
+        (x, y), rest = line[0], line[1:]
+        ops.append(f"{x:g} {HEIGHT - y:g} m " + ' '.join(f"{x:g} {HEIGHT - y:g} l" for x, y in rest) + ' S')
+    return '\n'.join(ops) + '\n'
+
+
+def _pdf_texts(texts: Iterable[Text]) -> str:
+    ops = []
+    for x, y, text, size, anchor in texts:
+        # Helvetica averages about half an em per character, close enough to centre short labels
+        offset = {'start': 0, 'middle': 0.5, 'end': 1}[anchor] * len(text) * size * 0.5
+        ops.append(f"BT /F1 {size} Tf {x - offset:g} {HEIGHT - y:g} Td ({_pdf_escape(text)}) Tj ET")
+    return '\n'.join(ops) + '\n'
+
+
+@functools.lru_cache(maxsize=None)
+def pdf_base_layer() -> bytes:
+    """Content stream of the form XObject every page draws first"""
+    lines, texts = _base_primitives()
+    return (_pdf_lines(lines, 0.75) + _pdf_texts(texts)).encode('latin-1')
+
+
+def _pdf_overlay(sheet) -> bytes:
+    lines, texts = _overlay_primitives(sheet)
+    return ('q /Base Do Q\n0.11 0.31 0.84 RG 1 j\n' + _pdf_lines(lines, 2.5) + '0 G\n'
+            + _pdf_texts(texts)).encode('latin-1')
+
+
+def pdf_document(overlays: List[bytes]) -> bytes:
+    """One page per sheet overlay; the base layer is embedded once and shared by every page"""
+    overlays = overlays or [b'q /Base Do Q\n']
+    base = pdf_base_layer()
+    page_ids = [5 + 2 * index for index in range(len(overlays))]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b' '.join(b"%d 0 R" % page for page in page_ids)
+        + b"] /Count %d >>" % len(overlays),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /XObject /Subtype /Form /BBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> "
+        b"/Length %d >>\nstream\n" % (WIDTH, HEIGHT, len(base)) + base + b"\nendstream",
+    ]
+    for page, overlay in zip(page_ids, overlays):
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 3 0 R >> /XObject << /Base 4 0 R >> >> >>" % (WIDTH, HEIGHT, page + 1)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(overlay) + overlay + b"\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b''.join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(output)
+
+
+# Per-sheet overlay cache
+
+OVERLAYS = {'svg': _svg_overlay, 'pdf': _pdf_overlay}
+DOCUMENTS = {'svg': svg_document, 'pdf': pdf_document}
+
+
+class LogGraphRenderer:
+    """Renders sheets, reusing cached overlays while a sheet is unchanged"""
+
+    def __init__(self):
+        self.cache = LRUCache(
+            max_size=getattr(settings, 'LOG_GRAPH_CACHE_SIZE', 1024),
+            ttl=getattr(settings, 'LOG_GRAPH_CACHE_TTL', 24 * 3600),
+        )
+
+    def overlay(self, sheet, file_format: str):
+        version = (sheet.trip_id, sheet.date, sheet.status_grid)
+        cached = self.cache.get((file_format, sheet.pk))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        overlay = OVERLAYS[file_format](sheet)
+        self.cache.set((file_format, sheet.pk), (version, overlay))
+        return overlay
+
+    def render(self, sheets, file_format: str) -> bytes:
+        """One document holding every sheet in order: stacked graphs for SVG, one page each for PDF"""
+        if file_format not in CONTENT_TYPES:
+            raise ValueError(f"file_format must be one of {', '.join(CONTENT_TYPES)}")
+        return DOCUMENTS[file_format]([self.overlay(sheet, file_format) for sheet in sheets])
+
+    def invalidate(self, sheet_id) -> None:
+        for file_format in CONTENT_TYPES:
+            self.cache.delete((file_format, sheet_id))
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+log_graph_renderer = LogGraphRenderer()
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import AsyncIterator, Dict, Optional
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from ..models import PlanJob
+from ..serializers import PlanJobSerializer
+from .trip_planning import TripPlanningService, TripPlanningError
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(data: Dict) -> PlanJob:
+    """Validate a plan_route payload and queue it; raises TripPlanningError like plan() would"""
+    TripPlanningService().validate(data)
+    return PlanJob.objects.create(payload=data)
+
+
+def claim_job() -> Optional[PlanJob]:
+    """Mark the oldest runnable job as running and return it, or None if there is none.
+
+    Runnable jobs are queued ones and running ones whose lease expired (their
+    worker died), up to PLAN_JOBS_MAX_ATTEMPTS tries; expired ones out of tries
+    are marked failed. Competing workers skip rows another worker has locked;
+    the conditional update keeps claims exclusive on databases without
+    SELECT ... FOR UPDATE as well.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'PLAN_JOBS_LEASE', 300))
+    max_attempts = getattr(settings, 'PLAN_JOBS_MAX_ATTEMPTS', 3)
+    # Otherwise they would never be claimed again and read as running forever
+    PlanJob.objects.filter(status=PlanJob.RUNNING, started_at__lt=now - lease, attempts__gte=max_attempts).update(
+        status=PlanJob.FAILED, errors=[f"Planning did not finish in {max_attempts} attempts"], finished_at=now)
+    runnable = (Q(status=PlanJob.QUEUED) | Q(status=PlanJob.RUNNING, started_at__lt=now - lease)) & Q(
+        attempts__lt=max_attempts)
+    with transaction.atomic():
+        job = (PlanJob.objects.select_for_update(skip_locked=True)
+               .filter(runnable).order_by('created_at').first())
+        if job is None:
+            return None
+        claimed = PlanJob.objects.filter(pk=job.pk, status=job.status, attempts=job.attempts).update(
+            status=PlanJob.RUNNING, started_at=now, attempts=job.attempts + 1)
+    if not claimed:
+        return None
+    job.status, job.started_at, job.attempts = PlanJob.RUNNING, now, job.attempts + 1
+    return job
+
+
+def run_job(job: PlanJob) -> PlanJob:
+    """Plan a claimed job exactly as the synchronous plan_route would and store the outcome"""
+    try:
+        job.result = TripPlanningService().plan(job.payload)
+        job.trip_id = job.result['trip']['id']
+        job.status = PlanJob.SUCCEEDED
+    except TripPlanningError as e:
+        job.errors = e.errors
+        job.status = PlanJob.FAILED
+    except Exception:
+        logger.exception("Plan job %s failed", job.pk)
+        job.errors = ["Location does not exist"]
+        job.status = PlanJob.FAILED
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'errors', 'trip', 'finished_at'])
+    return job
+
+
+async def job_events(job_id, timeout: Optional[float] = None,
+                     poll_interval: Optional[float] = None) -> AsyncIterator[str]:
+    """Server-sent events for a job: one per status change, ending when it finishes or after `timeout` seconds.
+
+    Polls with asyncio.sleep and the async ORM, so under ASGI each event is sent as
+    it happens and a waiting stream holds no thread.
+    """
+    timeout = getattr(settings, 'PLAN_JOBS_STREAM_TIMEOUT', 25) if timeout is None else timeout
+    poll_interval = getattr(settings, 'PLAN_JOBS_STREAM_POLL', 0.5) if poll_interval is None else poll_interval
+    deadline = time.monotonic() + timeout
+    last_status = None
+    while True:
+        job = await PlanJob.objects.aget(pk=job_id)
+        if job.status != last_status:
+            last_status = job.status
+            data = JSONRenderer().render(PlanJobSerializer(job).data).decode()
+            yield f"event: {job.status}\ndata: {data}\n\n"
+        if job.status in (PlanJob.SUCCEEDED, PlanJob.FAILED):
+            return
+        if time.monotonic() >= deadline:
+            # Clients reconnect (EventSource does so automatically) to keep waiting
+            yield "event: timeout\ndata: {}\n\n"
+            return
+        await asyncio.sleep(poll_interval)
+
+
+class PlanJobWorker:
+    """Claims and runs jobs until stopped, sleeping `poll_interval` seconds when the queue is empty"""
+
+    def __init__(self, poll_interval: float = 1.0):
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+
+    def run(self, drain: bool = False) -> int:
+        """Process jobs; with drain=True return once the queue is empty. Returns the number of jobs run."""
+        processed = 0
+        while not self.stopped.is_set():
+            # As Django does around each request, so a long-lived worker drops broken or expired connections
+            close_old_connections()
+            try:
+                job = claim_job()
+                if job is None:
+                    if drain:
+                        break
+                    self.stopped.wait(self.poll_interval)
+                    continue
+                run_job(job)
+                processed += 1
+            except Exception:
+                # E.g. a dropped connection or a statement timeout; an unfinished job is retried after its lease
+                logger.exception("Plan job worker iteration failed")
+                self.stopped.wait(self.poll_interval)
+            finally:
+                close_old_connections()
+        return processed
+
+    def stop(self) -> None:
+        self.stopped.set()
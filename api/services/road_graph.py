@@ -0,0 +1,259 @@
+"""Memory-mapped road graph with A* + landmarks (ALT) shortest-path queries.
+
+File layout (little-endian, every section aligned to 8 bytes):
+
+    header      magic b'ELDGRAPH', version, node count, edge count, landmark count (uint32 each)
+    lat, lon    float64[nodes]              node coordinates, nodes sorted by spatial grid cell
+    cells       int64[nodes]                grid cell of each node (non-decreasing)
+    offsets     uint32[nodes + 1]           CSR index into the edge arrays
+    targets     uint32[edges]
+    durations   float32[edges]              seconds
+    distances   float32[edges]              meters
+    lm_from     float32[landmarks * nodes]  duration from each landmark to every node
+    lm_to       float32[landmarks * nodes]  duration from every node to each landmark
+
+Queries only touch the pages they need, so loading a large graph is
+effectively free and the OS page cache is shared between worker processes.
+"""
+
+import array
+import heapq
+import math
+import mmap
+import struct
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MAGIC = b'ELDGRAPH'
+VERSION = 1
+HEADER = struct.Struct('<8sIIII')
+CELL_DEGREES = 0.05  # ~5 km grid cells for nearest-node lookup
+UNREACHABLE = float('inf')
+
+
+def _cell(lat: float, lon: float) -> int:
+    return (math.floor(lat / CELL_DEGREES) + 4096) * 16384 + (math.floor(lon / CELL_DEGREES) + 8192)
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _dijkstra(offsets, targets, weights, source: int, node_count: int) -> List[float]:
+    distances = [UNREACHABLE] * node_count
+    distances[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        distance, node = heapq.heappop(heap)
+        if distance > distances[node]:
+            continue
+        for edge in range(offsets[node], offsets[node + 1]):
+            candidate = distance + weights[edge]
+            target = targets[edge]
+            if candidate < distances[target]:
+                distances[target] = candidate
+                heapq.heappush(heap, (candidate, target))
+    return distances
+
+
+def _csr(node_count: int, edges: List[Tuple[int, int, float, float]]):
+    edges = sorted(edges)
+    offsets = array.array('I', [0] * (node_count + 1))
+    for source, _, _, _ in edges:
+        offsets[source + 1] += 1
+    for node in range(node_count):
+        offsets[node + 1] += offsets[node]
+    targets = array.array('I', (edge[1] for edge in edges))
+    durations = array.array('f', (edge[2] for edge in edges))
+    distances = array.array('f', (edge[3] for edge in edges))
+    return offsets, targets, durations, distances
+
+
+def build_road_graph(nodes: Iterable[Tuple[str, float, float]],
+                     edges: Iterable[Tuple[str, str, float, float, bool]],
+                     path: str, landmark_count: int = 8) -> Dict[str, int]:
+    """Write a graph file from (node_id, lat, lon) nodes and (source, target, meters, seconds, oneway) edges.
+
+    Landmarks are chosen by farthest-point selection; each costs a forward
+    and a reverse Dijkstra over the whole graph at build time.
+    """
+    nodes = list(nodes)
+    nodes.sort(key=lambda node: (_cell(node[1], node[2]), node[1], node[2]))
+    index = {node_id: position for position, (node_id, _, _) in enumerate(nodes)}
+    node_count = len(nodes)
+
+    forward = []
+    for source, target, meters, seconds, oneway in edges:
+        source, target = index[source], index[target]
+        forward.append((source, target, float(seconds), float(meters)))
+        if not oneway:
+            forward.append((target, source, float(seconds), float(meters)))
+    reverse = [(target, source, seconds, meters) for source, target, seconds, meters in forward]
+
+    offsets, targets, durations, distances = _csr(node_count, forward)
+    reverse_offsets, reverse_targets, reverse_durations, _ = _csr(node_count, reverse)
+
+    landmark_count = min(landmark_count, node_count)
+    lm_from = array.array('f')
+    lm_to = array.array('f')
+    landmark = 0
+    coverage = [UNREACHABLE] * node_count
+    for _ in range(landmark_count):
+        from_landmark = _dijkstra(offsets, targets, durations, landmark, node_count)
+        to_landmark = _dijkstra(reverse_offsets, reverse_targets, reverse_durations, landmark, node_count)
+        lm_from.extend(from_landmark)
+        lm_to.extend(to_landmark)
+        # Next landmark: the reachable node farthest from all landmarks picked so far
+        coverage = [min(current, distance) for current, distance in zip(coverage, from_landmark)]
+        landmark = max(range(node_count), key=lambda node: coverage[node] if coverage[node] < UNREACHABLE else -1)
+
+    sections = [
+        array.array('d', (node[1] for node in nodes)),
+        array.array('d', (node[2] for node in nodes)),
+        array.array('q', (_cell(node[1], node[2]) for node in nodes)),
+        offsets, targets, durations, distances, lm_from, lm_to,
+    ]
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, node_count, len(targets), landmark_count))
+        for section in sections:
+            f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+            if sys.byteorder != 'little':
+                section = array.array(section.typecode, section)
+                section.byteswap()
+            section.tofile(f)
+    return {'nodes': node_count, 'edges': len(targets), 'landmarks': landmark_count}
+
+
+class RoadGraph:
+    """Read-only view of a graph file, answering shortest-path queries by travel time"""
+
+    def __init__(self, path: str):
+        if sys.byteorder != 'little':
+            raise ValueError("Road graph files can only be memory-mapped on little-endian hosts")
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.node_count, self.edge_count, self.landmark_count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} road graph file")
+
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+        sections = []
+        for typecode, length in (('d', self.node_count), ('d', self.node_count), ('q', self.node_count),
+                                 ('I', self.node_count + 1), ('I', self.edge_count), ('f', self.edge_count),
+                                 ('f', self.edge_count), ('f', self.landmark_count * self.node_count),
+                                 ('f', self.landmark_count * self.node_count)):
+            offset = _aligned(offset)
+            size = length * struct.calcsize(typecode)
+            sections.append(view[offset:offset + size].cast(typecode))
+            offset += size
+        (self.lat, self.lon, self.cells, self.offsets, self.targets,
+         self.durations, self.distances, self.lm_from, self.lm_to) = sections
+
+    def nearest_node(self, lat: float, lon: float, max_rings: int = 3) -> Optional[int]:
+        """Closest node to a point, searching grid cells in rings around it"""
+        row, column = math.floor(lat / CELL_DEGREES), math.floor(lon / CELL_DEGREES)
+        scale = math.cos(math.radians(lat))
+        best, best_distance = None, UNREACHABLE
+        for ring in range(max_rings + 1):
+            for d_row in range(-ring, ring + 1):
+                for d_column in range(-ring, ring + 1):
+                    if max(abs(d_row), abs(d_column)) != ring:
+                        continue
+                    cell = (row + d_row + 4096) * 16384 + (column + d_column + 8192)
+                    for node in range(self._bisect(cell), self._bisect(cell + 1)):
+                        distance = (self.lat[node] - lat) ** 2 + ((self.lon[node] - lon) * scale) ** 2
+                        if distance < best_distance:
+                            best, best_distance = node, distance
+            # Every node in the next ring is at least `ring` cells away, so stop once the best is closer
+            if best is not None and math.sqrt(best_distance) <= ring * CELL_DEGREES * scale:
+                break
+        return best
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[float, float, List[int]]]:
+        """(duration seconds, distance meters, node path) of the fastest path, or None if unreachable"""
+        if source == target:
+            return 0.0, 0.0, [source]
+
+        heuristic_cache = {}
+
+        def heuristic(node: int) -> float:
+            value = heuristic_cache.get(node)
+            if value is None:
+                value = 0.0
+                for landmark in range(self.landmark_count):
+                    base = landmark * self.node_count
+                    # Triangle inequality lower bounds on the remaining travel time
+                    value = max(value,
+                                self.lm_from[base + target] - self.lm_from[base + node],
+                                self.lm_to[base + node] - self.lm_to[base + target])
+                heuristic_cache[node] = value
+            return value
+
+        best = {source: 0.0}
+        previous_edge = {}
+        heap = [(heuristic(source), 0.0, source)]
+        closed = set()
+        while heap:
+            _, duration, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if node in closed:
+                continue
+            closed.add(node)
+            for edge in range(self.offsets[node], self.offsets[node + 1]):
+                neighbour = self.targets[edge]
+                candidate = duration + self.durations[edge]
+                if candidate < best.get(neighbour, UNREACHABLE):
+                    best[neighbour] = candidate
+                    previous_edge[neighbour] = (node, edge)
+                    heapq.heappush(heap, (candidate + heuristic(neighbour), candidate, neighbour))
+        else:
+            return None
+
+        path = [target]
+        distance = 0.0
+        while path[-1] != source:
+            node, edge = previous_edge[path[-1]]
+            distance += self.distances[edge]
+            path.append(node)
+        path.reverse()
+        return best[target], distance, path
+
+    def durations_from(self, source: int, targets: Iterable[int]) -> Dict[int, float]:
+        """Fastest travel time from source to each target (inf if unreachable), from one Dijkstra search"""
+        remaining = set(targets)
+        found = {}
+        best = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap and remaining:
+            duration, node = heapq.heappop(heap)
+            if duration > best[node]:
+                continue
+            if node in remaining:
+                remaining.discard(node)
+                found[node] = duration
+            for edge in range(self.offsets[node], self.offsets[node + 1]):
+                neighbour = self.targets[edge]
+                candidate = duration + self.durations[edge]
+                if candidate < best.get(neighbour, UNREACHABLE):
+                    best[neighbour] = candidate
+                    heapq.heappush(heap, (candidate, neighbour))
+        found.update(dict.fromkeys(remaining, UNREACHABLE))
+        return found
+
+    def _bisect(self, cell: int) -> int:
+        low, high = 0, self.node_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.cells[middle] < cell:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def close(self) -> None:
+        for section in (self.lat, self.lon, self.cells, self.offsets, self.targets,
+                        self.durations, self.distances, self.lm_from, self.lm_to):
+            section.release()
+        self._mmap.close()
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from ..models import RouteCache as RouteCacheEntry
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+def route_cache_key(coordinates: List[tuple], precision: int = 4) -> str:
+    """Build a cache key from (lat, lon) waypoints quantized to `precision` decimal places.
+
+    Four decimal places (~11 m) matches the tolerance used by
+    RoutePlanner._are_coordinates_same, so waypoints it treats as equal share a key.
+    """
+    def quantize(value: float) -> str:
+        # Adding 0.0 folds -0.0 into 0.0 so both sides of the meridian/equator match
+        return f"{round(value, precision) + 0.0:.{precision}f}"
+
+    return ';'.join(f"{quantize(lat)},{quantize(lon)}" for lat, lon in coordinates)
+
+
+class RouteCacheBackend:
+    """Interface for route cache storage. Values are dicts of distance, duration, legs and geometry."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        value = self._get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict) -> None:
+        self._set(key, value)
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def clear(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def _get(self, key: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: Dict) -> None:
+        raise NotImplementedError
+
+
+class NullRouteCacheBackend(RouteCacheBackend):
+    """Disables route caching"""
+
+    def _get(self, key: str) -> Optional[Dict]:
+        return None
+
+    def _set(self, key: str, value: Dict) -> None:
+        pass
+
+
+class MemoryRouteCacheBackend(RouteCacheBackend):
+    """Per-process LRU cache"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        super().__init__(ttl, max_entries)
+        self.entries = LRUCache(max_size=max_entries, ttl=ttl)
+
+    def _get(self, key: str) -> Optional[Dict]:
+        return self.entries.get(key)
+
+    def _set(self, key: str, value: Dict) -> None:
+        self.entries.set(key, value)
+
+    def clear(self) -> None:
+        super().clear()
+        self.entries.clear()
+
+
+class DatabaseRouteCacheBackend(RouteCacheBackend):
+    """Stores routes in the RouteCache table so they are shared between processes"""
+
+    EVICTION_INTERVAL = 50  # Run size-based eviction once every this many writes
+
+    def __init__(self, ttl: float, max_entries: int):
+        super().__init__(ttl, max_entries)
+        self._writes = 0
+
+    def _get(self, key: str) -> Optional[Dict]:
+        try:
+            entry = RouteCacheEntry.objects.filter(
+                key=key,
+                updated_at__gte=timezone.now() - timedelta(seconds=self.ttl),
+            ).values('distance', 'duration', 'legs', 'geometry').first()
+        except DatabaseError:
+            logger.warning("Could not read route cache entry", exc_info=True)
+            return None
+        return entry
+
+    def _set(self, key: str, value: Dict) -> None:
+        try:
+            RouteCacheEntry.objects.update_or_create(key=key, defaults={
+                'distance': value['distance'],
+                'duration': value['duration'],
+                'legs': value.get('legs', []),
+                'geometry': value.get('geometry'),
+            })
+        except DatabaseError:
+            logger.warning("Could not persist route cache entry", exc_info=True)
+            return
+
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.EVICTION_INTERVAL == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> None:
+        """Delete expired entries and trim the table to max_entries, oldest first"""
+        try:
+            RouteCacheEntry.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=self.ttl)).delete()
+            stale_ids = list(
+                RouteCacheEntry.objects.order_by('-updated_at', '-id').values_list('id', flat=True)[self.max_entries:]
+            )
+            if stale_ids:
+                RouteCacheEntry.objects.filter(id__in=stale_ids).delete()
+        except DatabaseError:
+            logger.warning("Could not evict route cache entries", exc_info=True)
+
+
+class FileRouteCacheBackend(RouteCacheBackend):
+    """Stores one JSON file per route in a directory (e.g. /tmp on serverless hosts)"""
+
+    EVICTION_INTERVAL = 50
+
+    def __init__(self, ttl: float, max_entries: int, directory: Optional[str] = None):
+        super().__init__(ttl, max_entries)
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'eld_route_cache')
+        os.makedirs(self.directory, exist_ok=True)
+        self._writes = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def _get(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) < time.time() - self.ttl:
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _set(self, key: str, value: Dict) -> None:
+        path = self._path(key)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.warning("Could not write route cache file", exc_info=True)
+            return
+
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.EVICTION_INTERVAL == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> None:
+        """Delete expired files and trim the directory to max_entries, oldest first"""
+        try:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.json'):
+                    entries.append((entry.stat().st_mtime, entry.path))
+            entries.sort(reverse=True)
+            cutoff = time.time() - self.ttl
+            for index, (mtime, path) in enumerate(entries):
+                if index >= self.max_entries or mtime < cutoff:
+                    os.remove(path)
+        except OSError:
+            logger.warning("Could not evict route cache files", exc_info=True)
+
+    def clear(self) -> None:
+        super().clear()
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                os.remove(entry.path)
+
+
+ROUTE_CACHE_BACKENDS = {
+    'none': NullRouteCacheBackend,
+    'memory': MemoryRouteCacheBackend,
+    'db': DatabaseRouteCacheBackend,
+    'file': FileRouteCacheBackend,
+}
+
+def get_route_cache_backend() -> RouteCacheBackend:
+    name = getattr(settings, 'ROUTE_CACHE_BACKEND', 'memory')
+    options = {
+        'ttl': getattr(settings, 'ROUTE_CACHE_TTL', 24 * 3600),
+        'max_entries': getattr(settings, 'ROUTE_CACHE_MAX_ENTRIES', 10000),
+    }
+    if name == 'file':
+        options['directory'] = getattr(settings, 'ROUTE_CACHE_DIR', None)
+    try:
+        backend_class = ROUTE_CACHE_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown route cache backend: {name}")
+    return backend_class(**options)
+
+route_cache = get_route_cache_backend()
@@ -0,0 +1,155 @@
+"""Encoded-polyline route geometry and its simplification for map display.
+
+Trips store the full route line in Google's encoded polyline format (precision
+5, as OSRM returns it with geometries=polyline), a few bytes per point. The
+trip geometry endpoint thins it with Douglas-Peucker at a tolerance in meters,
+or at the size of a pixel for a web-map zoom level, and keeps the most recently
+used simplified lines in memory per trip.
+"""
+
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+from django.conf import settings
+from .cache import LRUCache
+
+PRECISION = 5
+EARTH_RADIUS_METERS = 6371008.8
+# Meters per pixel of a 256-pixel web-mercator tile at zoom 0 on the equator
+ZOOM_0_METERS_PER_PIXEL = 2 * math.pi * 6378137 / 256
+MAX_ZOOM = 22
+
+Point = Tuple[float, float]  # (lat, lon)
+
+
+def encode(points: Sequence[Point], precision: int = PRECISION) -> str:
+    factor = 10 ** precision
+    chunks = []
+    previous_lat = previous_lon = 0
+    for lat, lon in points:
+        lat, lon = round(lat * factor), round(lon * factor)
+        for delta in (lat - previous_lat, lon - previous_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous_lat, previous_lon = lat, lon
+    return ''.join(chunks)
+
+
+def decode(encoded: str, precision: int = PRECISION) -> List[Point]:
+    factor = 10 ** precision
+    points = []
+    index = lat = lon = 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append((lat / factor, lon / factor))
+    return points
+
+
+def simplify(points: Sequence[Point], tolerance: float) -> List[Point]:
+    """Douglas-Peucker: drop points closer than `tolerance` meters to the line that replaces them"""
+    if tolerance <= 0 or len(points) < 3:
+        return list(points)
+
+    # Local equirectangular projection to meters, accurate enough over a route's extent
+    scale = math.cos(math.radians(sum(lat for lat, _ in points) / len(points)))
+    xy = [(math.radians(lon) * scale * EARTH_RADIUS_METERS, math.radians(lat) * EARTH_RADIUS_METERS)
+          for lat, lon in points]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length_squared = dx * dx + dy * dy
+        farthest, farthest_distance = None, tolerance
+        for index in range(first + 1, last):
+            x, y = xy[index]
+            if length_squared == 0:
+                distance = math.hypot(x - x1, y - y1)
+            else:
+                # Distance to the segment, not the infinite line, so loops back past an end are kept
+                t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length_squared))
+                distance = math.hypot(x - x1 - t * dx, y - y1 - t * dy)
+            if distance > farthest_distance:
+                farthest, farthest_distance = index, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def zoom_tolerance(zoom: int, latitude: float) -> float:
+    """Meters covered by one map pixel at a zoom level, so the simplified line differs by at most a pixel"""
+    return ZOOM_0_METERS_PER_PIXEL * math.cos(math.radians(latitude)) / 2 ** zoom
+
+
+def line_from_legs(legs: Sequence[Sequence[Point]]) -> List[Point]:
+    """Join per-leg point lists into one line, dropping the point each leg shares with the previous one"""
+    line = []
+    for leg in legs:
+        line.extend(leg[1:] if line and leg and line[-1] == leg[0] else leg)
+    return line
+
+
+class RouteGeometryCache:
+    """Simplified lines per trip and tolerance, dropped when the trip's stored geometry changes"""
+
+    def __init__(self):
+        self.cache = LRUCache(
+            max_size=getattr(settings, 'ROUTE_GEOMETRY_CACHE_SIZE', 256),
+            ttl=getattr(settings, 'ROUTE_GEOMETRY_CACHE_TTL', 24 * 3600),
+        )
+
+    def simplified(self, trip, tolerance: Optional[float] = None, zoom: Optional[int] = None) -> Dict:
+        """The trip's line at a tolerance in meters or for a zoom level (full detail when neither is given).
+
+        Returns {'points': [(lat, lon), ...], 'tolerance': meters, 'original_points': count}.
+        """
+        cached = self.cache.get(trip.pk)
+        if cached is None or cached[0] != trip.route_geometry:
+            # The full line is decoded once per trip, then simplified per level. Levels are an LRU of their
+            # own, since ?tolerance= lets a client ask for any number of them
+            levels = LRUCache(max_size=getattr(settings, 'ROUTE_GEOMETRY_LEVELS', 8), ttl=self.cache.ttl)
+            cached = (trip.route_geometry, decode(trip.route_geometry or ''), levels)
+            self.cache.set(trip.pk, cached)
+        _, full, levels = cached
+
+        if zoom is not None:
+            tolerance = zoom_tolerance(zoom, full[0][0] if full else 0.0)
+        tolerance = round(tolerance or 0.0, 1)
+        points = full if tolerance == 0 else levels.get(tolerance)
+        if points is None:
+            points = simplify(full, tolerance)
+            levels.set(tolerance, points)
+        return {'points': points, 'tolerance': tolerance, 'original_points': len(full)}
+
+    def levels(self, trip_id) -> int:
+        """How many simplified lines are held for a trip"""
+        cached = self.cache.get(trip_id)
+        return 0 if cached is None else len(cached[2])
+
+    def invalidate(self, trip_id) -> None:
+        self.cache.delete(trip_id)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+route_geometry_cache = RouteGeometryCache()
@@ -1,15 +1,33 @@
-import requests
-from datetime import datetime, timedelta
-from typing import Dict, List
-import os
-import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import partial
+from typing import Dict, List, Sequence
+from django.conf import settings
+from .cache import LRUCache
+from .geocode_cache import geocode_cache
+from .geocoding import geocoders, GeocoderBusy, LocationNotFound
+from .hos import HOSSimulator, required_stops, serialize_timeline
+from .route_cache import route_cache, route_cache_key
+from .routing import router
+from .stop_ordering import order_stops
+from .throttle import SingleFlight, ThrottledError
+from .timing import span
+
+# Shared across requests so the total number of concurrent geocoding calls stays bounded
+_GEOCODE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix='geocode')
+geocode_flights = SingleFlight('geocode')
+# Travel-time matrices for ordering multi-stop trips, keyed like the route cache
+duration_matrix_cache = LRUCache(
+    max_size=getattr(settings, 'DURATION_MATRIX_CACHE_SIZE', 256),
+    ttl=getattr(settings, 'DURATION_MATRIX_CACHE_TTL', 24 * 3600),
+)
 
 class RoutePlanner:
     def __init__(self):
-        self.OSRM_URL = "https://router.project-osrm.org/route/v1/driving"
-        self.MAX_DRIVING_HOURS = 11
-        self.MAX_ON_DUTY_HOURS = 14
-        self.REQUIRED_REST_HOURS = 10
+        self.local_geocoders = [geocoder for geocoder in geocoders if geocoder.local]
+        self.remote_geocoders = [geocoder for geocoder in geocoders if not geocoder.local]
+        self.GEOCODE_TIMEOUT = 15  # seconds allowed for all geocoding calls, including retries
+        self.router = router
 
     def _validate_location(self, location: str) -> bool:
         """Validate if a location string is reasonable"""
@@ -23,118 +41,254 @@ class RoutePlanner:
         return (abs(coords1[0] - coords2[0]) < tolerance and 
                 abs(coords1[1] - coords2[1]) < tolerance)
 
+    def _normalize_location(self, location: str) -> str:
+        """Normalize a location string so equivalent inputs share one lookup"""
+        return ' '.join(location.lower().split())
+
+    def _geocode_many(self, locations: List[str]) -> Dict[str, object]:
+        """Geocode several locations concurrently, resolving each distinct location once.
+
+        Maps each input location to its coordinates, or to the ValueError its lookup raised:
+        GeocoderBusy when it was throttled or not done within GEOCODE_TIMEOUT, so callers
+        can tell a retry apart from a location that does not exist.
+        """
+        unique = self._unique_locations(locations)
+        resolved = self._geocode_local(unique)
+        resolved.update(geocode_cache.get_many([key for key in unique if key not in resolved]))
+        # Concurrent requests for the same location share one upstream lookup
+        futures = {key: _GEOCODE_POOL.submit(geocode_flights.do, key, partial(self._get_coordinates, location))
+                   for key, location in unique.items() if key not in resolved}
+        deadline = time.monotonic() + self.GEOCODE_TIMEOUT
+        fetched = {}
+        failed = {}
+        try:
+            for key, future in futures.items():
+                try:
+                    fetched[key] = future.result(timeout=max(0, deadline - time.monotonic()))
+                except LocationNotFound:
+                    fetched[key] = None
+                except GeocoderBusy as e:
+                    failed[key] = e
+                except FutureTimeoutError:
+                    failed[key] = GeocoderBusy()
+                except ValueError:
+                    failed[key] = ValueError("Location does not exist")
+        finally:
+            for future in futures.values():
+                future.cancel()
+            geocode_cache.set_many(fetched)
+
+        resolved.update(fetched)
+        return self._geocode_results(locations, resolved, failed)
+
+    def _unique_locations(self, locations: List[str]) -> Dict[str, str]:
+        """Map each normalized location to the first input spelling of it"""
+        unique = {}
+        for location in locations:
+            unique.setdefault(self._normalize_location(location), location)
+        return unique
+
+    def _geocode_results(self, locations: List[str], resolved: Dict, failed: Dict) -> Dict[str, object]:
+        results = {}
+        for location in locations:
+            key = self._normalize_location(location)
+            if key in failed:
+                results[location] = failed[key]
+            elif resolved[key] is None:
+                results[location] = LocationNotFound("Location does not exist")
+            else:
+                results[location] = resolved[key]
+        return results
+
+    def _get_coordinates_many(self, locations: List[str]) -> Dict[str, tuple]:
+        """Geocode several locations concurrently, raising ValueError if any cannot be resolved"""
+        return self._raise_geocode_errors(self._geocode_many(locations))
+
+    def _raise_geocode_errors(self, results: Dict[str, object]) -> Dict[str, tuple]:
+        for result in results.values():
+            if isinstance(result, Exception):
+                raise result
+        return results
+
     def _get_coordinates(self, location: str) -> tuple:
+        """Ask each remote geocoder in turn, raising LocationNotFound if none has a result"""
         try:
-            # Using Nominatim for geocoding
-            url = f"https://nominatim.openstreetmap.org/search?q={location}&format=json"
-            headers = {
-                'User-Agent': 'ELD Backend/1.0'
-            }
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
-            if not data:
-                raise ValueError("Location does not exist")
-            
-            # Get the first result
-            result = data[0]
-            lat = float(result['lat'])
-            lon = float(result['lon'])
-            
-            return lat, lon
+            for geocoder in self.remote_geocoders:
+                try:
+                    return geocoder.geocode(location)
+                except LocationNotFound:
+                    continue
+            raise LocationNotFound("Location does not exist")
+        except LocationNotFound:
+            raise
+        except ThrottledError:
+            raise GeocoderBusy()
         except Exception:
             raise ValueError("Location does not exist")
 
+    def _geocode_local(self, unique: Dict[str, str]) -> Dict[str, tuple]:
+        """Resolve what the in-process geocoders can, keyed by normalized location"""
+        resolved = {}
+        for key, location in unique.items():
+            for geocoder in self.local_geocoders:
+                try:
+                    resolved[key] = geocoder.geocode(location)
+                    break
+                except LocationNotFound:
+                    continue
+        return resolved
+
     def calculate_route(self, origin: str, pickup: str, destination: str, current_hours: float) -> Dict:
         try:
             # Validate locations
             if not all([self._validate_location(loc) for loc in [origin, pickup, destination]]):
                 raise ValueError("One or more locations are invalid")
 
-            # Get coordinates
-            origin_coords = self._get_coordinates(origin)
-            pickup_coords = self._get_coordinates(pickup)
-            dest_coords = self._get_coordinates(destination)
-
-            if not all([origin_coords, pickup_coords, dest_coords]):
-                raise ValueError("Could not find coordinates for one or more locations")
-
-            # Check for duplicate locations
-            if pickup == destination:
-                raise ValueError("Pickup location and destination cannot be the same")
-            if origin == destination:
-                raise ValueError("Current location and destination cannot be the same")
-
-            # If current and pickup locations are the same, use the same coordinates
-            if origin == pickup:
-                pickup_coords = origin_coords
-
-            # Calculate routes
-            waypoints = [
-                f"{origin_coords[1]},{origin_coords[0]}",
-                f"{pickup_coords[1]},{pickup_coords[0]}",
-                f"{dest_coords[1]},{dest_coords[0]}"
-            ]
+            # Get coordinates (looked up concurrently, duplicates resolved once)
+            with span('geocode'):
+                coordinates = self._get_coordinates_many([origin, pickup, destination])
+            return self.calculate_route_from_coordinates(origin, pickup, destination, current_hours, coordinates)
+        except ValueError as e:
+            raise e
+        except Exception:
+            raise ValueError("Location does not exist")
 
-            url = f"{self.OSRM_URL}/{';'.join(waypoints)}"
-            response = requests.get(url)
-            
-            if response.status_code == 400:
-                raise ValueError("Location does not exist")
-            
-            response.raise_for_status()
-            route_data = response.json()
-
-            if route_data.get('code') != 'Ok':
-                raise ValueError("Location does not exist")
-
-            # Extract distance and duration
-            total_distance = route_data['routes'][0]['distance'] / 1609.34  # Convert meters to miles
-            total_duration = route_data['routes'][0]['duration'] / 3600  # Convert seconds to hours
-
-            # Calculate required stops
-            remaining_hours = self.MAX_DRIVING_HOURS - current_hours
-            stops = self._calculate_required_stops(total_duration, remaining_hours)
-
-            return {
-                'total_distance': total_distance,
-                'total_duration': total_duration,
-                'required_stops': stops,
-                'waypoints': [
-                    {'lat': origin_coords[0], 'lng': origin_coords[1]},
-                    {'lat': pickup_coords[0], 'lng': pickup_coords[1]},
-                    {'lat': dest_coords[0], 'lng': dest_coords[1]}
-                ]
-            }
+    def calculate_route_from_coordinates(self, origin: str, pickup: str, destination: str,
+                                         current_hours: float, coordinates: Dict[str, tuple]) -> Dict:
+        """Route a trip whose locations have already been geocoded into `coordinates`"""
+        try:
+            waypoints = self._trip_waypoints(origin, pickup, destination, coordinates)
+            with span('route'):
+                route = self._get_route(waypoints)
+            return self._build_route_result(route, waypoints, current_hours)
         except ValueError as e:
             raise e
         except Exception:
             raise ValueError("Location does not exist")
 
-    def _calculate_required_stops(self, total_duration: float, remaining_hours: float) -> List[Dict]:
+    def calculate_multi_stop_route(self, origin: str, stops: List[Dict], current_hours: float,
+                                   optimize: bool = False) -> Dict:
+        """Route a trip from `origin` through `stops`, in the given order or, with `optimize`, a short one.
+
+        Each stop is {'location', 'kind' ('pickup' or 'dropoff'), 'shipment'}; a
+        shipment's pickups always come before its dropoffs. The result has the
+        stops in driving order under 'stops'.
+        """
         try:
-            stops = []
-            current_time = datetime.now()
-            hours_driven = 0
-            
-            while hours_driven < total_duration:
-                if hours_driven + remaining_hours >= total_duration:
-                    break
-                    
-                hours_driven += remaining_hours
-                current_time += timedelta(hours=remaining_hours)
-                
-                # Add required rest stop
-                stops.append({
-                    'type': 'rest',
-                    'duration': self.REQUIRED_REST_HOURS,
-                    'time': current_time.strftime('%Y-%m-%d %H:%M:%S')
-                })
-                
-                current_time += timedelta(hours=self.REQUIRED_REST_HOURS)
-                remaining_hours = self.MAX_DRIVING_HOURS
-
-            return stops
+            locations = [origin] + [stop['location'] for stop in stops]
+            if not all(self._validate_location(location) for location in locations):
+                raise ValueError("One or more locations are invalid")
+
+            with span('geocode'):
+                coordinates = self._get_coordinates_many(locations)
+            return self.calculate_multi_stop_route_from_coordinates(origin, stops, current_hours, coordinates,
+                                                                   optimize)
+        except ValueError as e:
+            raise e
+        except Exception:
+            raise ValueError("Location does not exist")
+
+    def calculate_multi_stop_route_from_coordinates(self, origin: str, stops: List[Dict], current_hours: float,
+                                                    coordinates: Dict[str, tuple], optimize: bool = False) -> Dict:
+        """Route a multi-stop trip whose locations have already been geocoded into `coordinates`"""
+        try:
+            points = [coordinates[location] for location in [origin] + [stop['location'] for stop in stops]]
+
+            order = list(range(len(stops)))
+            if optimize:
+                with span('order_stops'):
+                    matrix = self._get_duration_matrix(points)
+                    order = [index - 1 for index in order_stops(
+                        matrix,
+                        [None] + [stop['kind'] for stop in stops],
+                        [None] + [stop.get('shipment') for stop in stops],
+                    )]
+            ordered = [stops[index] for index in order]
+            waypoints = [points[0]] + [points[index + 1] for index in order]
+
+            with span('route'):
+                route = self._get_route(waypoints)
+            result = self._build_route_result(route, waypoints, current_hours, [stop['kind'] for stop in ordered])
+            result['stops'] = [
+                {'sequence': sequence, 'location': stop['location'], 'kind': stop['kind'],
+                 'shipment': stop.get('shipment'), 'lat': lat, 'lng': lng}
+                for sequence, (stop, (lat, lng)) in enumerate(zip(ordered, waypoints[1:]), start=1)
+            ]
+            return result
+        except ValueError as e:
+            raise e
         except Exception:
-            raise ValueError("Location does not exist") 
\ No newline at end of file
+            raise ValueError("Location does not exist")
+
+    def _get_duration_matrix(self, coordinates: List[tuple]) -> List[List[float]]:
+        """One travel-time matrix for all the points, from the router or the matrix cache"""
+        key = route_cache_key(coordinates)
+        matrix = duration_matrix_cache.get(key)
+        if matrix is None:
+            matrix = self.router.duration_matrix(coordinates)
+            duration_matrix_cache.set(key, matrix)
+        return matrix
+
+    def _trip_waypoints(self, origin: str, pickup: str, destination: str,
+                        coordinates: Dict[str, tuple]) -> List[tuple]:
+        """Check the trip's locations and return its (lat, lon) waypoints in driving order"""
+        origin_coords = coordinates[origin]
+        pickup_coords = coordinates[pickup]
+        dest_coords = coordinates[destination]
+
+        if not all([origin_coords, pickup_coords, dest_coords]):
+            raise ValueError("Could not find coordinates for one or more locations")
+
+        # Check for duplicate locations
+        if pickup == destination:
+            raise ValueError("Pickup location and destination cannot be the same")
+        if origin == destination:
+            raise ValueError("Current location and destination cannot be the same")
+
+        # If current and pickup locations are the same, use the same coordinates
+        if origin == pickup:
+            pickup_coords = origin_coords
+
+        return [origin_coords, pickup_coords, dest_coords]
+
+    def _build_route_result(self, route: Dict, waypoints: List[tuple], current_hours: float,
+                            stop_kinds: Sequence[str] = ('pickup', 'dropoff')) -> Dict:
+        # Extract distance and duration
+        total_distance = route['distance'] / 1609.34  # Convert meters to miles
+        total_duration = route['duration'] / 3600  # Convert seconds to hours
+
+        # Simulate the duty-status timeline; stops and log sheets are both derived from it
+        with span('hos'):
+            timeline = HOSSimulator().simulate(self._trip_legs(route, total_duration, stop_kinds), current_hours)
+
+        return {
+            'total_distance': total_distance,
+            'total_duration': total_duration,
+            'required_stops': required_stops(timeline),
+            'duty_timeline': serialize_timeline(timeline),
+            'waypoints': [{'lat': lat, 'lng': lng} for lat, lng in waypoints],
+            'geometry': route.get('geometry'),
+        }
+
+    def _trip_legs(self, route: Dict, total_duration: float,
+                   stop_kinds: Sequence[str] = ('pickup', 'dropoff')) -> List[tuple]:
+        """(driving_hours, stop_kind) for each leg, ending at the stops in order"""
+        legs = route.get('legs') or []
+        if len(legs) != len(stop_kinds):
+            # Without per-leg durations, treat every stop but the last as happening at the start
+            return [(0, kind) for kind in stop_kinds[:-1]] + [(total_duration, stop_kinds[-1])]
+        return [(leg['duration'] / 3600, kind) for leg, kind in zip(legs, stop_kinds)]
+
+    def _get_route(self, coordinates: List[tuple]) -> Dict:
+        """Fetch the driving route through the given (lat, lon) waypoints, using the route cache"""
+        if not self.router.cacheable:
+            return self._fetch_route(coordinates)
+        key = route_cache_key(coordinates)
+        route = route_cache.get(key)
+        if route is None:
+            route = self._fetch_route(coordinates)
+            route_cache.set(key, route)
+        return route
+
+    def _fetch_route(self, coordinates: List[tuple]) -> Dict:
+        return self.router.route(coordinates)
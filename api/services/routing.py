@@ -0,0 +1,176 @@
+import threading
+from typing import Dict, List, Optional
+from django.conf import settings
+from .route_geometry import encode, line_from_legs
+from .upstream import upstream, async_upstream, UpstreamError
+
+class RoutingBackend:
+    """Turns (lat, lon) waypoints into a route.
+
+    A route is {'distance' (meters), 'duration' (seconds), 'legs': [{'distance', 'duration'}]
+    with one leg per pair of consecutive waypoints, 'geometry' (encoded polyline or None)}. Backends raise
+    ValueError("Location does not exist") when no route can be found.
+    """
+
+    # Whether results are worth keeping in the route cache
+    cacheable = True
+
+    def route(self, coordinates: List[tuple]) -> Dict:
+        raise NotImplementedError
+
+    def duration_matrix(self, coordinates: List[tuple]) -> List[List[float]]:
+        """Driving seconds between every pair of (lat, lon) points: matrix[i][j] from i to j"""
+        raise NotImplementedError
+
+    async def route_async(self, coordinates: List[tuple]) -> Dict:
+        """Backends without I/O answer directly on the event loop"""
+        return self.route(coordinates)
+
+
+class OSRMRoutingBackend(RoutingBackend):
+    """Routes with an OSRM HTTP server"""
+
+    def __init__(self, url: str = "https://router.project-osrm.org/route/v1/driving", store_geometry: bool = False,
+                 table_url: Optional[str] = None):
+        self.url = url
+        self.store_geometry = store_geometry
+        # OSRM serves its table service next to the route service
+        self.table_url = table_url or url.replace('/route/', '/table/', 1)
+
+    def route(self, coordinates: List[tuple]) -> Dict:
+        try:
+            response = upstream.get(self.route_url(coordinates))
+        except UpstreamError:
+            raise ValueError("Location does not exist")
+        return self.parse_response(response)
+
+    async def route_async(self, coordinates: List[tuple]) -> Dict:
+        try:
+            response = await async_upstream.get(self.route_url(coordinates))
+        except UpstreamError:
+            raise ValueError("Location does not exist")
+        return self.parse_response(response)
+
+    def duration_matrix(self, coordinates: List[tuple]) -> List[List[float]]:
+        waypoints = ';'.join(f"{lon},{lat}" for lat, lon in coordinates)
+        try:
+            response = upstream.get(f"{self.table_url}/{waypoints}?annotations=duration")
+        except UpstreamError:
+            raise ValueError("Location does not exist")
+        if response.status_code == 400:
+            raise ValueError("Location does not exist")
+        response.raise_for_status()
+        table = response.json()
+        # OSRM answers null for pairs it cannot route between
+        if table.get('code') != 'Ok' or any(value is None for row in table['durations'] for value in row):
+            raise ValueError("Location does not exist")
+        return table['durations']
+
+    def route_url(self, coordinates: List[tuple]) -> str:
+        waypoints = [f"{lon},{lat}" for lat, lon in coordinates]
+        # The full-resolution line is only worth transferring when it is kept
+        overview = 'overview=full&geometries=polyline' if self.store_geometry else 'overview=false'
+        return f"{self.url}/{';'.join(waypoints)}?{overview}"
+
+    def parse_response(self, response) -> Dict:
+        if response.status_code == 400:
+            raise ValueError("Location does not exist")
+
+        response.raise_for_status()
+        route_data = response.json()
+
+        if route_data.get('code') != 'Ok':
+            raise ValueError("Location does not exist")
+
+        route = route_data['routes'][0]
+        return {
+            'distance': route['distance'],  # meters
+            'duration': route['duration'],  # seconds
+            'legs': [{'distance': leg['distance'], 'duration': leg['duration']} for leg in route.get('legs', [])],
+            'geometry': route.get('geometry') if self.store_geometry else None,
+        }
+
+
+class GraphRoutingBackend(RoutingBackend):
+    """Routes in-process over a memory-mapped road graph built by `manage.py build_road_graph`"""
+
+    # A query takes milliseconds, less than a database cache lookup
+    cacheable = False
+
+    def __init__(self, path: str):
+        if not path:
+            raise ValueError("ROAD_GRAPH_PATH must be set to use the graph routing backend")
+        self.path = path
+        self._graph = None
+        self._lock = threading.Lock()
+
+    @property
+    def graph(self):
+        # Map the file on first use so importing this module never touches the disk
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    from .road_graph import RoadGraph
+                    self._graph = RoadGraph(self.path)
+        return self._graph
+
+    def route(self, coordinates: List[tuple]) -> Dict:
+        nodes = [self._nearest_node(lat, lon) for lat, lon in coordinates]
+
+        legs = []
+        lines = []
+        for source, target in zip(nodes, nodes[1:]):
+            path = self.graph.shortest_path(source, target)
+            if path is None:
+                raise ValueError("Location does not exist")
+            duration, distance, path_nodes = path
+            legs.append({'distance': distance, 'duration': duration})
+            lines.append([(self.graph.lat[node], self.graph.lon[node]) for node in path_nodes])
+
+        return {
+            'distance': sum(leg['distance'] for leg in legs),
+            'duration': sum(leg['duration'] for leg in legs),
+            'legs': legs,
+            'geometry': encode(line_from_legs(lines)),
+        }
+
+    def duration_matrix(self, coordinates: List[tuple]) -> List[List[float]]:
+        nodes = [self._nearest_node(lat, lon) for lat, lon in coordinates]
+        matrix = []
+        for source in nodes:
+            # One search per row, stopping once every stop is reached
+            durations = self.graph.durations_from(source, nodes)
+            if any(duration == float('inf') for duration in durations.values()):
+                raise ValueError("Location does not exist")
+            matrix.append([durations[target] for target in nodes])
+        return matrix
+
+    def _nearest_node(self, lat: float, lon: float) -> int:
+        node = self.graph.nearest_node(lat, lon)
+        if node is None:
+            raise ValueError("Location does not exist")
+        return node
+
+
+ROUTING_BACKENDS = {
+    'osrm': OSRMRoutingBackend,
+    'graph': GraphRoutingBackend,
+}
+
+def get_routing_backend() -> RoutingBackend:
+    name = getattr(settings, 'ROUTING_BACKEND', 'osrm')
+    if name == 'graph':
+        options = {'path': getattr(settings, 'ROAD_GRAPH_PATH', None)}
+    else:
+        options = {'store_geometry': getattr(settings, 'ROUTE_GEOMETRY', True)}
+        if getattr(settings, 'OSRM_URL', None):
+            options['url'] = settings.OSRM_URL
+        if getattr(settings, 'OSRM_TABLE_URL', None):
+            options['table_url'] = settings.OSRM_TABLE_URL
+    try:
+        backend_class = ROUTING_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown routing backend: {name}")
+    return backend_class(**options)
+
+router = get_routing_backend()
@@ -0,0 +1,76 @@
+"""Helpers for the LogSheet.status_grid encoding.
+
+A grid is a list of [start_minute, end_minute, status] intervals that cover
+the day from minute 0 to 1440 in order, e.g. [[0, 480, "OFF"], [480, 1440, "D"]].
+Sheets written before this encoding used a 24-key dict of hour -> status,
+which is still accepted on input and can be emitted on request.
+"""
+
+from typing import Dict, List
+
+MINUTES_PER_DAY = 24 * 60
+STATUSES = ('OFF', 'SB', 'D', 'ON')
+
+def merge_intervals(intervals: List[list]) -> List[list]:
+    """Drop empty intervals and join neighbours that share a status"""
+    merged = []
+    for start, end, status in intervals:
+        if end <= start:
+            continue
+        if merged and merged[-1][2] == status and merged[-1][1] == start:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end, status])
+    return merged
+
+def is_hourly_grid(grid) -> bool:
+    """Whether the grid uses the legacy {hour: status} shape"""
+    if not isinstance(grid, dict) or len(grid) != 24:
+        return False
+    try:
+        hours = sorted(int(hour) for hour in grid)
+    except (TypeError, ValueError):
+        return False
+    return hours == list(range(24)) and all(status in STATUSES for status in grid.values())
+
+def is_interval_grid(grid) -> bool:
+    """Whether the grid is a well-formed interval list covering the whole day"""
+    if not isinstance(grid, list) or not grid:
+        return False
+    position = 0
+    for interval in grid:
+        if not isinstance(interval, (list, tuple)) or len(interval) != 3:
+            return False
+        start, end, status = interval
+        # Whole minutes only; bool is an int subclass but never a minute
+        if not all(isinstance(bound, int) and not isinstance(bound, bool) for bound in (start, end)):
+            return False
+        if start != position or end <= start or status not in STATUSES:
+            return False
+        position = end
+    return position == MINUTES_PER_DAY
+
+def from_hourly_grid(grid: Dict) -> List[list]:
+    """Convert a legacy {hour: status} dict to intervals"""
+    statuses = {int(hour): status for hour, status in grid.items()}
+    return merge_intervals([[hour * 60, (hour + 1) * 60, statuses[hour]] for hour in range(24)])
+
+def to_hourly_grid(intervals: List[list]) -> Dict[str, str]:
+    """Convert intervals to the legacy {hour: status} dict.
+
+    Each hour takes the status that occupies most of it (the earliest one on a tie).
+    """
+    grid = {}
+    index = 0
+    for hour in range(24):
+        hour_start, hour_end = hour * 60, (hour + 1) * 60
+        while intervals[index][1] <= hour_start:
+            index += 1
+        minutes = {}
+        position = index
+        while position < len(intervals) and intervals[position][0] < hour_end:
+            start, end, status = intervals[position]
+            minutes[status] = minutes.get(status, 0) + min(end, hour_end) - max(start, hour_start)
+            position += 1
+        grid[str(hour)] = max(minutes, key=minutes.get)
+    return grid
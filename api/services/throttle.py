@@ -0,0 +1,139 @@
+"""Client-side rate limiting and request coalescing for upstream services.
+
+TokenBucket keeps a process within an upstream's usage policy (Nominatim asks
+for at most one request per second): callers reserve the next free slot and
+sleep until it comes up, so they are served in arrival order, and callers
+beyond `max_waiters`, or who would wait longer than `max_wait`, are turned
+away at once. SingleFlight lets concurrent lookups of the same key share one
+call instead of each going upstream.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Hashable
+from .timing import metrics
+from .upstream import UpstreamError
+
+
+class ThrottledError(UpstreamError):
+    """Raised instead of queueing a request that would wait too long for its turn"""
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `burst`; each request takes one"""
+
+    def __init__(self, rate: float, burst: int = 1, max_waiters: int = 32, max_wait: float = 10,
+                 name: str = 'upstream'):
+        self.rate = rate
+        self.burst = burst
+        self.max_waiters = max_waiters
+        self.max_wait = max_wait
+        self.name = name
+        # Tokens go negative as callers reserve future slots
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.waiters = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token, returning how long to wait for it; raises ThrottledError if the queue is full"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > 0 and (self.waiters >= self.max_waiters or wait > self.max_wait):
+                rejected = True
+            else:
+                rejected = False
+                self.tokens -= 1
+                if wait > 0:
+                    self.waiters += 1
+        if rejected:
+            metrics.increment('eld_throttle_rejected_total', {'upstream': self.name})
+            raise ThrottledError(f"Too many requests queued for {self.name}")
+        metrics.observe('eld_throttle_wait_seconds', {'upstream': self.name}, wait)
+        return wait
+
+    def _done_waiting(self) -> None:
+        with self._lock:
+            self.waiters -= 1
+
+    def acquire(self) -> float:
+        """Block until a request may be sent; returns the seconds waited"""
+        wait = self._reserve()
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+    async def acquire_async(self) -> float:
+        wait = self._reserve()
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving meanwhile get the same result or exception"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            metrics.increment('eld_coalesced_calls_total', {'flight': self.name})
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines sharing an event loop"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable):
+        key = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            metrics.increment('eld_coalesced_calls_total', {'flight': self.name})
+        # A cancelled caller must not cancel the lookup the others are waiting on
+        return await asyncio.shield(task)
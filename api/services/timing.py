@@ -0,0 +1,178 @@
+"""Per-request phase timing, reported as Server-Timing headers and Prometheus metrics.
+
+TimingMiddleware starts a RequestTimer for sampled requests; code inside the
+request wraps its phases in `with span('geocode'):`. Outside a sampled request
+span() returns a shared no-op context manager, so instrumented code costs one
+context variable lookup when sampling is off.
+"""
+
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current: ContextVar[Optional['RequestTimer']] = ContextVar('request_timer', default=None)
+_NOOP = nullcontext()
+
+
+class RequestTimer:
+    """Durations and query counts per phase of one request"""
+
+    def __init__(self):
+        self.phases: Dict[str, List[float]] = {}  # name -> [seconds, queries]
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def add(self, name: str, seconds: float, queries: int) -> None:
+        phase = self.phases.setdefault(name, [0.0, 0])
+        phase[0] += seconds
+        phase[1] += queries
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Database execute wrapper counting and timing every query of the request"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_seconds += time.perf_counter() - started
+            self.queries += 1
+
+    def server_timing(self, total: float) -> str:
+        entries = [f'{name};dur={seconds * 1000:.1f};desc="{queries} queries"'
+                   for name, (seconds, queries) in self.phases.items()]
+        entries.append(f'db;dur={self.query_seconds * 1000:.1f};desc="{self.queries} queries"')
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+class _Span:
+    __slots__ = ('timer', 'name', 'started', 'queries')
+
+    def __init__(self, timer: RequestTimer, name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.queries = self.timer.queries
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.started
+        queries = self.timer.queries - self.queries
+        self.timer.add(self.name, seconds, queries)
+        metrics.observe('eld_span_duration_seconds', {'span': self.name}, seconds)
+        metrics.increment('eld_span_queries_total', {'span': self.name}, queries)
+        return False
+
+
+def span(name: str):
+    """Time a phase of the current request; a no-op when the request is not sampled"""
+    timer = _current.get()
+    if timer is None:
+        return _NOOP
+    return _Span(timer, name)
+
+
+def start_request() -> Tuple[RequestTimer, object]:
+    timer = RequestTimer()
+    return timer, _current.set(timer)
+
+
+def end_request(token) -> None:
+    _current.reset(token)
+
+
+class MetricsRegistry:
+    """Thread-safe histograms and counters, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[tuple, List]] = {}  # name -> labels -> [bucket counts, sum, count]
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+
+    def observe(self, name: str, labels: Dict[str, str], value: float) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {}).get(key)
+            if series is None:
+                series = self._histograms[name][key] = [[0] * len(BUCKETS), 0.0, 0]
+            for index, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def increment(self, name: str, labels: Dict[str, str], amount: float = 1) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counters = self._counters.setdefault(name, {})
+            counters[key] = counters.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, (buckets, total, count) in sorted(series.items()):
+                    for bound, bucket_count in zip(BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{_labels(key + (('le', f'{bound:g}'),))} {bucket_count}")
+                    lines.append(f"{name}_bucket{_labels(key + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_labels(key)} {total:.6f}")
+                    lines.append(f"{name}_count{_labels(key)} {count}")
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_labels(key)} {value:g}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render_metrics() -> str:
+    """Request and span histograms plus upstream and cache statistics, in the Prometheus text format"""
+    from .geocode_cache import geocode_cache
+    from .route_cache import route_cache
+    from .upstream import upstream
+
+    lines = metrics.render()
+
+    hosts = upstream.stats()
+    for name, field in (('requests', 'requests'), ('errors', 'errors'), ('retries', 'retries'),
+                        ('rejected', 'rejected')):
+        lines.append(f"# TYPE eld_upstream_{name}_total counter")
+        lines.extend(f"eld_upstream_{name}_total{_labels((('host', host),))} {stats[field]}"
+                     for host, stats in sorted(hosts.items()))
+    lines.append("# TYPE eld_upstream_latency_seconds summary")
+    for host, stats in sorted(hosts.items()):
+        for quantile, field in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+            lines.append(f"eld_upstream_latency_seconds{_labels((('host', host), ('quantile', quantile)))} "
+                         f"{stats[field] / 1000:.6f}")
+    lines.append("# TYPE eld_upstream_circuit_open gauge")
+    lines.extend(f"eld_upstream_circuit_open{_labels((('host', host),))} {int(stats['circuit'] != 'closed')}"
+                 for host, stats in sorted(hosts.items()))
+
+    lines.append("# TYPE eld_cache_events_total counter")
+    for cache, stats in (('geocode', geocode_cache.stats()), ('route', route_cache.stats())):
+        for field, value in sorted(stats.items()):
+            if field.endswith('hits') or field.endswith('misses'):
+                lines.append(f"eld_cache_events_total{_labels((('cache', cache), ('event', field)))} {value}")
+    lines.append("# TYPE eld_geocode_cache_memory_entries gauge")
+    lines.append(f"eld_geocode_cache_memory_entries {geocode_cache.stats()['memory_size']}")
+    return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,337 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, transaction
+from ..models import Trip, TripStop, LogSheet
+from ..serializers import TripSerializer, LogSheetSerializer
+from .async_route_planner import AsyncRoutePlanner
+from .geocoding import GeocoderBusy
+from .route_planner import RoutePlanner
+from .duty_summary import save_summaries
+from .log_generator import LogGenerator
+from .stop_ordering import precedence_ok
+from .timing import span
+
+REQUIRED_FIELDS = ['current_location', 'pickup_location', 'dropoff_location', 'current_cycle_hours']
+# Trips planned with a list of stops take it instead of pickup_location and dropoff_location
+MULTI_STOP_REQUIRED_FIELDS = ['current_location', 'current_cycle_hours']
+STOP_KINDS = (TripStop.PICKUP, TripStop.DROPOFF)
+
+
+def normalized_stops(stops: List[Dict]) -> List[Dict]:
+    """The planner's view of validated stops; shipments are compared as strings"""
+    return [
+        {'location': stop['location'], 'kind': stop['kind'],
+         'shipment': None if stop.get('shipment') is None else str(stop['shipment'])}
+        for stop in stops
+    ]
+
+
+def stop_errors(stops, optimize) -> List[str]:
+    """Problems with the stops of a multi-stop plan_route payload"""
+    max_stops = getattr(settings, 'TRIP_MAX_STOPS', 50)
+    if not isinstance(stops, list) or not stops:
+        return ["stops must be a non-empty list"]
+    if len(stops) > max_stops:
+        return [f"At most {max_stops} stops can be planned per trip"]
+    if not isinstance(optimize, bool):
+        return ["optimize_stops must be true or false"]
+    for stop in stops:
+        if (not isinstance(stop, dict) or not isinstance(stop.get('location'), str)
+                or stop.get('kind') not in STOP_KINDS):
+            return ["Each stop needs a location and a kind of pickup or dropoff"]
+        if stop.get('shipment') is not None and (not isinstance(stop['shipment'], (str, int))
+                                                 or len(str(stop['shipment'])) > 64):
+            return ["A stop's shipment must be a string or number of at most 64 characters"]
+    if {stop['kind'] for stop in stops} != set(STOP_KINDS):
+        return ["stops must include at least one pickup and one dropoff"]
+    if not optimize:
+        normalized = normalized_stops(stops)
+        if not precedence_ok(range(len(normalized)), [stop['kind'] for stop in normalized],
+                             [stop['shipment'] for stop in normalized]):
+            return ["Each dropoff must come after the pickups of its shipment"]
+    return []
+
+
+def trip_stops(trip: Trip, route_data: Dict) -> List[TripStop]:
+    """Unsaved TripStop rows for the stops of a multi-stop route, in driving order"""
+    return [
+        TripStop(trip=trip, sequence=stop['sequence'], kind=stop['kind'], location=stop['location'],
+                 shipment=stop['shipment'], latitude=stop['lat'], longitude=stop['lng'])
+        for stop in route_data.get('stops', [])
+    ]
+
+
+def route_response(route_data: Dict) -> Dict:
+    """The route part of a plan_route response; the full line is left to the trip geometry endpoint"""
+    return {key: value for key, value in route_data.items() if key != 'geometry'}
+
+
+class TripPlanningError(Exception):
+    """Raised with the list of user-facing errors when a trip cannot be planned"""
+
+    def __init__(self, errors: List[str], status_code: int = 400):
+        super().__init__(errors)
+        self.errors = errors
+        # 503 when geocoding was busy: the same request may succeed if retried
+        self.status_code = status_code
+
+    def result(self) -> Dict:
+        """The plan_routes item for this error; retryable ones carry their status"""
+        result = {'errors': self.errors}
+        if self.status_code != 400:
+            result['status'] = self.status_code
+        return result
+
+
+class TripPlanningService:
+    """Validates, routes and persists trips for the plan_route endpoints"""
+
+    def __init__(self, context: Optional[Dict] = None):
+        self.context = context or {}
+        self.planner = RoutePlanner()
+        self.log_generator = LogGenerator()
+        self.MAX_ROUTING_WORKERS = getattr(settings, 'PLAN_ROUTES_MAX_WORKERS', 4)
+
+    def validate(self, data) -> float:
+        """Check the request payload and return current_cycle_hours"""
+        errors = []
+        current_cycle_hours = None
+        multi_stop = 'stops' in data
+
+        # Check for missing fields
+        for field in MULTI_STOP_REQUIRED_FIELDS if multi_stop else REQUIRED_FIELDS:
+            if field not in data:
+                errors.append(f"{field} is required")
+        if multi_stop:
+            errors.extend(stop_errors(data['stops'], data.get('optimize_stops', False)))
+
+        # Validate current_cycle_hours
+        if 'current_cycle_hours' in data:
+            try:
+                current_cycle_hours = float(data['current_cycle_hours'])
+                if current_cycle_hours < 0:
+                    errors.append("Hours must be a positive number")
+            except (ValueError, TypeError):
+                errors.append("Hours must be a valid number")
+
+        if errors:
+            raise TripPlanningError(errors)
+        return current_cycle_hours
+
+    def route_errors(self, error: ValueError) -> List[str]:
+        """Translate a RoutePlanner error into user-facing messages"""
+        error_message = str(error)
+        if "cannot be the same" in error_message:
+            if "Pickup location and destination" in error_message:
+                return ["Destination must be different from pickup location"]
+            if "Current location and destination" in error_message:
+                return ["Destination must be different from current location"]
+            return []
+        return ["Location does not exist"]
+
+    def route_error(self, error: ValueError) -> TripPlanningError:
+        """The TripPlanningError for a RoutePlanner error; busy geocoding is a retryable 503"""
+        if isinstance(error, GeocoderBusy):
+            return TripPlanningError([str(error)], status_code=503)
+        return TripPlanningError(self.route_errors(error))
+
+    def plan(self, data) -> Dict:
+        """Plan and save a single trip, returning the plan_route response body"""
+        current_cycle_hours = self.validate(data)
+        try:
+            if 'stops' in data:
+                route_data = self._calculate_multi_stop_route(data, current_cycle_hours)
+            else:
+                route_data = self.planner.calculate_route(
+                    data['current_location'],
+                    data['pickup_location'],
+                    data['dropoff_location'],
+                    current_cycle_hours
+                )
+        except ValueError as e:
+            raise self.route_error(e)
+
+        return self._save(data, route_data)
+
+    def _calculate_multi_stop_route(self, data, current_cycle_hours: float) -> Dict:
+        return self.planner.calculate_multi_stop_route(
+            data['current_location'],
+            normalized_stops(data['stops']),
+            current_cycle_hours,
+            optimize=data.get('optimize_stops', False)
+        )
+
+    def _save(self, data, route_data: Dict) -> Dict:
+        trip_serializer = self._trip_serializer(data, route_data)
+        if not trip_serializer.is_valid():
+            raise TripPlanningError(list(trip_serializer.errors.values()))
+
+        # Save the trip and its log sheets together so a failure leaves no partial data
+        with span('db_save'), transaction.atomic():
+            trip = trip_serializer.save(route_geometry=route_data.get('geometry'))
+            TripStop.objects.bulk_create(trip_stops(trip, route_data))
+            log_sheets = self.log_generator.generate_logs(trip, route_data)
+
+        with span('serialize'):
+            return {
+                'trip': trip_serializer.data,
+                'route': route_response(route_data),
+                'log_sheets': LogSheetSerializer(log_sheets, many=True, context=self.context).data
+            }
+
+    def plan_many(self, items: List) -> List[Dict]:
+        """Plan a batch of trips.
+
+        Location strings are geocoded once across the whole batch, routes are
+        computed with bounded concurrency and all rows are written in one
+        transaction. Returns one result per item, in order: the plan_route
+        body on success or {'errors': [...]} on failure.
+        """
+        results = [None] * len(items)
+        pending = []  # (index, data, current_cycle_hours)
+        for index, data in enumerate(items):
+            try:
+                if not isinstance(data, dict):
+                    raise TripPlanningError(["Each trip must be an object"])
+                pending.append((index, data, self.validate(data)))
+            except TripPlanningError as e:
+                results[index] = {'errors': e.errors}
+
+        # Geocode every distinct location in the batch in one concurrent pass
+        locations = set()
+        routable = []
+        for index, data, current_cycle_hours in pending:
+            trip_locations = self._trip_locations(data)
+            if all(isinstance(location, str) and self.planner._validate_location(location)
+                   for location in trip_locations):
+                locations.update(trip_locations)
+                routable.append((index, data, current_cycle_hours))
+            else:
+                results[index] = {'errors': ["Location does not exist"]}
+        with span('geocode'):
+            coordinates = self.planner._geocode_many(list(locations)) if locations else {}
+
+        with span('route'):
+            routed = self._route_many(routable, coordinates)
+
+        planned = []  # (index, serializer, route_data)
+        for index, data, outcome in routed:
+            if isinstance(outcome, TripPlanningError):
+                results[index] = outcome.result()
+                continue
+            trip_serializer = self._trip_serializer(data, outcome)
+            if trip_serializer.is_valid():
+                planned.append((index, trip_serializer, outcome))
+            else:
+                results[index] = {'errors': list(trip_serializer.errors.values())}
+
+        with span('db_save'):
+            trips = self._save_many(planned)
+        with span('serialize'):
+            for (index, _, route_data), trip in zip(planned, trips):
+                results[index] = {
+                    'trip': TripSerializer(trip, context=self.context).data,
+                    'route': route_response(route_data),
+                    'log_sheets': LogSheetSerializer(trip.log_sheets.all(), many=True, context=self.context).data
+                }
+        return results
+
+    def _trip_locations(self, data) -> List:
+        """Every location a validated payload names, starting with the current location"""
+        if 'stops' in data:
+            return [data['current_location']] + [stop['location'] for stop in data['stops']]
+        return [data['current_location'], data['pickup_location'], data['dropoff_location']]
+
+    def _trip_serializer(self, data, route_data: Dict) -> TripSerializer:
+        fields = {
+            **data,
+            'total_distance': route_data['total_distance'],
+            'estimated_duration': route_data['total_duration']
+        }
+        if route_data.get('stops'):
+            # A multi-stop trip's pickup and dropoff are its first pickup and last dropoff
+            fields['pickup_location'] = next(stop['location'] for stop in route_data['stops']
+                                             if stop['kind'] == TripStop.PICKUP)
+            fields['dropoff_location'] = [stop['location'] for stop in route_data['stops']
+                                          if stop['kind'] == TripStop.DROPOFF][-1]
+        return TripSerializer(data=fields, context=self.context)
+
+    def _route_many(self, pending: List[Tuple], coordinates: Dict) -> List[Tuple]:
+        """Route each pending trip concurrently, returning (index, data, route_data or error)"""
+        def route(item):
+            index, data, current_cycle_hours = item
+            trip_locations = self._trip_locations(data)
+            try:
+                for location in trip_locations:
+                    if isinstance(coordinates[location], Exception):
+                        raise coordinates[location]
+                if 'stops' in data:
+                    return index, data, self.planner.calculate_multi_stop_route_from_coordinates(
+                        data['current_location'], normalized_stops(data['stops']), current_cycle_hours, coordinates,
+                        optimize=data.get('optimize_stops', False)
+                    )
+                return index, data, self.planner.calculate_route_from_coordinates(
+                    *trip_locations, current_cycle_hours, coordinates
+                )
+            except ValueError as e:
+                return index, data, self.route_error(e)
+            finally:
+                # Route cache backends may touch the database from this worker thread
+                connections.close_all()
+
+        if not pending:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.MAX_ROUTING_WORKERS, len(pending)),
+                                thread_name_prefix='plan-routes') as executor:
+            return list(executor.map(route, pending))
+
+    def _save_many(self, planned: List[Tuple]) -> List[Trip]:
+        """Insert all trips, then all of their log sheets and duty summaries, in one transaction"""
+        if not planned:
+            return []
+        with transaction.atomic():
+            trips = Trip.objects.bulk_create([
+                Trip(**trip_serializer.validated_data, route_geometry=route_data.get('geometry'))
+                for _, trip_serializer, route_data in planned
+            ])
+            TripStop.objects.bulk_create([
+                stop for trip, (_, _, route_data) in zip(trips, planned) for stop in trip_stops(trip, route_data)
+            ])
+            save_summaries(LogSheet.objects.bulk_create([
+                log_sheet
+                for trip, (_, _, route_data) in zip(trips, planned)
+                for log_sheet in self.log_generator.build_logs(trip, route_data)
+            ]))
+
+        # Reload with log sheets prefetched so serializing the batch costs two queries, not one per trip
+        saved = Trip.objects.defer('route_geometry').prefetch_related('log_sheets').in_bulk([trip.id for trip in trips])
+        return [saved[trip.id] for trip in trips]
+
+
+class AsyncTripPlanningService(TripPlanningService):
+    """TripPlanningService for async views: upstream calls are awaited on the event loop"""
+
+    def __init__(self, context: Optional[Dict] = None):
+        super().__init__(context)
+        self.planner = AsyncRoutePlanner()
+
+    async def plan_async(self, data) -> Dict:
+        """Async counterpart of plan(), returning the same response body"""
+        if 'stops' in data:
+            # Multi-stop planning has no async upstream path; run it, and the save, off the event loop
+            return await sync_to_async(self.plan)(data)
+        current_cycle_hours = self.validate(data)
+        try:
+            route_data = await self.planner.calculate_route_async(
+                data['current_location'],
+                data['pickup_location'],
+                data['dropoff_location'],
+                current_cycle_hours
+            )
+        except ValueError as e:
+            raise self.route_error(e)
+
+        # Django's async ORM cannot run a transaction yet, so the atomic save runs as one sync unit
+        return await sync_to_async(self._save)(data, route_data)
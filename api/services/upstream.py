@@ -0,0 +1,276 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+from django.conf import settings
+# Not deferred like httpx: rest_framework.compat imports requests at start-up whenever it is installed
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream service cannot be reached"""
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised without contacting the upstream while its circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single trial call through after a cool-down"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class LatencyStats:
+    """Request counters and a window of recent latencies for one host"""
+
+    def __init__(self, window: int = 512):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self.requests += 1
+            self.total_seconds += seconds
+            self.samples.append(seconds)
+            if error:
+                self.errors += 1
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            samples = sorted(self.samples)
+            requests_count = self.requests
+            snapshot = {
+                'requests': requests_count,
+                'errors': self.errors,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'mean_ms': 1000 * self.total_seconds / requests_count if requests_count else 0.0,
+            }
+        for name, quantile in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+            snapshot[name] = 1000 * samples[min(len(samples) - 1, int(quantile * len(samples)))] if samples else 0.0
+        return snapshot
+
+
+class UpstreamClient:
+    """Shared HTTP client for external services.
+
+    Keeps one pooled keep-alive session per host, enforces connect/read
+    timeouts, retries 5xx/429 responses and connection errors with jittered
+    exponential backoff, and trips a per-host circuit breaker when a service
+    keeps failing.
+    """
+
+    def __init__(self, connect_timeout: float = 3.05, read_timeout: float = 10, max_retries: int = 2,
+                 backoff: float = 0.25, pool_size: int = 10, failure_threshold: int = 5,
+                 reset_timeout: float = 30):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._sessions = {}
+        self._breakers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None,
+            limiter=None) -> requests.Response:
+        """GET with retries; every attempt, retries included, first takes a token from `limiter` if given"""
+        host = urlsplit(url).netloc
+        session, breaker, stats = self._for_host(host)
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                stats.count('rejected')
+                raise CircuitOpenError(f"Circuit open for {host}")
+
+            if limiter is not None:
+                limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                stats.record(time.perf_counter() - started, error=True)
+                breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise UpstreamError(f"Request to {host} failed: {e}") from e
+            else:
+                failed = response.status_code in RETRY_STATUSES
+                stats.record(time.perf_counter() - started, error=failed)
+                if not failed:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                if attempt >= self.max_retries:
+                    return response
+
+            attempt += 1
+            stats.count('retries')
+            time.sleep(self._backoff_delay(attempt))
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-host latency and error statistics, including circuit breaker state"""
+        with self._lock:
+            hosts = list(self._stats)
+        return {
+            host: {**self._stats[host].snapshot(), 'circuit': self._breakers[host].state}
+            for host in hosts
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._breakers.clear()
+            self._stats.clear()
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # Full jitter keeps retries from concurrent workers from arriving in lock-step
+        return random.uniform(0, self.backoff * (2 ** (attempt - 1)))
+
+    def _for_host(self, host: str):
+        breaker, stats = self.host_state(host)
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[host] = session
+            return self._sessions[host], breaker, stats
+
+    def host_state(self, host: str):
+        """Circuit breaker and stats for a host, shared with AsyncUpstreamClient"""
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._stats[host] = LatencyStats()
+            return self._breakers[host], self._stats[host]
+
+
+class AsyncUpstreamClient:
+    """Non-blocking counterpart of UpstreamClient for the async planning path.
+
+    Uses one pooled httpx.AsyncClient per event loop and shares circuit
+    breakers and latency stats with the synchronous client, so both paths
+    see the same upstream health.
+    """
+
+    def __init__(self, sync_client: UpstreamClient):
+        self.sync_client = sync_client
+        self._clients = weakref.WeakKeyDictionary()
+
+    async def get(self, url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None, limiter=None):
+        # Imported on first use: only the async endpoint needs httpx, so other cold starts never load it
+        import httpx
+
+        host = urlsplit(url).netloc
+        breaker, stats = self.sync_client.host_state(host)
+        client = self._client()
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                stats.count('rejected')
+                raise CircuitOpenError(f"Circuit open for {host}")
+
+            if limiter is not None:
+                await limiter.acquire_async()
+            started = time.perf_counter()
+            try:
+                response = await client.get(url, params=params, headers=headers)
+            except httpx.HTTPError as e:
+                stats.record(time.perf_counter() - started, error=True)
+                breaker.record_failure()
+                if attempt >= self.sync_client.max_retries:
+                    raise UpstreamError(f"Request to {host} failed: {e}") from e
+            else:
+                failed = response.status_code in RETRY_STATUSES
+                stats.record(time.perf_counter() - started, error=failed)
+                if not failed:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                if attempt >= self.sync_client.max_retries:
+                    return response
+
+            attempt += 1
+            stats.count('retries')
+            await asyncio.sleep(self.sync_client._backoff_delay(attempt))
+
+    def _client(self):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            connect_timeout, read_timeout = self.sync_client.timeout
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=self.sync_client.pool_size * 4,
+                                    max_keepalive_connections=self.sync_client.pool_size),
+            )
+            self._clients[loop] = client
+        return client
+
+upstream = UpstreamClient(
+    connect_timeout=getattr(settings, 'UPSTREAM_CONNECT_TIMEOUT', 3.05),
+    read_timeout=getattr(settings, 'UPSTREAM_READ_TIMEOUT', 10),
+    max_retries=getattr(settings, 'UPSTREAM_MAX_RETRIES', 2),
+    backoff=getattr(settings, 'UPSTREAM_RETRY_BACKOFF', 0.25),
+    pool_size=getattr(settings, 'UPSTREAM_POOL_SIZE', 10),
+    failure_threshold=getattr(settings, 'UPSTREAM_BREAKER_THRESHOLD', 5),
+    reset_timeout=getattr(settings, 'UPSTREAM_BREAKER_RESET', 30),
+)
+async_upstream = AsyncUpstreamClient(upstream)
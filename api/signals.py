@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import LogSheet, Trip
+
+
+@receiver(post_save, sender=LogSheet)
+@receiver(post_delete, sender=LogSheet)
+def drop_rendered_log_graph(sender, instance, **kwargs):
+    """Forget cached graph overlays of a sheet that changed or was deleted"""
+    from .services.log_graph import log_graph_renderer
+
+    log_graph_renderer.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=LogSheet)
+def refresh_duty_summary(sender, instance, raw=False, **kwargs):
+    """Recount a sheet's duty-status minutes when it is saved on its own (bulk inserts write their own)"""
+    if raw:
+        return
+    from .services.duty_summary import refresh_summary
+
+    refresh_summary(instance)
+
+
+@receiver(post_save, sender=Trip)
+@receiver(post_delete, sender=Trip)
+def drop_simplified_route(sender, instance, **kwargs):
+    """Forget simplified lines of a trip whose route changed or that was deleted"""
+    from .services.route_geometry import route_geometry_cache
+
+    route_geometry_cache.invalidate(instance.pk)
+
+
+@receiver(connection_created)
+def limit_transaction_statement_time(sender, connection, **kwargs):
+    """Behind a transaction-mode pooler, bound each transaction's statements instead of the session's"""
+    timeout = getattr(settings, 'DB_STATEMENT_TIMEOUT', 0)
+    if connection.vendor == 'postgresql' and getattr(settings, 'DB_POOL_MODE', 'session') == 'transaction' and timeout:
+        from .db import install_statement_timeout
+
+        install_statement_timeout(connection, timeout)
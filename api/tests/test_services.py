@@ -0,0 +1,649 @@
+import asyncio
+import itertools
+import math
+import io
+import os
+import random
+import threading
+import time
+import tempfile
+from datetime import datetime
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from ..benchmarks.connections import bench_connection_reuse
+from ..benchmarks.harness import bench_plan_route, bench_log_generator, compare, standin_upstreams
+from ..benchmarks.standins import StandInServer
+from ..benchmarks.startup import StartupBenchmark
+from ..db import TransactionStatementTimeout
+from ..models import GeocodeCache, Trip
+from ..services.gazetteer import Gazetteer, build_gazetteer
+from ..services.geocode_cache import geocode_cache
+from ..services.geocoding import GazetteerGeocoder, Geocoder, GeocoderBusy
+from ..services.hos import HOSSimulator, required_stops
+from ..services.log_generator import LogGenerator
+from ..services.road_graph import RoadGraph, build_road_graph
+from ..services.route_cache import (
+    route_cache, route_cache_key, DatabaseRouteCacheBackend, FileRouteCacheBackend
+)
+from ..services.route_geometry import decode, encode, line_from_legs, simplify, zoom_tolerance
+from ..services.route_planner import RoutePlanner, LocationNotFound, duration_matrix_cache
+from ..services.routing import GraphRoutingBackend
+from ..services.stop_ordering import order_stops, path_duration, precedence_ok
+from ..services.throttle import AsyncSingleFlight, SingleFlight, ThrottledError, TokenBucket
+from ..services.timing import metrics
+from ..services.upstream import UpstreamClient, CircuitOpenError
+
+class RoutePlannerGeocodingTests(TestCase):
+    def setUp(self):
+        self.planner = RoutePlanner()
+        geocode_cache.clear()
+
+    def test_duplicate_locations_resolved_once(self):
+        """Test that equivalent location strings are only geocoded once"""
+        with mock.patch.object(self.planner, '_get_coordinates', return_value=(40.7, -74.0)) as geocode:
+            coordinates = self.planner._get_coordinates_many(['New York, NY', ' new york,  NY', 'Boston, MA'])
+
+        self.assertEqual(geocode.call_count, 2)
+        self.assertEqual(coordinates['New York, NY'], coordinates[' new york,  NY'])
+
+    def test_locations_resolved_concurrently(self):
+        """Test that distinct locations are geocoded in parallel"""
+        barrier = threading.Barrier(3, timeout=2)
+
+        def geocode(location):
+            barrier.wait()
+            return (1.0, 2.0)
+
+        with mock.patch.object(self.planner, '_get_coordinates', side_effect=geocode):
+            coordinates = self.planner._get_coordinates_many(['New York, NY', 'Boston, MA', 'Philadelphia, PA'])
+
+        self.assertEqual(len(coordinates), 3)
+
+    def test_geocoding_failure_raises_value_error(self):
+        """Test that a failed lookup surfaces as a location error"""
+        with mock.patch.object(self.planner, '_get_coordinates', side_effect=ValueError("Location does not exist")):
+            with self.assertRaises(ValueError):
+                self.planner._get_coordinates_many(['Nowhere', 'Boston, MA'])
+
+    def test_throttled_and_slow_lookups_reported_busy(self):
+        """Test that lookups turned away by the rate limit or past GEOCODE_TIMEOUT are retryable, not missing"""
+        class PacedGeocoder(Geocoder):
+            # One token, then every caller would have to wait longer than max_wait
+            limiter = TokenBucket(rate=0.001, burst=1, max_wait=0)
+
+            def geocode(self, location):
+                self.limiter.acquire()
+                return (1.0, 2.0)
+
+        self.planner.remote_geocoders = [PacedGeocoder()]
+        results = self.planner._geocode_many(['New York, NY', 'Boston, MA', 'Philadelphia, PA'])
+        self.assertEqual(list(results.values())[0], (1.0, 2.0))
+        for result in list(results.values())[1:]:
+            self.assertIsInstance(result, GeocoderBusy)
+            self.assertEqual(str(result), "Geocoding is busy, try again later")
+        with self.assertRaises(GeocoderBusy):
+            self.planner._get_coordinates_many(['Boston, MA'])
+
+        self.planner.GEOCODE_TIMEOUT = 0.05
+        with mock.patch.object(self.planner, '_get_coordinates', side_effect=lambda location: time.sleep(0.5)):
+            self.assertIsInstance(self.planner._geocode_many(['Chicago, IL'])['Chicago, IL'], GeocoderBusy)
+
+class GeocodeCacheTests(TestCase):
+    def setUp(self):
+        self.planner = RoutePlanner()
+        geocode_cache.clear()
+
+    def test_cached_location_skips_upstream(self):
+        """Test that a resolved location is served from cache on the next lookup"""
+        with mock.patch.object(self.planner, '_get_coordinates', return_value=(42.36, -71.06)) as geocode:
+            self.planner._get_coordinates_many(['Boston, MA'])
+            self.planner._get_coordinates_many(['boston, ma'])
+
+        self.assertEqual(geocode.call_count, 1)
+        self.assertEqual(geocode_cache.stats()['memory_hits'], 1)
+        self.assertTrue(GeocodeCache.objects.filter(query='boston, ma', latitude=42.36).exists())
+
+    def test_database_tier_used_after_memory_eviction(self):
+        """Test that entries persisted to the database survive an in-process cache reset"""
+        with mock.patch.object(self.planner, '_get_coordinates', return_value=(42.36, -71.06)):
+            self.planner._get_coordinates_many(['Boston, MA'])
+        geocode_cache.clear()
+
+        with mock.patch.object(self.planner, '_get_coordinates') as geocode:
+            coordinates = self.planner._get_coordinates_many(['Boston, MA'])
+
+        geocode.assert_not_called()
+        self.assertEqual(coordinates['Boston, MA'], (42.36, -71.06))
+        self.assertEqual(geocode_cache.stats()['db_hits'], 1)
+
+    def test_missing_location_is_negatively_cached(self):
+        """Test that a location that does not exist is not looked up again"""
+        with mock.patch.object(self.planner, '_get_coordinates', side_effect=LocationNotFound("Location does not exist")) as geocode:
+            for _ in range(2):
+                with self.assertRaises(ValueError):
+                    self.planner._get_coordinates_many(['Atlantis'])
+
+        self.assertEqual(geocode.call_count, 1)
+        self.assertTrue(GeocodeCache.objects.filter(query='atlantis', latitude__isnull=True).exists())
+
+class RouteCacheTests(TestCase):
+    def setUp(self):
+        self.planner = RoutePlanner()
+        self.route = {'distance': 1000.0, 'duration': 600.0, 'legs': [], 'geometry': None}
+        route_cache.clear()
+
+    def test_nearby_coordinates_share_a_key(self):
+        """Test that waypoints within the coordinate tolerance map to the same key"""
+        self.assertEqual(
+            route_cache_key([(40.712801, -74.006001), (42.36, -71.06)]),
+            route_cache_key([(40.712849, -74.005951), (42.36, -71.06)]),
+        )
+        self.assertNotEqual(
+            route_cache_key([(40.7128, -74.0060)]),
+            route_cache_key([(40.7138, -74.0060)]),
+        )
+
+    def test_repeated_lane_served_from_cache(self):
+        """Test that routing the same lane twice only fetches from OSRM once"""
+        coordinates = [(40.7128, -74.0060), (42.3601, -71.0589)]
+        with mock.patch.object(self.planner, '_fetch_route', return_value=self.route) as fetch:
+            self.planner._get_route(coordinates)
+            self.assertEqual(self.planner._get_route(coordinates), self.route)
+
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_database_backend_round_trip(self):
+        """Test storing and evicting routes in the database backend"""
+        backend = DatabaseRouteCacheBackend(ttl=3600, max_entries=1)
+        backend.set('a', self.route)
+        backend.set('b', self.route)
+        self.assertEqual(backend.get('b')['distance'], 1000.0)
+
+        backend.evict()
+        self.assertIsNone(backend.get('a'))
+        self.assertIsNotNone(backend.get('b'))
+
+    def test_file_backend_round_trip(self):
+        """Test storing and expiring routes in the file backend"""
+        with tempfile.TemporaryDirectory() as directory:
+            backend = FileRouteCacheBackend(ttl=3600, max_entries=10, directory=directory)
+            backend.set('a', self.route)
+            self.assertEqual(backend.get('a'), self.route)
+
+            backend.ttl = -1
+            self.assertIsNone(backend.get('a'))
+
+class UpstreamClientTests(TestCase):
+    def setUp(self):
+        self.client = UpstreamClient(max_retries=2, backoff=0, failure_threshold=3, reset_timeout=60)
+        self.url = 'https://upstream.test/search'
+
+    def _response(self, status_code):
+        return mock.Mock(status_code=status_code)
+
+    def test_retries_server_errors(self):
+        """Test that 5xx responses are retried until one succeeds"""
+        with mock.patch('requests.Session.get', side_effect=[self._response(503), self._response(200)]) as get:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(get.call_args.kwargs['timeout'], self.client.timeout)
+        stats = self.client.stats()['upstream.test']
+        self.assertEqual((stats['requests'], stats['errors'], stats['retries']), (2, 1, 1))
+
+    def test_client_errors_are_not_retried(self):
+        """Test that a 4xx response is returned immediately"""
+        with mock.patch('requests.Session.get', return_value=self._response(400)) as get:
+            self.assertEqual(self.client.get(self.url).status_code, 400)
+
+        self.assertEqual(get.call_count, 1)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        """Test that the breaker fails fast once the failure threshold is reached"""
+        with mock.patch('requests.Session.get', return_value=self._response(502)) as get:
+            self.client.get(self.url)
+            with self.assertRaises(CircuitOpenError):
+                self.client.get(self.url)
+
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(self.client.stats()['upstream.test']['circuit'], 'open')
+
+class ThrottleTests(TestCase):
+    def test_token_bucket_queues_in_arrival_order(self):
+        """Test that callers reserve successive slots and are turned away once the wait queue is full"""
+        bucket = TokenBucket(rate=10, burst=1, max_waiters=2, max_wait=5, name='test')
+        waits = [bucket._reserve() for _ in range(3)]
+
+        self.assertEqual(waits[0], 0)
+        self.assertAlmostEqual(waits[1], 0.1, delta=0.01)
+        self.assertAlmostEqual(waits[2], 0.2, delta=0.01)
+        with self.assertRaises(ThrottledError):
+            bucket._reserve()
+
+    def test_token_bucket_rejects_long_waits(self):
+        """Test that a request that would wait past max_wait fails at once"""
+        bucket = TokenBucket(rate=1, burst=1, max_waiters=10, max_wait=0.5, name='test')
+        self.assertEqual(bucket.acquire(), 0)
+        with self.assertRaises(ThrottledError):
+            bucket.acquire()
+
+    def test_upstream_retries_take_tokens(self):
+        """Test that every attempt, retries included, is paced by the limiter"""
+        client = UpstreamClient(max_retries=2, backoff=0)
+        limiter = mock.Mock()
+        with mock.patch('requests.Session.get', side_effect=[mock.Mock(status_code=429), mock.Mock(status_code=200)]):
+            client.get('https://upstream.test/search', limiter=limiter)
+        self.assertEqual(limiter.acquire.call_count, 2)
+
+    def test_single_flight_shares_one_call(self):
+        """Test that callers arriving while a key is in flight get its result without calling again"""
+        flight = SingleFlight('test-share')
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def lookup():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return (40.71, -74.0)
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('new york, ny', lookup)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do('new york, ny', lookup)))
+                     for _ in range(4)]
+        for follower in followers:
+            follower.start()
+        coalesced = 'eld_coalesced_calls_total{flight="test-share"} 4'
+        deadline = time.monotonic() + 5
+        while coalesced not in metrics.render() and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [(40.71, -74.0)] * 5)
+        # The key is free again once the call finished
+        self.assertEqual(flight.do('new york, ny', lambda: 'again'), 'again')
+
+    def test_single_flight_shares_errors(self):
+        """Test that a failed lookup raises its error in every waiting caller"""
+        flight = SingleFlight('test-errors')
+        with self.assertRaises(LocationNotFound):
+            flight.do('atlantis', mock.Mock(side_effect=LocationNotFound("Location does not exist")))
+
+        async def lookup():
+            await asyncio.sleep(0.01)
+            raise LocationNotFound("Location does not exist")
+
+        async def lookup_twice():
+            async_flight = AsyncSingleFlight('test-errors-async')
+            counted = mock.AsyncMock(side_effect=lookup)
+            outcomes = await asyncio.gather(async_flight.do('atlantis', counted), async_flight.do('atlantis', counted),
+                                            return_exceptions=True)
+            return counted.await_count, outcomes
+
+        count, outcomes = asyncio.run(lookup_twice())
+        self.assertEqual(count, 1)
+        self.assertTrue(all(isinstance(outcome, LocationNotFound) for outcome in outcomes))
+
+
+class TransactionStatementTimeoutTests(TestCase):
+    def _execute(self, in_atomic_block, transaction_status):
+        wrapper = TransactionStatementTimeout(5000)
+        db = mock.Mock(in_atomic_block=in_atomic_block)
+        db.connection.info.transaction_status = transaction_status
+        cursor = mock.Mock()
+        execute = mock.Mock(return_value='result')
+        result = wrapper(execute, 'SELECT 1', None, False, {'connection': db, 'cursor': cursor})
+        self.assertEqual(result, 'result')
+        execute.assert_called_once()
+        return cursor.cursor.execute.call_args_list
+
+    def test_sets_timeout_when_transaction_starts(self):
+        """Test that the first statement of an atomic block is preceded by SET LOCAL statement_timeout"""
+        self.assertEqual(self._execute(True, 0), [mock.call('SET LOCAL statement_timeout = 5000')])
+
+    def test_skips_open_transactions_and_autocommit(self):
+        """Test that later statements in the transaction and autocommit statements run unchanged"""
+        self.assertEqual(self._execute(True, 2), [])
+        self.assertEqual(self._execute(False, 0), [])
+
+
+class RouteGeometryTests(TestCase):
+    def test_polyline_round_trip(self):
+        """Test the encoding against the reference example and that decoding reverses it"""
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        self.assertEqual(encode(points), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(decode(encode(points)), points)
+        self.assertEqual(decode(''), [])
+
+    def test_simplify_keeps_corners(self):
+        """Test that Douglas-Peucker drops points near the line but keeps turns larger than the tolerance"""
+        # East for ~11 km with 10 m jitter, then north for ~11 km
+        points = [(40.0 + (0.0001 if index % 2 else 0), -75.0 + index * 0.001) for index in range(100)]
+        points += [(40.0 + index * 0.001, -75.0 + 99 * 0.001) for index in range(1, 100)]
+        self.assertEqual(simplify(points, 50), [points[0], points[99], points[-1]])
+        # Below the jitter every eastward point stays; the straight northward run still collapses
+        self.assertEqual(simplify(points, 5), points[:100] + [points[-1]])
+        self.assertEqual(simplify(points, 0), points)
+
+    def test_zoom_tolerance_and_legs(self):
+        """Test that a pixel halves with each zoom level and legs join without repeating shared points"""
+        self.assertAlmostEqual(zoom_tolerance(0, 0), 156543.03, places=2)
+        self.assertAlmostEqual(zoom_tolerance(11, 60), zoom_tolerance(10, 60) / 2)
+        self.assertEqual(line_from_legs([[(1, 1), (2, 2)], [(2, 2), (3, 3)], [(5, 5)]]),
+                         [(1, 1), (2, 2), (3, 3), (5, 5)])
+
+
+class StopOrderingTests(TestCase):
+    def _problem(self, stops, seed):
+        """A random asymmetric travel-time matrix over a 500 km square, with pickup/dropoff pairs"""
+        rng = random.Random(seed)
+        points = [(rng.uniform(0, 500), rng.uniform(0, 500)) for _ in range(stops + 1)]
+        matrix = [[math.dist(a, b) * rng.uniform(1.0, 1.1) for b in points] for a in points]
+        kinds = [None] + ['pickup' if index % 2 else 'dropoff' for index in range(1, stops + 1)]
+        shipments = [None] + [(index + 1) // 2 for index in range(1, stops + 1)]
+        return matrix, kinds, shipments
+
+    def test_close_to_best_order(self):
+        """Test that the heuristic order is feasible and near the best of every feasible permutation"""
+        ratios = []
+        for seed in range(20):
+            matrix, kinds, shipments = self._problem(6, seed)
+            path = [0] + order_stops(matrix, kinds, shipments)
+            self.assertEqual(sorted(path), list(range(7)))
+            self.assertTrue(precedence_ok(path, kinds, shipments))
+            best = min(path_duration(matrix, (0,) + order) for order in itertools.permutations(range(1, 7))
+                       if precedence_ok((0,) + order, kinds, shipments))
+            ratios.append(path_duration(matrix, path) / best)
+        self.assertLess(max(ratios), 1.25)
+        self.assertLess(sum(ratios) / len(ratios), 1.05)
+
+    def test_dozens_of_stops_quickly(self):
+        """Test that 60 stops (30 shipments) are ordered feasibly well within a second"""
+        matrix, kinds, shipments = self._problem(60, 1)
+        started = time.perf_counter()
+        order = order_stops(matrix, kinds, shipments)
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertTrue(precedence_ok([0] + order, kinds, shipments))
+
+    def test_planner_fetches_one_matrix(self):
+        """Test that an optimized trip makes one table and one route request, and reuses the matrix"""
+        stops = [
+            {'location': 'Dropoff A', 'kind': 'dropoff', 'shipment': 'a'},
+            {'location': 'Pickup B', 'kind': 'pickup', 'shipment': 'b'},
+            {'location': 'Pickup A', 'kind': 'pickup', 'shipment': 'a'},
+            {'location': 'Dropoff B', 'kind': 'dropoff', 'shipment': 'b'},
+        ]
+        with StandInServer() as standin, standin_upstreams(standin):
+            # Along a parallel: A is picked up 100 km east and dropped 400 km east, B at 200 and 300 km
+            for name, kilometers in (('Start', 0), ('Pickup A', 100), ('Pickup B', 200), ('Dropoff B', 300),
+                                     ('Dropoff A', 400)):
+                standin.add_place(name, 40.0, -100.0 + kilometers / 85.2)
+            planner = RoutePlanner()
+            route = planner.calculate_multi_stop_route('Start', stops, 0, optimize=True)
+            requests = standin.requests
+            planner.calculate_multi_stop_route('Start', stops, 0, optimize=True)
+            repeat_requests = standin.requests - requests
+            cached_matrices = len(duration_matrix_cache)
+
+        self.assertEqual([stop['location'] for stop in route['stops']],
+                         ['Pickup A', 'Pickup B', 'Dropoff B', 'Dropoff A'])
+        self.assertEqual([stop['sequence'] for stop in route['stops']], [1, 2, 3, 4])
+        self.assertEqual([stop['type'] for stop in route['required_stops']][:4],
+                         ['pickup', 'pickup', 'dropoff', 'dropoff'])
+        # Five geocodes, one table, one route; the repeat hits every cache
+        self.assertEqual(requests, 7)
+        self.assertEqual(repeat_requests, 0)
+        self.assertEqual(cached_matrices, 1)
+
+
+class HOSSimulatorTests(TestCase):
+    def setUp(self):
+        self.start = datetime(2025, 1, 6, 8, 0)
+
+    def _minutes(self, segments, kind):
+        return sum((s['end'] - s['start']).total_seconds() / 60 for s in segments if s['kind'] == kind)
+
+    def test_short_trip_needs_no_rest(self):
+        """Test that a short trip is driving plus pickup and dropoff only"""
+        segments = HOSSimulator().simulate([(1, 'pickup'), (3, 'dropoff')], start=self.start)
+        self.assertEqual([s['kind'] for s in segments], ['driving', 'pickup', 'driving', 'dropoff'])
+        self.assertEqual(segments[-1]['end'], datetime(2025, 1, 6, 14, 0))
+
+    def test_break_and_daily_limits(self):
+        """Test the 30-minute break after 8 hours and the 10-hour rest after 11 hours of driving"""
+        segments = HOSSimulator().simulate([(0, 'pickup'), (20, 'dropoff')], start=self.start)
+        kinds = [s['kind'] for s in segments]
+        self.assertEqual(kinds, ['pickup', 'driving', 'break', 'driving', 'rest', 'driving', 'break', 'driving', 'dropoff'])
+        self.assertEqual(self._minutes(segments, 'driving'), 20 * 60)
+        # Pickup starts the 14-hour window and also counts as a break, so 8 hours are driven before the first break
+        self.assertEqual(segments[1]['start'], datetime(2025, 1, 6, 9, 0))
+        self.assertEqual((segments[1]['end'] - segments[1]['start']).total_seconds(), 8 * 3600)
+
+    def test_cycle_limit_forces_restart(self):
+        """Test that reaching 70 hours on duty forces a 34-hour restart"""
+        segments = HOSSimulator().simulate([(0, 'pickup'), (5, 'dropoff')], cycle_hours_used=66, start=self.start)
+        restart = [s for s in segments if s['kind'] == 'restart']
+        self.assertEqual(len(restart), 1)
+        self.assertEqual((restart[0]['end'] - restart[0]['start']).total_seconds(), 34 * 3600)
+        self.assertEqual(self._minutes(segments, 'driving'), 5 * 60)
+
+    def test_long_trip_costs_segments_not_hours(self):
+        """Test that a multi-week trip is simulated as a bounded number of segments"""
+        segments = HOSSimulator().simulate([(0, 'pickup'), (300, 'dropoff')], start=self.start)
+        self.assertEqual(self._minutes(segments, 'driving'), 300 * 60)
+        self.assertLess(len(segments), 150)
+        for previous, current in zip(segments, segments[1:]):
+            self.assertEqual(previous['end'], current['start'])
+
+    def test_log_sheets_match_timeline(self):
+        """Test that daily log sheets and required stops come from the same timeline"""
+        segments = HOSSimulator().simulate([(2, 'pickup'), (25, 'dropoff')], cycle_hours_used=10, start=self.start)
+        grids = LogGenerator().daily_status_grids(segments)
+
+        driving = sum(end - start for _, grid in grids for start, end, status in grid if status == 'D')
+        self.assertEqual(driving, self._minutes(segments, 'driving'))
+        for _, grid in grids:
+            self.assertEqual((grid[0][0], grid[-1][1]), (0, 1440))
+        self.assertEqual(len(required_stops(segments)), len([s for s in segments if s['kind'] != 'driving']))
+
+class RoadGraphTests(TestCase):
+    def setUp(self):
+        # 12x12 grid of intersections ~1.1 km apart with random travel times, plus an isolated node
+        rng = random.Random(7)
+        self.nodes = [(f"{row}-{column}", 40 + row * 0.01, -75 + column * 0.01)
+                      for row in range(12) for column in range(12)]
+        self.nodes.append(('island', 41.0, -74.0))
+        self.edges = []
+        for row in range(12):
+            for column in range(12):
+                if column < 11:
+                    self.edges.append((f"{row}-{column}", f"{row}-{column + 1}", 1100.0, rng.uniform(40, 120), False))
+                if row < 11:
+                    self.edges.append((f"{row}-{column}", f"{row + 1}-{column}", 1100.0, rng.uniform(40, 120), rng.random() < 0.2))
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'graph.bin')
+        build_road_graph(self.nodes, self.edges, self.path, landmark_count=4)
+        self.graph = RoadGraph(self.path)
+        self.addCleanup(self.graph.close)
+
+    def _dijkstra(self, source, target):
+        adjacency = {}
+        for a, b, _, seconds, oneway in self.edges:
+            adjacency.setdefault(a, []).append((b, seconds))
+            if not oneway:
+                adjacency.setdefault(b, []).append((a, seconds))
+        best = {source: 0.0}
+        pending = {source}
+        while pending:
+            node = min(pending, key=best.get)
+            pending.remove(node)
+            for neighbour, seconds in adjacency.get(node, []):
+                if best[node] + seconds < best.get(neighbour, float('inf')):
+                    best[neighbour] = best[node] + seconds
+                    pending.add(neighbour)
+        return best.get(target)
+
+    def _node(self, node_id):
+        _, lat, lon = next(node for node in self.nodes if node[0] == node_id)
+        return self.graph.nearest_node(lat, lon)
+
+    def test_landmark_search_matches_dijkstra(self):
+        """Test that A* with landmarks finds the same travel times as plain Dijkstra"""
+        for source, target in [('0-0', '11-11'), ('11-0', '0-11'), ('5-5', '5-6'), ('3-9', '10-2')]:
+            duration, distance, path = self.graph.shortest_path(self._node(source), self._node(target))
+            self.assertAlmostEqual(duration, self._dijkstra(source, target), places=2)
+            self.assertAlmostEqual(distance, 1100.0 * (len(path) - 1), places=2)
+
+    def test_nearest_node_and_unreachable(self):
+        """Test snapping to the closest node and that disconnected nodes have no route"""
+        self.assertEqual(self.graph.nearest_node(40.0501, -74.9399), self._node('5-6'))
+        self.assertIsNone(self.graph.nearest_node(10.0, 10.0))
+        self.assertIsNone(self.graph.shortest_path(self._node('0-0'), self._node('island')))
+
+    def test_graph_backend_routes_trip_legs(self):
+        """Test that the graph backend returns one leg per waypoint pair and rejects unroutable trips"""
+        backend = GraphRoutingBackend(self.path)
+        route = backend.route([(40.0, -75.0), (40.05, -74.95), (40.11, -74.89)])
+        self.assertEqual(len(route['legs']), 2)
+        self.assertAlmostEqual(route['duration'], self._dijkstra('0-0', '5-5') + self._dijkstra('5-5', '11-11'), places=2)
+        self.assertEqual(route['distance'], sum(leg['distance'] for leg in route['legs']))
+        line = decode(route['geometry'])
+        self.assertEqual((line[0], line[-1]), ((40.0, -75.0), (40.11, -74.89)))
+        matrix = backend.duration_matrix([(40.0, -75.0), (40.05, -74.95)])
+        self.assertEqual(matrix[0][0], 0)
+        self.assertAlmostEqual(matrix[0][1], self._dijkstra('0-0', '5-5'), places=2)
+        self.assertAlmostEqual(matrix[1][0], self._dijkstra('5-5', '0-0'), places=2)
+        with self.assertRaisesMessage(ValueError, "Location does not exist"):
+            backend.route([(40.0, -75.0), (41.0, -74.0)])
+
+    def test_build_command_reads_csv(self):
+        """Test building a graph file with the management command"""
+        directory = os.path.dirname(self.path)
+        with open(os.path.join(directory, 'nodes.csv'), 'w') as f:
+            f.write("id,lat,lon\na,40.0,-75.0\nb,40.0,-74.99\nc,40.01,-74.99\n")
+        with open(os.path.join(directory, 'edges.csv'), 'w') as f:
+            f.write("source,target,distance,duration,oneway\na,b,850,60,0\nb,c,1110,90,1\n")
+        output = os.path.join(directory, 'small.bin')
+        call_command('build_road_graph', os.path.join(directory, 'nodes.csv'),
+                     os.path.join(directory, 'edges.csv'), output, landmarks=2, stdout=io.StringIO())
+
+        graph = RoadGraph(output)
+        self.addCleanup(graph.close)
+        a, c = graph.nearest_node(40.0, -75.0), graph.nearest_node(40.01, -74.99)
+        self.assertEqual(graph.shortest_path(a, c)[:2], (150.0, 1960.0))
+        self.assertIsNone(graph.shortest_path(c, a))
+
+class GazetteerTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'places.bin')
+        build_gazetteer([
+            ('Boston', 'MA', 42.3601, -71.0589, 675647),
+            ('Boston', 'GA', 30.7919, -83.7899, 1268),
+            ('Bostwick', 'GA', 33.7376, -83.5135, 390),
+            ('Springfield', 'IL', 39.7817, -89.6501, 114394),
+            ('Springfield', 'MA', 42.1015, -72.5898, 155929),
+            ('Coeur d\'Alene', 'ID', 47.6777, -116.7805, 54628),
+        ], self.path)
+        self.gazetteer = Gazetteer(self.path)
+        self.addCleanup(self.gazetteer.close)
+        geocode_cache.clear()
+
+    def test_exact_matches(self):
+        """Test lookups by city and state code or name, ignoring case, punctuation, ZIP and country"""
+        for query in ['Boston, MA', 'boston ma', 'Boston, Massachusetts', 'Boston, MA 02108, USA']:
+            self.assertEqual(self.gazetteer.lookup(query), (42.3601, -71.0589))
+        self.assertEqual(self.gazetteer.lookup('Boston, GA'), (30.7919, -83.7899))
+        self.assertEqual(self.gazetteer.lookup("Coeur D'Alene, Idaho"), (47.6777, -116.7805))
+
+    def test_bare_names_and_prefixes_prefer_larger_places(self):
+        """Test that ambiguous names and prefixes resolve to the most populous match"""
+        self.assertEqual(self.gazetteer.lookup('Springfield'), (42.1015, -72.5898))
+        self.assertEqual(self.gazetteer.lookup('Springfield, I'), (39.7817, -89.6501))
+        self.assertEqual(self.gazetteer.lookup('Bost'), (42.3601, -71.0589))
+        self.assertIsNone(self.gazetteer.lookup('Bo'))
+        self.assertIsNone(self.gazetteer.lookup('Chicago, IL'))
+
+    def test_planner_uses_gazetteer_before_remote_geocoders(self):
+        """Test that local hits skip the cache and Nominatim, and misses still fall back to it"""
+        planner = RoutePlanner()
+        planner.local_geocoders = [GazetteerGeocoder(self.path)]
+        with mock.patch.object(planner, '_get_coordinates', return_value=(41.88, -87.63)) as geocode:
+            coordinates = planner._get_coordinates_many(['Boston, MA', 'Springfield, IL', 'Chicago, IL'])
+
+        geocode.assert_called_once_with('Chicago, IL')
+        self.assertEqual(coordinates['Boston, MA'], (42.3601, -71.0589))
+        self.assertEqual(coordinates['Chicago, IL'], (41.88, -87.63))
+        self.assertEqual(GeocodeCache.objects.count(), 1)
+
+class BenchmarkHarnessTests(TestCase):
+    def test_plan_route_against_standins(self):
+        """Test that the harness plans trips through the stand-in upstreams and counts queries"""
+        with StandInServer() as standin, standin_upstreams(standin):
+            result = bench_plan_route(standin, miles=600, iterations=2)
+            requests = standin.requests
+
+        self.assertEqual(result['errors'], 0)
+        # Three geocoding lookups and one route per trip, none of them cached
+        self.assertEqual(requests, 3 * 4)
+        self.assertGreater(result['queries'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_warm_plan_route_plans_every_call(self):
+        """Test that warm runs repeat one payload but plan (and save) a trip on every call"""
+        with StandInServer() as standin, standin_upstreams(standin):
+            result = bench_plan_route(standin, miles=600, iterations=3, warm=True)
+
+        self.assertEqual(result['errors'], 0)
+        # The profiled call plus three timed ones, none of them replayed
+        self.assertEqual(Trip.objects.count(), 4)
+
+    def test_compare_reports_regressions(self):
+        """Test that slower p95 latencies and extra queries are reported against a baseline"""
+        baseline = bench_log_generator(50, iterations=3)
+        slower = {**baseline, 'p95_ms': baseline['p95_ms'] * 2 + 1, 'queries': baseline['queries'] + 1}
+        self.assertEqual(compare([baseline], [baseline]), [])
+        self.assertEqual(len(compare([slower], [baseline])), 2)
+
+    def test_cold_start_samples(self):
+        """Test that fresh processes under the serverless profile plan a trip and list trips"""
+        with StartupBenchmark() as benchmark:
+            plan = benchmark.sample('eld_backend.settings_serverless', 'plan_route')
+            listing = benchmark.sample('eld_backend.settings_serverless', 'trips')
+
+        self.assertEqual((plan['status'], listing['status']), (200, 200))
+        # Listing trips never loads the planning services
+        self.assertLess(listing['modules'], plan['modules'])
+        self.assertGreater(listing['process_ms'], listing['load_ms'] + listing['first_response_ms'])
+
+    def test_connection_reuse_restores_settings(self):
+        """Test that the connection benchmark times every cycle and puts the connection settings back"""
+        saved = (connection.settings_dict['CONN_MAX_AGE'], connection.settings_dict['CONN_HEALTH_CHECKS'])
+        result = bench_connection_reuse(5, conn_max_age=0, health_checks=True)
+        self.assertEqual(result['iterations'], 5)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual((connection.settings_dict['CONN_MAX_AGE'], connection.settings_dict['CONN_HEALTH_CHECKS']),
+                         saved)
+
+    def test_persistent_connections_not_reused_under_asgi(self):
+        """Test that only WSGI-style cycles reuse a persistent connection; ASGI ones open one per request"""
+        wsgi = bench_connection_reuse(4, conn_max_age=60, health_checks=True)
+        asgi = bench_connection_reuse(4, conn_max_age=60, health_checks=True, server='asgi')
+
+        # At most one: under TestCase the thread's connection stays open inside the test transaction
+        self.assertLessEqual(wsgi['connections_opened'], 1)
+        # (SQLite never closes in-memory connections, so connections_left_open is only meaningful on a server)
+        self.assertEqual(asgi['connections_opened'], 4)
+        self.assertEqual(asgi['params']['server'], 'asgi')
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], 0)
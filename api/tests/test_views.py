@@ -1,9 +1,32 @@
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, AsyncClient, override_settings
+from django.db import DatabaseError
+from django.db.models import Sum
 from django.urls import reverse
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
 from rest_framework import status
-from ..models import Trip, LogSheet
-from datetime import date, time
+from ..models import Trip, TripStop, LogSheet, DutySummary, PlanJob, IdempotencyRecord
+from ..pagination import TripCursorPagination, LogSheetCursorPagination
+from ..views import LogSheetViewSet
+from .utils import assert_uses_index
+from ..services.geocode_cache import geocode_cache
+from ..services.idempotency import purge_expired, request_fingerprint
+from ..services.log_generator import LogGenerator
+from ..services.log_graph import log_graph_renderer
+from ..services.route_cache import route_cache
+from ..services import plan_jobs, route_geometry
+from ..services.route_geometry import decode, encode, route_geometry_cache
+from ..services.geocoding import Geocoder
+from ..services.plan_jobs import PlanJobWorker, claim_job
+from ..services.route_planner import LocationNotFound, duration_matrix_cache
+from ..services.throttle import ThrottledError
+from ..services.timing import metrics
+from datetime import date, time, timedelta
+from django.utils import timezone
+from unittest import mock
+from xml.etree import ElementTree
+import io
 import json
 
 class TripViewSetTests(TestCase):
@@ -74,7 +97,7 @@ class TripViewSetTests(TestCase):
         
         response = self.client.get(self.trip_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_get_trip_detail(self):
         """Test retrieving a single trip"""
@@ -85,6 +108,229 @@ class TripViewSetTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['current_location'], trip.current_location)
 
+class TripListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.trip_url = reverse('trip-list')
+        for index in range(5):
+            trip = Trip.objects.create(
+                current_location=f'Origin {index}',
+                pickup_location='Boston, MA',
+                dropoff_location='Philadelphia, PA',
+                current_cycle_hours=1
+            )
+            for day in range(3):
+                LogSheet.objects.create(
+                    trip=trip,
+                    date=date(2025, 1, day + 1),
+                    start_time=time(0, 0),
+                    end_time=time(0, 0),
+                    status_grid=[[0, 1440, 'OFF']]
+                )
+
+    def test_query_count_independent_of_page_size(self):
+        """Test that listing trips with nested log sheets costs a constant number of queries"""
+        with self.assertNumQueries(2):
+            response = self.client.get(self.trip_url, {'page_size': 5})
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(len(response.data['results'][0]['log_sheets']), 3)
+
+    def test_cursor_pagination_newest_first(self):
+        """Test that trips are paged newest first and the next cursor continues the listing"""
+        first_page = self.client.get(self.trip_url, {'page_size': 3}).data
+        self.assertEqual([trip['current_location'] for trip in first_page['results']],
+                         ['Origin 4', 'Origin 3', 'Origin 2'])
+
+        second_page = self.client.get(first_page['next']).data
+        self.assertEqual([trip['current_location'] for trip in second_page['results']],
+                         ['Origin 1', 'Origin 0'])
+        self.assertIsNone(second_page['next'])
+
+    def test_sparse_fieldsets(self):
+        """Test that ?fields and ?omit trim the response and skip loading log sheets"""
+        with self.assertNumQueries(1):
+            response = self.client.get(self.trip_url, {'omit': 'log_sheets'})
+        self.assertNotIn('log_sheets', response.data['results'][0])
+
+        response = self.client.get(self.trip_url, {'fields': 'id,current_location'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'current_location'})
+
+class PlanRoutePersistenceTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.plan_route_url = reverse('trip-plan-route')
+        self.trip_data = {
+            'current_location': 'New York, NY',
+            'pickup_location': 'Boston, MA',
+            'dropoff_location': 'Philadelphia, PA',
+            'current_cycle_hours': 5.5
+        }
+        self.route_data = {
+            'total_distance': 2000.0,
+            'total_duration': 60.0,
+            'required_stops': [],
+            'waypoints': []
+        }
+
+    # Counts the planning writes alone; the idempotency record adds its own queries
+    @override_settings(IDEMPOTENCY_FINGERPRINT_WINDOW=0)
+    @mock.patch('api.services.trip_planning.RoutePlanner.calculate_route')
+    def test_log_sheets_bulk_inserted(self, calculate_route):
+        """Test that all log sheets for a trip are written with a single insert"""
+        calculate_route.return_value = self.route_data
+        # savepoint, trip insert, log sheet bulk insert, duty summary bulk insert, release,
+        # nested log sheets for the trip payload
+        with self.assertNumQueries(6):
+            response = self.client.post(self.plan_route_url, self.trip_data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['log_sheets']), LogSheet.objects.count())
+        self.assertEqual(
+            [sheet['id'] for sheet in response.data['log_sheets']],
+            list(LogSheet.objects.order_by('id').values_list('id', flat=True))
+        )
+
+    @mock.patch('api.services.trip_planning.LogGenerator.generate_logs', side_effect=RuntimeError)
+    @mock.patch('api.services.trip_planning.RoutePlanner.calculate_route')
+    def test_failed_log_generation_rolls_back_trip(self, calculate_route, generate_logs):
+        """Test that no trip is left behind when log sheet generation fails"""
+        calculate_route.return_value = self.route_data
+        response = self.client.post(self.plan_route_url, self.trip_data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Trip.objects.count(), 0)
+
+class PlanRoutesBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('trip-plan-routes')
+        geocode_cache.clear()
+        route_cache.clear()
+        self.coordinates = {
+            'New York, NY': (40.71, -74.00),
+            'Boston, MA': (42.36, -71.05),
+            'Philadelphia, PA': (39.95, -75.16),
+        }
+
+    def _geocode(self, location):
+        if location not in self.coordinates:
+            raise LocationNotFound("Location does not exist")
+        return self.coordinates[location]
+
+    def test_batch_results_in_order(self):
+        """Test that a batch returns one result per trip in order, with errors inline"""
+        trips = [
+            {'current_location': 'New York, NY', 'pickup_location': 'Boston, MA',
+             'dropoff_location': 'Philadelphia, PA', 'current_cycle_hours': 2},
+            {'current_location': 'Boston, MA', 'pickup_location': 'Boston, MA',
+             'dropoff_location': 'Atlantis', 'current_cycle_hours': 2},
+            {'current_location': 'Boston, MA', 'current_cycle_hours': 2},
+            {'current_location': 'Philadelphia, PA', 'pickup_location': 'New York, NY',
+             'dropoff_location': 'Boston, MA', 'current_cycle_hours': 1},
+        ]
+        route = {'distance': 500000.0, 'duration': 36000.0, 'legs': [], 'geometry': None}
+        with mock.patch('api.services.route_planner.RoutePlanner._get_coordinates', side_effect=self._geocode) as geocode, \
+                mock.patch('api.services.route_planner.RoutePlanner._fetch_route', return_value=route):
+            response = self.client.post(self.url, {'trips': trips}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0]['trip']['current_location'], 'New York, NY')
+        self.assertEqual(results[1]['errors'], ["Location does not exist"])
+        self.assertIn('pickup_location is required', results[2]['errors'])
+        self.assertEqual(results[3]['trip']['current_location'], 'Philadelphia, PA')
+        self.assertEqual(len(results[3]['log_sheets']), len(results[3]['trip']['log_sheets']))
+
+        # Every distinct location was geocoded exactly once across the batch
+        self.assertEqual(geocode.call_count, 4)
+        self.assertEqual(Trip.objects.count(), 2)
+
+    def test_throttled_geocoding_reported_retryable(self):
+        """Test that locations the geocoder rate limit turned away answer 503, not 'Location does not exist'"""
+        class ThrottledGeocoder(Geocoder):
+            def geocode(self, location):
+                raise ThrottledError("Too many requests queued for nominatim")
+
+        trip = {'current_location': 'New York, NY', 'pickup_location': 'Boston, MA',
+                'dropoff_location': 'Philadelphia, PA', 'current_cycle_hours': 2}
+        with mock.patch('api.services.route_planner.geocoders', [ThrottledGeocoder()]):
+            response = self.client.post(self.url, {'trips': [trip, {**trip, 'current_cycle_hours': 3}]},
+                                        format='json')
+            single = self.client.post(reverse('trip-plan-route'), trip, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for result in response.data['results']:
+            self.assertEqual(result, {'errors': ["Geocoding is busy, try again later"], 'status': 503})
+        self.assertEqual(single.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(single.data['errors'], ["Geocoding is busy, try again later"])
+        self.assertEqual(Trip.objects.count(), 0)
+
+    def test_rejects_non_list_payload(self):
+        """Test that the batch endpoint requires a list of trips"""
+        response = self.client.post(self.url, {'trips': 'New York, NY'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class PlanRouteAsyncTests(TestCase):
+    def setUp(self):
+        self.url = reverse('trip-plan-route-async')
+        geocode_cache.clear()
+        route_cache.clear()
+        self.trip_data = {
+            'current_location': 'New York, NY',
+            'pickup_location': 'Boston, MA',
+            'dropoff_location': 'Philadelphia, PA',
+            'current_cycle_hours': 5.5
+        }
+        self.route = {'distance': 500000.0, 'duration': 36000.0, 'legs': [], 'geometry': None}
+
+    @mock.patch('api.services.async_route_planner.AsyncRoutePlanner._fetch_route_async')
+    @mock.patch('api.services.async_route_planner.AsyncRoutePlanner._get_coordinates_async')
+    async def test_async_plan_route_matches_sync_response(self, get_coordinates, fetch_route):
+        """Test that the async endpoint plans and saves a trip like plan_route"""
+        get_coordinates.side_effect = [(40.71, -74.00), (42.36, -71.05), (39.95, -75.16)]
+        fetch_route.return_value = self.route
+
+        response = await AsyncClient().post(self.url, self.trip_data, content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.json()
+        self.assertEqual(set(body), {'trip', 'route', 'log_sheets'})
+        self.assertEqual(body['trip']['current_location'], 'New York, NY')
+        self.assertEqual(get_coordinates.call_count, 3)
+        self.assertEqual(await Trip.objects.acount(), 1)
+        self.assertEqual(await LogSheet.objects.acount(), len(body['log_sheets']))
+
+    async def test_async_plan_route_validation_errors(self):
+        """Test that the async endpoint reports field errors like plan_route"""
+        response = await AsyncClient().post(self.url, {'current_location': 'New York, NY'},
+                                             content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pickup_location is required', response.json()['errors'])
+
+    @mock.patch('api.services.async_route_planner.AsyncRoutePlanner._fetch_route_async')
+    @mock.patch('api.services.async_route_planner.AsyncRoutePlanner._get_coordinates_async')
+    async def test_async_plan_route_replays_repeats(self, get_coordinates, fetch_route):
+        """Test that the async endpoint replays repeated requests like plan_route"""
+        get_coordinates.side_effect = [(40.71, -74.00), (42.36, -71.05), (39.95, -75.16)]
+        fetch_route.return_value = self.route
+        client = AsyncClient()
+
+        first = await client.post(self.url, self.trip_data, content_type='application/json',
+                                  headers={'Idempotency-Key': 'async'})
+        replay = await client.post(self.url, self.trip_data, content_type='application/json',
+                                   headers={'Idempotency-Key': 'async'})
+        reused = await client.post(self.url, {**self.trip_data, 'current_cycle_hours': 7},
+                                   content_type='application/json', headers={'Idempotency-Key': 'async'})
+
+        self.assertEqual(replay.status_code, status.HTTP_200_OK)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(reused.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(get_coordinates.call_count, 3)
+        self.assertEqual(await Trip.objects.acount(), 1)
+
 class LogSheetTests(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -100,10 +346,7 @@ class LogSheetTests(TestCase):
             'date': date.today(),
             'start_time': time(8, 0),
             'end_time': time(16, 0),
-            'status_grid': json.dumps({
-                'hours': [0] * 24,
-                'status': ['off_duty'] * 24
-            })
+            'status_grid': [[0, 480, 'OFF'], [480, 960, 'D'], [960, 1440, 'OFF']]
         }
 
     def test_create_log_sheet(self):
@@ -130,4 +373,927 @@ class LogSheetTests(TestCase):
         url = reverse('logsheet-list')
         response = self.client.get(url, {'trip': self.trip.id})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1) 
\ No newline at end of file
+        self.assertEqual(len(response.data['results']), 1) 
+
+class StatusGridEncodingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.trip = Trip.objects.create(
+            current_location='New York, NY',
+            pickup_location='Boston, MA',
+            dropoff_location='Philadelphia, PA',
+            current_cycle_hours=5.5
+        )
+        self.hourly_grid = {str(hour): 'D' if 8 <= hour < 19 else 'OFF' for hour in range(24)}
+
+    def test_hourly_grid_stored_as_intervals(self):
+        """Test that a legacy hourly grid is stored in the interval encoding"""
+        response = self.client.post(reverse('logsheet-list'), {
+            'trip': self.trip.id,
+            'date': date.today(),
+            'start_time': time(0, 0),
+            'end_time': time(0, 0),
+            'status_grid': self.hourly_grid
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(LogSheet.objects.get().status_grid, [[0, 480, 'OFF'], [480, 1140, 'D'], [1140, 1440, 'OFF']])
+
+    def test_malformed_grid_rejected(self):
+        """Test that grids that are neither hourly nor full-day intervals of known statuses are rejected"""
+        for grid in (
+            json.dumps({'hours': [0] * 24, 'status': ['off_duty'] * 24}),
+            {'hours': [0] * 24, 'status': ['off_duty'] * 24},
+            [[0, 1440, 'X']],
+            [[0, 600, 'OFF'], [500, 1440, 'D']],
+            [[0, 600, 'OFF'], [700, 1440, 'D']],
+            [[0, 1500, 'OFF']],
+            {str(hour): 'DRIVING' for hour in range(24)},
+        ):
+            response = self.client.post(reverse('logsheet-list'), {
+                'trip': self.trip.id, 'date': date.today(), 'start_time': time(0, 0), 'end_time': time(0, 0),
+                'status_grid': grid,
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, grid)
+            self.assertIn('status_grid', response.data)
+        self.assertFalse(LogSheet.objects.exists())
+
+    def test_non_integer_bounds_rejected(self):
+        """Test that interval bounds must be whole minutes, not strings, fractions or booleans"""
+        for grid in (
+            [[0, 'x', 'OFF']],
+            [['0', 1440, 'OFF']],
+            [[0, None, 'OFF']],
+            [[0, 720.5, 'OFF'], [720.5, 1440, 'D']],
+            [[0.0, 1440.0, 'OFF']],
+            [[False, 1440, 'OFF']],
+        ):
+            response = self.client.post(reverse('logsheet-list'), {
+                'trip': self.trip.id, 'date': date.today(), 'start_time': time(0, 0), 'end_time': time(0, 0),
+                'status_grid': grid,
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, grid)
+            self.assertIn('status_grid', response.data)
+        self.assertFalse(LogSheet.objects.exists())
+
+    def test_hourly_grid_emitted_on_request(self):
+        """Test that ?grid_format=hourly returns the legacy dict shape"""
+        log_sheet = LogSheet.objects.create(
+            trip=self.trip,
+            date=date.today(),
+            start_time=time(0, 0),
+            end_time=time(0, 0),
+            status_grid=[[0, 480, 'OFF'], [480, 1140, 'D'], [1140, 1440, 'OFF']]
+        )
+        url = reverse('logsheet-detail', args=[log_sheet.id])
+
+        self.assertEqual(self.client.get(url).data['status_grid'], log_sheet.status_grid)
+        self.assertEqual(self.client.get(url, {'grid_format': 'hourly'}).data['status_grid'], self.hourly_grid)
+
+
+class LogSheetQueryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.trip = Trip.objects.create(
+            current_location='New York, NY',
+            pickup_location='Boston, MA',
+            dropoff_location='Philadelphia, PA',
+            current_cycle_hours=5.5
+        )
+        for day in range(1, 11):
+            LogSheet.objects.create(
+                trip=self.trip,
+                date=date(2025, 1, day),
+                start_time=time(0, 0),
+                end_time=time(0, 0),
+                status_grid=[[0, 1440, 'OFF']]
+            )
+
+    def _list_queryset(self, params):
+        view = LogSheetViewSet(request=Request(APIRequestFactory().get('/', params)), format_kwarg=None)
+        return view.get_queryset().order_by(*LogSheetCursorPagination.ordering)
+
+    def test_date_range_filter(self):
+        """Test filtering a trip's log sheets by date range"""
+        response = self.client.get(reverse('logsheet-list'), {
+            'trip': self.trip.id, 'date_from': '2025-01-03', 'date_to': '2025-01-05'
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([sheet['date'] for sheet in response.data['results']],
+                         ['2025-01-05', '2025-01-04', '2025-01-03'])
+
+    def test_invalid_date_rejected(self):
+        """Test that a malformed date filter is a validation error"""
+        response = self.client.get(reverse('logsheet-list'), {'date_from': '01/03/2025'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_trip_and_date_lookup_uses_index(self):
+        """Test that log sheet lookups by trip and date range read the (trip, date) index"""
+        queryset = self._list_queryset({'trip': self.trip.id, 'date_from': '2025-01-03', 'date_to': '2025-01-05'})
+        assert_uses_index(self, queryset, 'api_logsheet_trip_date_idx')
+        assert_uses_index(self, self._list_queryset({'trip': self.trip.id}), 'api_logsheet_trip_date_idx')
+
+    def test_date_range_lookup_uses_index(self):
+        """Test that fleet-wide date range lookups read the date index"""
+        queryset = self._list_queryset({'date_from': '2025-01-03', 'date_to': '2025-01-05'})
+        assert_uses_index(self, queryset, 'api_logsheet_date_idx')
+
+    def test_trip_listing_uses_index(self):
+        """Test that the newest-first trip listing reads the created_at index"""
+        queryset = Trip.objects.filter(created_at__lt=self.trip.created_at).order_by(*TripCursorPagination.ordering)[:50]
+        assert_uses_index(self, queryset, 'api_trip_created_at_idx')
+
+class TimingTests(TestCase):
+    def setUp(self):
+        geocode_cache.clear()
+        route_cache.clear()
+        metrics.clear()
+        self.trip_data = {
+            'current_location': 'New York, NY',
+            'pickup_location': 'Boston, MA',
+            'dropoff_location': 'Philadelphia, PA',
+            'current_cycle_hours': 5.5
+        }
+        self.route = {'distance': 500000.0, 'duration': 36000.0, 'legs': [], 'geometry': None}
+
+    def _plan_route(self):
+        with mock.patch('api.services.route_planner.RoutePlanner._get_coordinates',
+                        side_effect=[(40.71, -74.00), (42.36, -71.05), (39.95, -75.16)]), \
+                mock.patch('api.services.route_planner.RoutePlanner._fetch_route', return_value=self.route):
+            return APIClient().post(reverse('trip-plan-route'), self.trip_data, format='json')
+
+    @override_settings(TIMING_SAMPLE_RATE=1.0)
+    def test_server_timing_header_lists_phases(self):
+        """Test that a sampled plan_route reports each phase and its queries in Server-Timing"""
+        response = self._plan_route()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        phases = {entry.split(';')[0].strip(): entry for entry in response['Server-Timing'].split(',')}
+        self.assertTrue({'geocode', 'route', 'hos', 'db_save', 'log_sheets', 'serialize', 'db', 'total'} <= set(phases))
+        # Trip, log sheet and duty summary inserts, inside the transaction's BEGIN/COMMIT (savepoints under TestCase)
+        self.assertIn('desc="5 queries"', phases['db_save'])
+
+    @override_settings(TIMING_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_not_timed(self):
+        """Test that requests outside the sample get no header and record no metrics"""
+        response = self._plan_route()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.render(), [])
+
+    @override_settings(TIMING_SAMPLE_RATE=1.0)
+    def test_metrics_endpoint_exports_histograms(self):
+        """Test that /metrics exposes request and span histograms in the Prometheus text format"""
+        self._plan_route()
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('eld_request_duration_seconds_count{method="POST",route="api/trips/plan_route/$",status="200"} 1', body)
+        self.assertIn('eld_span_duration_seconds_bucket{span="geocode",le="+Inf"} 1', body)
+        self.assertIn('eld_cache_events_total{cache="geocode",event="db_misses"} 3', body)
+
+class PlanJobTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('trip-plan-route')
+        geocode_cache.clear()
+        route_cache.clear()
+        self.trip_data = {
+            'current_location': 'New York, NY',
+            'pickup_location': 'Boston, MA',
+            'dropoff_location': 'Philadelphia, PA',
+            'current_cycle_hours': 5.5
+        }
+        self.coordinates = {
+            'New York, NY': (40.71, -74.00),
+            'Boston, MA': (42.36, -71.05),
+            'Philadelphia, PA': (39.95, -75.16),
+        }
+        self.route = {'distance': 500000.0, 'duration': 36000.0, 'legs': [], 'geometry': None}
+
+    def _geocode(self, location):
+        if location not in self.coordinates:
+            raise LocationNotFound("Location does not exist")
+        return self.coordinates[location]
+
+    def _run_worker(self, worker=None):
+        with mock.patch('api.services.route_planner.RoutePlanner._get_coordinates', side_effect=self._geocode), \
+                mock.patch('api.services.route_planner.RoutePlanner._fetch_route', return_value=self.route):
+            return (worker or PlanJobWorker()).run(drain=True)
+
+    def test_async_mode_queues_and_worker_plans_like_sync(self):
+        """Test that ?mode=async answers 202 at once and the worker stores the plan_route body"""
+        response = self.client.post(f"{self.url}?mode=async", self.trip_data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response['Location'], response.data['status_url'])
+        self.assertEqual(Trip.objects.count(), 0)
+        self.assertEqual(self._run_worker(), 1)
+
+        job = self.client.get(response.data['status_url']).data
+        self.assertEqual(job['status'], PlanJob.SUCCEEDED)
+        self.assertEqual(set(job['result']), {'trip', 'route', 'log_sheets'})
+        self.assertEqual(job['trip'], job['result']['trip']['id'])
+
+        # The stored result matches what the synchronous path returns for the same trip
+        with mock.patch('api.services.route_planner.RoutePlanner._fetch_route', return_value=self.route):
+            sync_body = self.client.post(self.url, self.trip_data, format='json').json()
+        self.assertEqual(job['result']['route']['total_distance'], sync_body['route']['total_distance'])
+        self.assertEqual(len(job['result']['log_sheets']), len(sync_body['log_sheets']))
+        self.assertEqual(set(job['result']['trip']), set(sync_body['trip']))
+
+    def test_invalid_payload_rejected_before_queueing(self):
+        """Test that validation errors are returned synchronously and nothing is queued"""
+        response = self.client.post(self.url, {'current_location': 'New York, NY'},
+                                    format='json', HTTP_PREFER='respond-async')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pickup_location is required', response.data['errors'])
+        self.assertEqual(PlanJob.objects.count(), 0)
+
+    def test_failed_job_records_errors_and_streams_final_status(self):
+        """Test that routing errors end the job as failed and close its event stream"""
+        response = self.client.post(f"{self.url}?mode=async", {**self.trip_data, 'dropoff_location': 'Atlantis'},
+                                    format='json')
+        self._run_worker()
+
+        stream = self.client.get(response.data['stream_url'])
+        self.assertEqual(stream['Content-Type'], 'text/event-stream')
+        events = b''.join(stream.streaming_content).decode()
+        self.assertTrue(events.startswith('event: failed\n'))
+        self.assertIn('"errors":["Location does not exist"]', events)
+
+    @override_settings(PLAN_JOBS_STREAM_POLL=0.01)
+    async def test_stream_sends_events_as_status_changes_under_asgi(self):
+        """Test that the ASGI event stream sends each status while the job is still running"""
+        job = await PlanJob.objects.acreate(payload=self.trip_data)
+        response = await AsyncClient().get(reverse('planjob-stream', args=[job.pk]))
+        events = aiter(response.streaming_content)
+
+        self.assertTrue((await anext(events)).startswith(b'event: queued\n'))
+        await PlanJob.objects.filter(pk=job.pk).aupdate(status=PlanJob.RUNNING)
+        self.assertTrue((await anext(events)).startswith(b'event: running\n'))
+        await PlanJob.objects.filter(pk=job.pk).aupdate(status=PlanJob.SUCCEEDED, result={'trip': {'id': 1}})
+        self.assertTrue((await anext(events)).startswith(b'event: succeeded\n'))
+        with self.assertRaises(StopAsyncIteration):
+            await anext(events)
+
+    def test_expired_running_jobs_are_reclaimed(self):
+        """Test that a job whose worker died is claimed again after its lease, up to the attempt limit"""
+        job = PlanJob.objects.create(payload=self.trip_data, status=PlanJob.RUNNING, attempts=1,
+                                     started_at=timezone.now())
+        self.assertIsNone(claim_job())
+
+        PlanJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(claim_job().attempts, 2)
+
+        PlanJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1), attempts=3)
+        self.assertIsNone(claim_job())
+
+    def test_expired_jobs_out_of_attempts_fail(self):
+        """Test that a job whose lease expired on its last attempt is marked failed instead of running forever"""
+        job = PlanJob.objects.create(payload=self.trip_data, status=PlanJob.RUNNING, attempts=3,
+                                     started_at=timezone.now())
+        self.assertIsNone(claim_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, PlanJob.RUNNING)
+
+        PlanJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertIsNone(claim_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, PlanJob.FAILED)
+        self.assertEqual(job.errors, ["Planning did not finish in 3 attempts"])
+        self.assertIsNotNone(job.finished_at)
+        events = b''.join(self.client.get(reverse('planjob-stream', args=[job.pk])).streaming_content).decode()
+        self.assertTrue(events.startswith('event: failed\n'))
+
+    def test_worker_survives_database_errors(self):
+        """Test that an error claiming or saving a job is logged and the worker goes on with the queue"""
+        first = PlanJob.objects.create(payload=self.trip_data)
+        second = PlanJob.objects.create(payload=self.trip_data)
+        PlanJob.objects.filter(pk=first.pk).update(created_at=timezone.now() - timedelta(minutes=1))
+
+        def failing_once(function, error):
+            calls = []
+
+            def call(*args):
+                calls.append(args)
+                if len(calls) == 1:
+                    raise error
+                return function(*args)
+            return call
+
+        with mock.patch.object(plan_jobs, 'claim_job', failing_once(claim_job, DatabaseError("timeout"))), \
+                mock.patch.object(plan_jobs, 'run_job', failing_once(plan_jobs.run_job, DatabaseError("lost"))), \
+                mock.patch.object(plan_jobs, 'close_old_connections') as close_old_connections, \
+                self.assertLogs('api.services.plan_jobs', 'ERROR') as logs:
+            self.assertEqual(self._run_worker(PlanJobWorker(poll_interval=0)), 1)
+
+        self.assertEqual(len(logs.records), 2)
+        # Around each of the four iterations: the claim error, both jobs and the empty queue
+        self.assertEqual(close_old_connections.call_count, 8)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        # The first job's save failed, so it waits out its lease; the second one was planned
+        self.assertEqual((first.status, second.status), (PlanJob.RUNNING, PlanJob.SUCCEEDED))
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('trip-plan-route')
+        geocode_cache.clear()
+        route_cache.clear()
+        self.trip_data = {
+            'current_location': 'New York, NY',
+            'pickup_location': 'Boston, MA',
+            'dropoff_location': 'Philadelphia, PA',
+            'current_cycle_hours': 5.5
+        }
+        self.coordinates = {
+            'New York, NY': (40.71, -74.00),
+            'Boston, MA': (42.36, -71.05),
+            'Philadelphia, PA': (39.95, -75.16),
+        }
+        self.route = {'distance': 500000.0, 'duration': 36000.0, 'legs': [], 'geometry': None}
+        patcher = mock.patch('api.services.route_planner.RoutePlanner._get_coordinates', side_effect=self._geocode)
+        self.get_coordinates = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('api.services.route_planner.RoutePlanner._fetch_route', return_value=self.route)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _geocode(self, location):
+        if location not in self.coordinates:
+            raise LocationNotFound("Location does not exist")
+        return self.coordinates[location]
+
+    def test_repeated_payload_replays_response(self):
+        """Test that an identical repeat is answered from the stored response without planning again"""
+        first = self.client.post(self.url, self.trip_data, format='json')
+        geocoded = self.get_coordinates.call_count
+        # Key order does not change the fingerprint
+        second = self.client.post(self.url, dict(reversed(list(self.trip_data.items()))), format='json')
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Trip.objects.count(), 1)
+        self.assertEqual(self.get_coordinates.call_count, geocoded)
+
+    def test_idempotency_key_scopes_replays(self):
+        """Test that a key replays its own response and rejects reuse with a different payload"""
+        first = self.client.post(self.url, self.trip_data, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        replay = self.client.post(self.url, self.trip_data, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        reused = self.client.post(self.url, {**self.trip_data, 'current_cycle_hours': 7},
+                                  format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        other_key = self.client.post(self.url, self.trip_data, format='json', HTTP_IDEMPOTENCY_KEY='def')
+
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(reused.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(other_key.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', other_key)
+        self.assertEqual(Trip.objects.count(), 2)
+
+    def test_in_progress_and_failed_requests(self):
+        """Test that a repeat of an unfinished request is refused and failed requests can be retried"""
+        IdempotencyRecord.objects.create(key='key:busy',
+                                         fingerprint=request_fingerprint(f"{self.url}?mode=sync", self.trip_data))
+        response = self.client.post(self.url, self.trip_data, format='json', HTTP_IDEMPOTENCY_KEY='busy')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        with mock.patch('api.services.route_planner.RoutePlanner._fetch_route', side_effect=RuntimeError):
+            response = self.client.post(self.url, self.trip_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, self.trip_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_enqueue_error_releases_claim(self):
+        """Test that an unexpected error while queueing frees the key so a retry is not refused"""
+        with mock.patch('api.services.plan_jobs.PlanJob.objects.create', side_effect=DatabaseError("down")), \
+                self.assertRaises(DatabaseError):
+            self.client.post(f"{self.url}?mode=async", self.trip_data, format='json', HTTP_IDEMPOTENCY_KEY='q')
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+        response = self.client.post(f"{self.url}?mode=async", self.trip_data, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='q')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+    def test_expired_records_replaced_and_purged(self):
+        """Test that a repeat after the window is planned again and old records can be purged"""
+        self.client.post(self.url, self.trip_data, format='json')
+        IdempotencyRecord.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(purge_expired(), 1)
+
+        self.client.post(self.url, self.trip_data, format='json')
+        IdempotencyRecord.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        response = self.client.post(self.url, self.trip_data, format='json')
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Trip.objects.count(), 3)
+        self.assertEqual(purge_expired(), 0)
+
+    @override_settings(IDEMPOTENCY_FINGERPRINT_WINDOW=0)
+    def test_fingerprint_window_disabled(self):
+        """Test that identical payloads are planned every time when the fingerprint window is off"""
+        self.client.post(self.url, self.trip_data, format='json')
+        self.client.post(self.url, self.trip_data, format='json')
+
+        self.assertEqual(Trip.objects.count(), 2)
+        self.assertEqual(IdempotencyRecord.objects.count(), 0)
+
+    def test_etag_revalidation(self):
+        """Test that GETs carry a content ETag and a matching If-None-Match gets an empty 304"""
+        trip_id = self.client.post(self.url, self.trip_data, format='json').data['trip']['id']
+        trip_etag = self.client.get(reverse('trip-detail', args=[trip_id]))['ETag']
+        for url in (reverse('trip-detail', args=[trip_id]), reverse('logsheet-list')):
+            response = self.client.get(url)
+            etag = response['ETag']
+            self.assertEqual(self.client.get(url)['ETag'], etag)
+
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+            self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(cached.content, b'')
+            self.assertEqual(cached['ETag'], etag)
+
+        Trip.objects.filter(pk=trip_id).update(current_cycle_hours=9)
+        response = self.client.get(reverse('trip-detail', args=[trip_id]), HTTP_IF_NONE_MATCH=trip_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], trip_etag)
+
+class LogSheetExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('logsheet-export')
+        self.trips = [
+            Trip.objects.create(current_location='New York, NY', pickup_location='Boston, MA',
+                                dropoff_location='Philadelphia, PA', current_cycle_hours=5.5)
+            for _ in range(3)
+        ]
+        for trip in self.trips:
+            LogSheet.objects.bulk_create(
+                LogSheet(trip=trip, date=date(2025, 1, day), start_time=time(0, 0), end_time=time(0, 0),
+                         status_grid=[[0, 480, 'OFF'], [480, 1440, 'D']])
+                for day in range(1, 6)
+            )
+
+    def _rows(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_streams_in_chunks(self):
+        """Test that the CSV export covers every sheet with one query per chunk"""
+        with override_settings(LOG_EXPORT_CHUNK_SIZE=4), self.assertNumQueries(4):
+            response = self.client.get(self.url)
+            lines = self._rows(response).splitlines()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(lines[0], 'id,trip,date,start_time,end_time,status_grid')
+        self.assertEqual(len(lines), 16)
+        self.assertEqual([int(line.split(',')[0]) for line in lines[1:]],
+                         list(LogSheet.objects.order_by('id').values_list('id', flat=True)))
+        self.assertTrue(lines[1].endswith(',"[[0,480,""OFF""],[480,1440,""D""]]"'))
+
+    def test_ndjson_export_filters_trips_and_dates(self):
+        """Test NDJSON rows filtered by several trips and a date range"""
+        trip_ids = f"{self.trips[0].id},{self.trips[2].id}"
+        response = self.client.get(self.url, {'file_format': 'ndjson', 'trip': trip_ids,
+                                              'date_from': '2025-01-02', 'date_to': '2025-01-03'})
+        rows = [json.loads(line) for line in self._rows(response).splitlines()]
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([(row['trip'], row['date']) for row in rows], [
+            (self.trips[0].id, '2025-01-02'), (self.trips[0].id, '2025-01-03'),
+            (self.trips[2].id, '2025-01-02'), (self.trips[2].id, '2025-01-03'),
+        ])
+        self.assertEqual(rows[0]['status_grid'], [[0, 480, 'OFF'], [480, 1440, 'D']])
+        self.assertEqual(rows[0]['start_time'], '00:00:00')
+
+    @override_settings(LOG_EXPORT_CHUNK_SIZE=4)
+    async def test_asgi_export_streams_chunks_as_they_are_read(self):
+        """Test that under ASGI each chunk is sent before the next one is queried"""
+        response = await AsyncClient().get(self.url, {'file_format': 'ndjson'})
+        chunks = aiter(response.streaming_content)
+        first = await anext(chunks)
+        self.assertEqual(len(first.splitlines()), 4)
+
+        # A sheet added after the first chunk went out is still exported, so nothing was read ahead
+        added = await LogSheet.objects.acreate(trip=self.trips[0], date=date(2025, 2, 1), start_time=time(0, 0),
+                                               end_time=time(0, 0), status_grid=[[0, 1440, 'OFF']])
+        rest = [chunk async for chunk in chunks]
+        rows = [json.loads(line) for chunk in [first, *rest] for line in chunk.splitlines()]
+        self.assertEqual(len(rest), 3)
+        self.assertEqual(len(rows), 16)
+        self.assertEqual(rows[-1]['id'], added.id)
+
+    def test_invalid_parameters_rejected(self):
+        """Test that unknown formats, non-numeric trips and bad dates are validation errors"""
+        for params in ({'file_format': 'xml'}, {'trip': 'abc'}, {'date_to': '2025/01/01'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_command(self):
+        """Test that the management command writes the same rows as the endpoint"""
+        out = io.StringIO()
+        call_command('export_log_sheets', '--file-format', 'csv', '--trip', str(self.trips[1].id),
+                     '--chunk-size', '2', stdout=out)
+        lines = out.getvalue().splitlines()
+
+        self.assertEqual(len(lines), 6)
+        self.assertEqual({line.split(',')[1] for line in lines[1:]}, {str(self.trips[1].id)})
+
+class LogGraphTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        log_graph_renderer.clear()
+        self.trip = Trip.objects.create(current_location='New York, NY', pickup_location='Boston, MA',
+                                        dropoff_location='Philadelphia, PA', current_cycle_hours=5.5)
+        LogSheet.objects.bulk_create(
+            LogSheet(trip=self.trip, date=date(2025, 1, day), start_time=time(0, 0), end_time=time(0, 0),
+                     status_grid=[[0, 360, 'OFF'], [360, 420, 'ON'], [420, 900, 'D'], [900, 1440, 'SB']])
+            for day in range(14, 0, -1)
+        )
+        self.sheet = LogSheet.objects.get(date=date(2025, 1, 1))
+
+    def test_sheet_svg(self):
+        """Test that a sheet renders as well-formed SVG drawing the duty line over the shared base layer"""
+        response = self.client.get(reverse('logsheet-graph', args=[self.sheet.id]))
+
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        root = ElementTree.fromstring(response.content)
+        svg = '{http://www.w3.org/2000/svg}'
+        self.assertEqual(len(root.findall(f'{svg}defs/{svg}g[@id="log-base"]')), 1)
+        duty = root.find(f'.//{svg}path[@class="duty"]').get('d')
+        # Off duty row to on duty at 06:00, driving from 07:00, sleeper berth from 15:00
+        self.assertTrue(duty.startswith('M140 65L296 65L296 155L322 155L322 125L530 125L530 95L764 95'))
+        texts = [text.text for text in root.iter(f'{svg}text')]
+        self.assertIn("Driver's Daily Log - 2025-01-01", texts)
+        self.assertEqual(texts[-5:], ['6.00', '9.00', '8.00', '1.00', '24.00'])
+
+    def test_trip_pdf_shares_base_layer(self):
+        """Test that a 14-day trip renders one PDF page per day with the grid embedded once"""
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('trip-log-graphs', args=[self.trip.id]), {'file_format': 'pdf'})
+
+        content = response.content
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF-1.4') and content.endswith(b'%%EOF\n'))
+        self.assertIn(b'/Count 14', content)
+        self.assertEqual(content.count(b'/Subtype /Form'), 1)
+        self.assertEqual(content.count(b'/Base Do'), 14)
+        # Cross-reference offsets point at their objects
+        xref = int(content.rsplit(b'startxref\n', 1)[1].split(b'\n')[0])
+        offsets = [int(line[:10]) for line in content[xref:].split(b'\n')[3:3 + 32]]
+        for number, offset in enumerate(offsets, start=1):
+            self.assertTrue(content[offset:].startswith(b'%d 0 obj' % number))
+        # Pages follow the dates
+        self.assertLess(content.index(b'2025-01-01'), content.index(b'2025-01-14'))
+
+    def test_cached_overlays_invalidated_on_change(self):
+        """Test that repeat renders reuse the cached overlay until the sheet is saved"""
+        url = reverse('logsheet-graph', args=[self.sheet.id])
+        first = self.client.get(url).content
+        hits = log_graph_renderer.cache.hits
+        self.assertEqual(self.client.get(url).content, first)
+        self.assertEqual(log_graph_renderer.cache.hits, hits + 1)
+
+        self.sheet.status_grid = [[0, 1440, 'OFF']]
+        self.sheet.save()
+        self.assertEqual(len(log_graph_renderer.cache), 0)
+        self.assertIn(b'>24.00</text>', self.client.get(url).content)
+
+        # Changes made elsewhere (here a queryset update, which sends no signal) are not served stale
+        LogSheet.objects.filter(pk=self.sheet.pk).update(status_grid=[[0, 1440, 'D']])
+        self.assertIn('M140 125L764 125', self.client.get(url).content.decode())
+
+    def test_malformed_grid_rendered_blank(self):
+        """Test that sheets whose stored grid cannot be read render without a duty line instead of failing"""
+        for grid in ({'hours': [0] * 24, 'status': ['off_duty'] * 24}, [[0, 1440, 'X']], [[0, 600]]):
+            LogSheet.objects.filter(pk=self.sheet.pk).update(status_grid=grid)
+            response = self.client.get(reverse('logsheet-graph', args=[self.sheet.id]))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            root = ElementTree.fromstring(response.content)
+            self.assertEqual(root.find('.//{http://www.w3.org/2000/svg}path[@class="duty"]').get('d'), '')
+            self.assertIn(b'>0.00</text>', response.content)
+
+            response = self.client.get(reverse('trip-log-graphs', args=[self.trip.id]), {'file_format': 'pdf'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn(b'/Count 14', response.content)
+
+    def test_non_numeric_bounds_rendered_blank(self):
+        """Test that a stored grid with non-numeric or fractional bounds renders without a duty line"""
+        for grid in ([[0, 'x', 'OFF']], [['0', 1440, 'OFF']], [[0, 720.5, 'OFF'], [720.5, 1440, 'D']]):
+            LogSheet.objects.filter(pk=self.sheet.pk).update(status_grid=grid)
+            response = self.client.get(reverse('logsheet-graph', args=[self.sheet.id]))
+            self.assertEqual(response.status_code, status.HTTP_200_OK, grid)
+            root = ElementTree.fromstring(response.content)
+            self.assertEqual(root.find('.//{http://www.w3.org/2000/svg}path[@class="duty"]').get('d'), '')
+
+    def test_unknown_format_rejected(self):
+        """Test that only svg and pdf are rendered"""
+        response = self.client.get(reverse('logsheet-graph', args=[self.sheet.id]), {'file_format': 'png'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RouteGeometryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        geocode_cache.clear()
+        route_cache.clear()
+        route_geometry_cache.clear()
+        # A road wiggling ~50 m either side of a straight line east from New York, one point every ~100 m
+        self.line = [(round(40.71 + (0.0005 if index % 2 else 0), 5), round(-74.0 + index * 0.0012, 5))
+                     for index in range(2000)]
+        route = {'distance': 500000.0, 'duration': 36000.0, 'legs': [], 'geometry': encode(self.line)}
+        coordinates = {'New York, NY': (40.71, -74.00), 'Boston, MA': (42.36, -71.05),
+                       'Philadelphia, PA': (39.95, -75.16)}
+        patcher = mock.patch('api.services.route_planner.RoutePlanner._get_coordinates',
+                             side_effect=coordinates.__getitem__)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('api.services.route_planner.RoutePlanner._fetch_route', return_value=route)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        response = self.client.post(reverse('trip-plan-route'), {
+            'current_location': 'New York, NY',
+            'pickup_location': 'Boston, MA',
+            'dropoff_location': 'Philadelphia, PA',
+            'current_cycle_hours': 5.5
+        }, format='json')
+        self.plan = response.json()
+        self.url = reverse('trip-geometry', args=[self.plan['trip']['id']])
+
+    def test_geometry_stored_but_not_inlined(self):
+        """Test that planning stores the route line on the trip without adding it to trip or route bodies"""
+        trip = Trip.objects.get()
+        self.assertEqual(decode(trip.route_geometry), self.line)
+        self.assertNotIn('geometry', self.plan['route'])
+        self.assertNotIn('route_geometry', self.plan['trip'])
+        self.assertNotIn('route_geometry', self.client.get(reverse('trip-detail', args=[trip.id])).json())
+
+    def test_full_and_simplified_lines(self):
+        """Test that a tolerance above the wiggle collapses the line while zero keeps every point"""
+        full = self.client.get(self.url, {'tolerance': 0}).json()
+        self.assertEqual(full['points'], 2000)
+        self.assertEqual(decode(full['geometry']), self.line)
+
+        coarse = self.client.get(self.url, {'tolerance': 100}).json()
+        self.assertEqual((coarse['points'], coarse['original_points']), (2, 2000))
+        self.assertEqual(decode(coarse['geometry']), [self.line[0], self.line[-1]])
+
+        # Zoomed out a pixel is kilometers wide; zoomed in it is under a meter, so every wiggle stays
+        self.assertLess(self.client.get(self.url, {'zoom': 8}).json()['points'], 10)
+        zoomed_in = self.client.get(self.url, {'zoom': 18, 'encoding': 'geojson'}).json()
+        self.assertEqual(zoomed_in['points'], 2000)
+        self.assertEqual(zoomed_in['geometry']['type'], 'LineString')
+        self.assertEqual(zoomed_in['geometry']['coordinates'][1], [self.line[1][1], self.line[1][0]])
+
+    def test_levels_cached_per_trip(self):
+        """Test that each simplification level is computed once and dropped when the trip changes"""
+        with mock.patch.object(route_geometry, 'simplify', wraps=route_geometry.simplify) as simplify:
+            first = self.client.get(self.url, {'zoom': 10})
+            repeat = self.client.get(self.url, {'zoom': 10}, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.client.get(self.url, {'zoom': 12})
+        self.assertEqual(repeat.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(simplify.call_count, 2)
+
+        trip = Trip.objects.get()
+        trip.route_geometry = encode(self.line[:10])
+        trip.save()
+        self.assertEqual(len(route_geometry_cache.cache), 0)
+        self.assertEqual(self.client.get(self.url, {'zoom': 10}).json()['original_points'], 10)
+
+    @override_settings(ROUTE_GEOMETRY_LEVELS=3)
+    def test_levels_per_trip_bounded(self):
+        """Test that arbitrary tolerances only keep the most recently used simplified lines"""
+        route_geometry_cache.clear()
+        for tolerance in range(1, 21):
+            self.assertEqual(self.client.get(self.url, {'tolerance': tolerance}).json()['tolerance'], tolerance)
+        trip_id = Trip.objects.get().pk
+        self.assertEqual(route_geometry_cache.levels(trip_id), 3)
+        with mock.patch.object(route_geometry, 'simplify', wraps=route_geometry.simplify) as simplify:
+            self.client.get(self.url, {'tolerance': 20})
+            self.client.get(self.url, {'tolerance': 1})
+        self.assertEqual(simplify.call_count, 1)
+        self.assertEqual(route_geometry_cache.levels(trip_id), 3)
+
+    def test_invalid_parameters(self):
+        """Test that bad levels and encodings are rejected and trips without a line answer 404"""
+        for params in ({'zoom': 23}, {'zoom': 'far'}, {'tolerance': -1}, {'tolerance': 'nan'}, {'encoding': 'wkt'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST, params)
+
+        Trip.objects.update(route_geometry=None)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class MultiStopTripTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('trip-plan-route')
+        geocode_cache.clear()
+        route_cache.clear()
+        duration_matrix_cache.clear()
+        # Stops along a line east of the start, one unit of longitude an hour apart
+        self.coordinates = {'Start': (40.0, -100.0), 'Pickup A': (40.0, -99.0), 'Pickup B': (40.0, -98.0),
+                            'Dropoff B': (40.0, -97.0), 'Dropoff A': (40.0, -96.0)}
+        self.stops = [
+            {'location': 'Dropoff A', 'kind': 'dropoff', 'shipment': 'A'},
+            {'location': 'Pickup B', 'kind': 'pickup', 'shipment': 'B'},
+            {'location': 'Dropoff B', 'kind': 'dropoff', 'shipment': 'B'},
+            {'location': 'Pickup A', 'kind': 'pickup', 'shipment': 'A'},
+        ]
+        patcher = mock.patch('api.services.route_planner.RoutePlanner._get_coordinates',
+                             side_effect=self.coordinates.__getitem__)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('api.services.route_planner.RoutePlanner._fetch_route', side_effect=self._route)
+        self.fetch_route = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('api.services.routing.router.duration_matrix', side_effect=self._matrix)
+        self.duration_matrix = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _route(self, waypoints):
+        legs = [{'distance': abs(b[1] - a[1]) * 85000, 'duration': abs(b[1] - a[1]) * 3600}
+                for a, b in zip(waypoints, waypoints[1:])]
+        return {'distance': sum(leg['distance'] for leg in legs), 'duration': sum(leg['duration'] for leg in legs),
+                'legs': legs, 'geometry': None}
+
+    def _matrix(self, points):
+        return [[abs(b[1] - a[1]) * 3600 for b in points] for a in points]
+
+    def _plan(self, **extra):
+        return self.client.post(self.url, {'current_location': 'Start', 'current_cycle_hours': 0,
+                                           'stops': self.stops, **extra}, format='json')
+
+    def test_optimized_order_saved(self):
+        """Test that unordered stops are driven outwards, saved in that order and listed by the stops action"""
+        response = self._plan(optimize_stops=True)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order = ['Pickup A', 'Pickup B', 'Dropoff B', 'Dropoff A']
+        self.assertEqual([stop['location'] for stop in response.data['route']['stops']], order)
+        self.assertEqual(self.duration_matrix.call_count, 1)
+        self.assertEqual(self.fetch_route.call_count, 1)
+        self.assertEqual(response.data['route']['total_duration'], 4)
+
+        trip = Trip.objects.get()
+        self.assertEqual((trip.pickup_location, trip.dropoff_location), ('Pickup A', 'Dropoff A'))
+        self.assertEqual(list(trip.stops.order_by('sequence').values_list('location', flat=True)), order)
+        stops = self.client.get(reverse('trip-stops', args=[trip.id])).json()
+        self.assertEqual([(stop['sequence'], stop['kind'], stop['shipment']) for stop in stops],
+                         [(1, 'pickup', 'A'), (2, 'pickup', 'B'), (3, 'dropoff', 'B'), (4, 'dropoff', 'A')])
+
+    def test_ordered_stops_kept(self):
+        """Test that stops are driven as given without a matrix when the order is not optimized"""
+        self.stops = [self.stops[3], self.stops[0], self.stops[1], self.stops[2]]
+        response = self._plan()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([stop['location'] for stop in response.data['route']['stops']],
+                         ['Pickup A', 'Dropoff A', 'Pickup B', 'Dropoff B'])
+        self.assertEqual(self.duration_matrix.call_count, 0)
+        # Legs of 1, 3, 2 and 1 hours, each followed by its stop
+        self.assertEqual([stop['type'] for stop in response.data['route']['required_stops']][:4],
+                         ['pickup', 'dropoff', 'pickup', 'dropoff'])
+
+    def test_invalid_stops(self):
+        """Test that stops out of pickup/dropoff order or without both kinds are rejected"""
+        response = self._plan()
+        self.assertEqual(response.data['errors'], ["Each dropoff must come after the pickups of its shipment"])
+        response = self._plan(stops=[{'location': 'Pickup A', 'kind': 'pickup'}])
+        self.assertEqual(response.data['errors'], ["stops must include at least one pickup and one dropoff"])
+        response = self._plan(stops=[{'location': 'Pickup A', 'kind': 'stopover'}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(TRIP_MAX_STOPS=3):
+            self.assertEqual(self._plan(optimize_stops=True).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Trip.objects.exists())
+
+    def test_batch_mixes_trip_shapes(self):
+        """Test that plan_routes plans multi-stop trips alongside pickup/dropoff ones"""
+        response = self.client.post(reverse('trip-plan-routes'), {'trips': [
+            {'current_location': 'Start', 'current_cycle_hours': 0, 'stops': self.stops, 'optimize_stops': True},
+            {'current_location': 'Start', 'pickup_location': 'Pickup A', 'dropoff_location': 'Dropoff A',
+             'current_cycle_hours': 0},
+        ]}, format='json')
+
+        results = response.data['results']
+        self.assertEqual(len(results[0]['route']['stops']), 4)
+        self.assertNotIn('stops', results[1]['route'])
+        self.assertEqual(TripStop.objects.count(), 4)
+
+class DutySummaryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('logsheet-summary')
+        self.trips = [
+            Trip.objects.create(current_location='New York, NY', pickup_location='Boston, MA',
+                                dropoff_location='Philadelphia, PA', current_cycle_hours=5.5)
+            for _ in range(2)
+        ]
+        for trip in self.trips:
+            for day in (30, 31):
+                LogSheet.objects.create(trip=trip, date=date(2025, 1, day), start_time=time(0, 0),
+                                        end_time=time(0, 0),
+                                        status_grid=[[0, 480, 'OFF'], [480, 540, 'ON'], [540, 1440, 'D']])
+        LogSheet.objects.create(trip=self.trips[0], date=date(2025, 2, 1), start_time=time(0, 0),
+                                end_time=time(0, 0), status_grid=[[0, 600, 'SB'], [600, 1440, 'OFF']])
+
+    def _summaries(self):
+        return list(DutySummary.objects.order_by('log_sheet_id').values_list(
+            'log_sheet_id', 'trip_id', 'date', 'off_duty_minutes', 'sleeper_berth_minutes',
+            'driving_minutes', 'on_duty_minutes'))
+
+    def test_summaries_follow_sheets(self):
+        """Test that saving, editing and deleting a sheet keeps its summary in step"""
+        self.assertEqual(DutySummary.objects.count(), 5)
+        sheet = LogSheet.objects.get(date=date(2025, 2, 1))
+        self.assertEqual((sheet.summary.off_duty_minutes, sheet.summary.sleeper_berth_minutes), (840, 600))
+
+        response = self.client.patch(reverse('logsheet-detail', args=[sheet.id]),
+                                     {'status_grid': [[0, 1440, 'ON']]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sheet.summary.refresh_from_db()
+        self.assertEqual((sheet.summary.on_duty_minutes, sheet.summary.off_duty_minutes), (1440, 0))
+
+        sheet.delete()
+        self.assertEqual(DutySummary.objects.count(), 4)
+
+    def test_malformed_grid_summarized_as_zero(self):
+        """Test that an ORM write of an unreadable grid saves with an all-zero summary instead of raising"""
+        for grid in ([[0, 'x', 'OFF']], [[0, 720.5, 'OFF'], [720.5, 1440, 'D']], [[0, 1440, 'X']]):
+            sheet = LogSheet.objects.create(trip=self.trips[1], date=date(2025, 3, 1), start_time=time(0, 0),
+                                            end_time=time(0, 0), status_grid=grid)
+            summary = DutySummary.objects.get(log_sheet=sheet)
+            self.assertEqual((summary.off_duty_minutes, summary.sleeper_berth_minutes,
+                              summary.driving_minutes, summary.on_duty_minutes), (0, 0, 0, 0), grid)
+
+    def test_generated_sheets_summarized_in_bulk(self):
+        """Test that LogGenerator inserts the summaries of a trip's sheets with one query"""
+        trip = self.trips[1]
+        with self.assertNumQueries(2):
+            sheets = LogGenerator().generate_logs(trip, {'total_duration': 30.0})
+
+        for sheet in sheets:
+            summary = DutySummary.objects.get(log_sheet=sheet)
+            self.assertEqual(summary.date, sheet.date)
+            self.assertEqual(summary.off_duty_minutes + summary.sleeper_berth_minutes
+                             + summary.driving_minutes + summary.on_duty_minutes, 1440)
+        self.assertEqual(sum(summary.driving_minutes for summary in DutySummary.objects.filter(
+            log_sheet__in=sheets)), 30 * 60)
+
+    def test_group_by_date_trip_month_and_total(self):
+        """Test that the endpoint sums hours per group in one query"""
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'date': date(2025, 1, 30), 'off_duty_hours': 16.0, 'sleeper_berth_hours': 0.0,
+             'driving_hours': 30.0, 'on_duty_hours': 2.0, 'sheets': 2},
+            {'date': date(2025, 1, 31), 'off_duty_hours': 16.0, 'sleeper_berth_hours': 0.0,
+             'driving_hours': 30.0, 'on_duty_hours': 2.0, 'sheets': 2},
+            {'date': date(2025, 2, 1), 'off_duty_hours': 14.0, 'sleeper_berth_hours': 10.0,
+             'driving_hours': 0.0, 'on_duty_hours': 0.0, 'sheets': 1},
+        ])
+
+        response = self.client.get(self.url, {'group_by': 'trip'})
+        self.assertEqual([(row['trip'], row['driving_hours'], row['sheets']) for row in response.data['results']],
+                         [(self.trips[0].id, 30.0, 3), (self.trips[1].id, 30.0, 2)])
+
+        response = self.client.get(self.url, {'group_by': 'month'})
+        self.assertEqual([(str(row['month']), row['sheets']) for row in response.data['results']],
+                         [('2025-01-01', 4), ('2025-02-01', 1)])
+
+        response = self.client.get(self.url, {'group_by': 'total', 'trip': self.trips[1].id,
+                                              'date_from': '2025-01-31'})
+        self.assertEqual(response.data['results'], [{'off_duty_hours': 8.0, 'sleeper_berth_hours': 0.0,
+                                                     'driving_hours': 15.0, 'on_duty_hours': 1.0, 'sheets': 1}])
+
+    def test_invalid_parameters_rejected(self):
+        """Test that unknown groupings, non-numeric trips and bad dates are validation errors"""
+        for params in ({'group_by': 'driver'}, {'trip': 'abc'}, {'date_from': '2025/01/01'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_date_range_sum_uses_index(self):
+        """Test that date-range aggregates read the summary date index"""
+        queryset = (DutySummary.objects.filter(date__gte=date(2025, 1, 31), date__lte=date(2025, 2, 1))
+                    .values('date').annotate(driving=Sum('driving_minutes')).order_by('date'))
+        assert_uses_index(self, queryset, 'api_dutysummary_date_idx')
+
+    def test_backfill_command(self):
+        """Test that the backfill writes missing summaries and --rebuild recounts stale ones"""
+        expected = self._summaries()
+        DutySummary.objects.filter(trip=self.trips[0]).delete()
+        # Updates bypass the signal, like sheets saved in the legacy hourly encoding before the table existed
+        LogSheet.objects.filter(trip=self.trips[1]).update(status_grid={str(hour): 'D' for hour in range(24)})
+
+        out = io.StringIO()
+        call_command('backfill_duty_summaries', '--batch-size', '2', stdout=out)
+        self.assertIn('Wrote 3 summaries', out.getvalue())
+        self.assertEqual(self._summaries(), expected)
+
+        call_command('backfill_duty_summaries', '--rebuild', '--trip', str(self.trips[1].id), stdout=out)
+        self.assertEqual(DutySummary.objects.filter(trip=self.trips[1], driving_minutes=1440).count(), 2)
+        self.assertEqual(DutySummary.objects.count(), 5)
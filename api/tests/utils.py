@@ -0,0 +1,23 @@
+from django.db import connection
+
+def explain(queryset) -> str:
+    """Return the database's query plan for a queryset.
+
+    On PostgreSQL sequential scans are disabled while explaining, so the plan
+    shows whether a usable index exists rather than what the planner prefers
+    for the handful of rows in a test database.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.explain()
+    with connection.cursor() as cursor:
+        cursor.execute('SET enable_seqscan = off')
+    try:
+        return queryset.explain()
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('RESET enable_seqscan')
+
+def assert_uses_index(testcase, queryset, index_name: str) -> None:
+    """Fail the test unless the query plan for `queryset` reads `index_name`"""
+    plan = explain(queryset)
+    testcase.assertIn(index_name, plan, f"Expected the query to use {index_name}, got plan:\n{plan}")
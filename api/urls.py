@@ -1,11 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TripViewSet, LogSheetViewSet
+from .views import TripViewSet, LogSheetViewSet, PlanJobViewSet, plan_route_async, metrics
 
 router = DefaultRouter()
 router.register(r'trips', TripViewSet, basename='trip')
 router.register(r'logsheets', LogSheetViewSet, basename='logsheet')
+router.register(r'jobs', PlanJobViewSet, basename='planjob')
 
 urlpatterns = [
+    path('metrics', metrics, name='metrics'),
+    path('trips/plan_route_async/', plan_route_async, name='trip-plan-route-async'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
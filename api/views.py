@@ -1,106 +1,373 @@
-from rest_framework import viewsets
+from rest_framework import mixins, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import status
-from .models import Trip, LogSheet
-from .serializers import TripSerializer, LogSheetSerializer
-from .services.route_planner import RoutePlanner
-from .services.log_generator import LogGenerator
+from rest_framework.request import Request
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.reverse import reverse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
+import hashlib
+import json
+from .models import Trip, LogSheet, PlanJob
+from .serializers import TripSerializer, TripStopSerializer, LogSheetSerializer, PlanJobSerializer, requested_fields
+from .pagination import TripCursorPagination, LogSheetCursorPagination
+from .services.timing import render_metrics, span
 
-class TripViewSet(viewsets.ModelViewSet):
+# Planning, rendering and export services are imported by the views that use them, so a cold start
+# serving a list endpoint does not load them.
+
+class ETagMixin:
+    """Strong ETags from a hash of the response body; a matching If-None-Match gets an empty 304"""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (request.method in ('GET', 'HEAD') and response.status_code == status.HTTP_200_OK
+                and getattr(response, 'data', None) is not None):
+            etag = '"%s"' % hashlib.sha256(JSONRenderer().render(response.data)).hexdigest()[:32]
+            if etag in {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+        return super().finalize_response(request, response, *args, **kwargs)
+
+class TripViewSet(ETagMixin, viewsets.ModelViewSet):
     queryset = Trip.objects.all()
     serializer_class = TripSerializer
+    pagination_class = TripCursorPagination
+
+    def get_queryset(self):
+        # The route line can run to hundreds of kilobytes; only the geometry action reads it
+        queryset = Trip.objects.all() if self.action == 'geometry' else Trip.objects.defer('route_geometry')
+        # Load nested log sheets for the whole page in one query, unless the client omitted them
+        if (self.action not in ('geometry', 'stops')
+                and 'log_sheets' in requested_fields(self.request, ['log_sheets'])):
+            queryset = queryset.prefetch_related('log_sheets')
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        with span('list'):
+            return super().list(request, *args, **kwargs)
 
     @action(detail=False, methods=['post'])
     def plan_route(self, request):
+        """Plan and save a trip; repeats of a request (same payload or Idempotency-Key) replay its response"""
+        from .services import idempotency
+
+        data = request.data.dict() if hasattr(request.data, 'dict') else request.data
+        run_async = request.query_params.get('mode') == 'async' or 'respond-async' in request.headers.get('Prefer', '')
         try:
-            # Validate input data
-            required_fields = ['current_location', 'pickup_location', 'dropoff_location', 'current_cycle_hours']
-            errors = []
-            
-            # Check for missing fields
-            for field in required_fields:
-                if field not in request.data:
-                    errors.append(f"{field} is required")
-            
-            # Validate current_cycle_hours
-            if 'current_cycle_hours' in request.data:
-                try:
-                    current_cycle_hours = float(request.data['current_cycle_hours'])
-                    if current_cycle_hours < 0:
-                        errors.append("Hours must be a positive number")
-                except (ValueError, TypeError):
-                    errors.append("Hours must be a valid number")
-
-            # Return field errors if any
-            if errors:
-                return Response(
-                    {'errors': errors},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            planner = RoutePlanner()
-            try:
-                route_data = planner.calculate_route(
-                    request.data['current_location'],
-                    request.data['pickup_location'],
-                    request.data['dropoff_location'],
-                    current_cycle_hours
-                )
-            except ValueError as e:
-                error_message = str(e)
-                if "cannot be the same" in error_message:
-                    if "Pickup location and destination" in error_message:
-                        errors.append("Destination must be different from pickup location")
-                    elif "Current location and destination" in error_message:
-                        errors.append("Destination must be different from current location")
-                    return Response(
-                        {'errors': errors},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                return Response(
-                    {'errors': ["Location does not exist"]},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Create trip record
-            trip_serializer = self.serializer_class(data={
-                **request.data,
-                'total_distance': route_data['total_distance'],
-                'estimated_duration': route_data['total_duration']
-            })
-            
-            if trip_serializer.is_valid():
-                trip = trip_serializer.save()
-                # Generate log sheets
-                log_generator = LogGenerator()
-                log_sheets = log_generator.generate_logs(trip, route_data)
-                
-                return Response({
-                    'trip': trip_serializer.data,
-                    'route': route_data,
-                    'log_sheets': LogSheetSerializer(log_sheets, many=True).data
-                })
-            
-            # Return serializer validation errors
+            record, created = idempotency.begin(
+                request.headers.get('Idempotency-Key'),
+                idempotency.request_fingerprint(f"{request.path}?mode={'async' if run_async else 'sync'}", data)
+            )
+        except idempotency.IdempotencyConflict as e:
+            return Response({'errors': [str(e)]}, status=e.status_code)
+        if record is not None and not created:
+            return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+        try:
+            response = self._enqueue_plan_route(request, data) if run_async else self._plan_route(data)
+        except Exception:
+            # Release the claim so a retry is planned instead of answered 409 until IN_PROGRESS_TIMEOUT
+            idempotency.finish(record, status.HTTP_500_INTERNAL_SERVER_ERROR, None)
+            raise
+        idempotency.finish(record, response.status_code, response.data)
+        return response
+
+    def _plan_route(self, data):
+        from .services.trip_planning import TripPlanningService, TripPlanningError
+
+        try:
+            service = TripPlanningService(context=self.get_serializer_context())
+            return Response(service.plan(data))
+        except TripPlanningError as e:
             return Response(
-                {'errors': list(trip_serializer.errors.values())},
-                status=status.HTTP_400_BAD_REQUEST
+                {'errors': e.errors},
+                status=e.status_code
             )
-            
         except Exception as e:
             return Response(
                 {'errors': ["Location does not exist"]},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-class LogSheetViewSet(viewsets.ModelViewSet):
+    def _enqueue_plan_route(self, request, data):
+        """Queue the trip for plan_jobs_worker and answer 202 with where to follow the job"""
+        from .services.plan_jobs import enqueue
+        from .services.trip_planning import TripPlanningError
+
+        try:
+            job = enqueue(data)
+        except TripPlanningError as e:
+            return Response({'errors': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        status_url = reverse('planjob-detail', args=[job.pk], request=request)
+        return Response(
+            {
+                'job_id': str(job.pk),
+                'status': job.status,
+                'status_url': status_url,
+                'stream_url': reverse('planjob-stream', args=[job.pk], request=request),
+            },
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': status_url}
+        )
+
+    @action(detail=True, methods=['get'])
+    def log_graphs(self, request, pk=None):
+        """Daily log graphs of every sheet of the trip in date order, as one SVG or one PDF page per day"""
+        trip = self.get_object()
+        # get_queryset already prefetched the sheets
+        sheets = sorted(trip.log_sheets.all(), key=lambda sheet: (sheet.date, sheet.pk))
+        return _log_graph_response(request, sheets, f"trip_{trip.pk}_logs")
+
+    @action(detail=True, methods=['get'])
+    def stops(self, request, pk=None):
+        """The pickups and dropoffs of a trip planned with a list of stops, in driving order"""
+        trip = self.get_object()
+        return Response(TripStopSerializer(trip.stops.order_by('sequence'), many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def geometry(self, request, pk=None):
+        """The trip's route line, simplified to ?tolerance= meters or one pixel at ?zoom=, as ?encoding=polyline|geojson"""
+        from .services.route_geometry import MAX_ZOOM, PRECISION, encode, route_geometry_cache
+
+        encoding = request.query_params.get('encoding', 'polyline')
+        if encoding not in ('polyline', 'geojson'):
+            raise ValidationError({'encoding': ["Must be one of polyline, geojson"]})
+        tolerance = zoom = None
+        if 'zoom' in request.query_params:
+            try:
+                zoom = int(request.query_params['zoom'])
+            except ValueError:
+                zoom = -1
+            if not 0 <= zoom <= MAX_ZOOM:
+                raise ValidationError({'zoom': [f"Must be an integer from 0 to {MAX_ZOOM}"]})
+        elif 'tolerance' in request.query_params:
+            try:
+                tolerance = float(request.query_params['tolerance'])
+            except ValueError:
+                tolerance = -1.0
+            # Also rejects nan and inf
+            if not 0 <= tolerance < float('inf'):
+                raise ValidationError({'tolerance': ["Must be a non-negative number of meters"]})
+
+        trip = self.get_object()
+        if not trip.route_geometry:
+            return Response({'errors': ["No route geometry is stored for this trip"]},
+                            status=status.HTTP_404_NOT_FOUND)
+        with span('simplify'):
+            line = route_geometry_cache.simplified(trip, tolerance=tolerance, zoom=zoom)
+        data = {
+            'trip': trip.pk,
+            'tolerance': line['tolerance'],
+            'points': len(line['points']),
+            'original_points': line['original_points'],
+            'encoding': encoding,
+        }
+        if encoding == 'polyline':
+            data['precision'] = PRECISION
+            data['geometry'] = encode(line['points'])
+        else:
+            data['geometry'] = {'type': 'LineString', 'coordinates': [[lon, lat] for lat, lon in line['points']]}
+        return Response(data)
+
+    @action(detail=False, methods=['post'])
+    def plan_routes(self, request):
+        """Plan a batch of trips, returning one result (or list of errors) per trip in order"""
+        from .services.trip_planning import TripPlanningService
+
+        trips = request.data.get('trips') if isinstance(request.data, dict) else request.data
+        if not isinstance(trips, list) or not trips:
+            return Response(
+                {'errors': ["trips must be a non-empty list"]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_batch_size = getattr(settings, 'PLAN_ROUTES_MAX_BATCH', 500)
+        if len(trips) > max_batch_size:
+            return Response(
+                {'errors': [f"At most {max_batch_size} trips can be planned per request"]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        service = TripPlanningService(context=self.get_serializer_context())
+        return Response({'results': service.plan_many(trips)})
+
+async def plan_route_async(request):
+    """Async plan_route for ASGI deployments.
+
+    Accepts the same payload and returns the same body as TripViewSet.plan_route,
+    but awaits Nominatim/OSRM on the event loop instead of blocking a worker thread.
+    Repeats (same payload or Idempotency-Key) are replayed the same way too.
+    """
+    from asgiref.sync import sync_to_async
+    from .services import idempotency
+    from .services.trip_planning import AsyncTripPlanningService, TripPlanningError
+
+    if request.method != 'POST':
+        return JsonResponse({'errors': ["Method not allowed"]}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return JsonResponse({'errors': ["Request body must be a JSON object"]}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        record, created = await sync_to_async(idempotency.begin)(
+            request.headers.get('Idempotency-Key'), idempotency.request_fingerprint(request.path, data)
+        )
+    except idempotency.IdempotencyConflict as e:
+        return JsonResponse({'errors': [str(e)]}, status=e.status_code)
+    if record is not None and not created:
+        return JsonResponse(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+    try:
+        service = AsyncTripPlanningService(context={'request': Request(request)})
+        body, status_code = await service.plan_async(data), status.HTTP_200_OK
+    except TripPlanningError as e:
+        body, status_code = {'errors': e.errors}, e.status_code
+    except Exception:
+        body, status_code = {'errors': ["Location does not exist"]}, status.HTTP_400_BAD_REQUEST
+    except BaseException:
+        # Cancelled (the client went away): release the claim so a retry is planned
+        await sync_to_async(idempotency.finish)(record, status.HTTP_500_INTERNAL_SERVER_ERROR, None)
+        raise
+    await sync_to_async(idempotency.finish)(record, status_code, body)
+    return JsonResponse(body, status=status_code)
+
+# Like DRF's views, this is a token-less JSON API; csrf_exempt() does not wrap async views in Django 4.2
+plan_route_async.csrf_exempt = True
+
+class PlanJobViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Status and result of plan_route jobs queued with ?mode=async"""
+    queryset = PlanJob.objects.all()
+    serializer_class = PlanJobSerializer
+
+    @action(detail=True, methods=['get'])
+    def stream(self, request, pk=None):
+        """Follow a job as server-sent events until it succeeds or fails"""
+        from .services.plan_jobs import job_events
+
+        job = self.get_object()
+        events = job_events(job.pk)
+        response = StreamingHttpResponse(events if _is_asgi(request) else _iterate_sync(events),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+class LogSheetViewSet(ETagMixin, viewsets.ModelViewSet):
     queryset = LogSheet.objects.all()
     serializer_class = LogSheetSerializer
+    pagination_class = LogSheetCursorPagination
 
     def get_queryset(self):
         queryset = LogSheet.objects.all()
         trip_id = self.request.query_params.get('trip', None)
         if trip_id is not None:
             queryset = queryset.filter(trip_id=trip_id)
-        return queryset
\ No newline at end of file
+
+        # Date range filters are served by the (trip, date) and date indexes
+        for param, lookup in (('date_from', 'date__gte'), ('date_to', 'date__lte')):
+            parsed = self._date_param(param)
+            if parsed is not None:
+                queryset = queryset.filter(**{lookup: parsed})
+        return queryset
+
+    def _date_param(self, param):
+        value = self.request.query_params.get(param)
+        if value is None:
+            return None
+        try:
+            parsed = parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValidationError({param: ["Date must be in YYYY-MM-DD format"]})
+        return parsed
+
+    def _trip_ids_param(self):
+        """Trip ids from ?trip=, repeated or comma-separated"""
+        try:
+            return [int(value) for param in self.request.query_params.getlist('trip')
+                    for value in param.split(',') if value.strip()]
+        except ValueError:
+            raise ValidationError({'trip': ["Trip ids must be integers"]})
+
+    def list(self, request, *args, **kwargs):
+        with span('list'):
+            return super().list(request, *args, **kwargs)
+
+    @action(detail=True, methods=['get'])
+    def graph(self, request, pk=None):
+        """The sheet's daily log graph as SVG or PDF (?file_format=)"""
+        return _log_graph_response(request, [self.get_object()], f"log_sheet_{pk}")
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream matching log sheets as CSV or NDJSON (?file_format=), filtered by ?trip= ids and date range"""
+        from .services import log_export
+
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in log_export.CONTENT_TYPES:
+            raise ValidationError({'file_format': [f"Must be one of {', '.join(log_export.CONTENT_TYPES)}"]})
+        queryset = log_export.export_queryset(self._trip_ids_param(), self._date_param('date_from'),
+                                              self._date_param('date_to'))
+        export = log_export.aexport_log_sheets if _is_asgi(request) else log_export.export_log_sheets
+        response = StreamingHttpResponse(export(queryset, file_format),
+                                         content_type=log_export.CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="log_sheets.{file_format}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Hours in each duty status summed per ?group_by= (date, week, month, trip or total), filtered like export"""
+        from .services.duty_summary import GROUPINGS, aggregate
+
+        group_by = request.query_params.get('group_by', 'date')
+        if group_by not in GROUPINGS:
+            raise ValidationError({'group_by': [f"Must be one of {', '.join(GROUPINGS)}"]})
+        with span('aggregate'):
+            results = aggregate(group_by, self._date_param('date_from'), self._date_param('date_to'),
+                                self._trip_ids_param())
+        return Response({'group_by': group_by, 'results': results})
+
+def _is_asgi(request) -> bool:
+    """Whether the request is served by the ASGI handler, which streams async iterators as they yield"""
+    from django.core.handlers.asgi import ASGIRequest
+
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+def _iterate_sync(async_iterator):
+    """Drive an async iterator one item at a time from a WSGI worker.
+
+    Given the async iterator itself, Django's WSGI handler would collect every item before sending the first.
+    """
+    from asgiref.sync import async_to_sync
+
+    async def next_item():
+        return await async_iterator.__anext__()
+
+    while True:
+        try:
+            yield async_to_sync(next_item)()
+        except StopAsyncIteration:
+            return
+
+def _log_graph_response(request, sheets, filename):
+    from .services.log_graph import CONTENT_TYPES as GRAPH_CONTENT_TYPES, log_graph_renderer
+
+    file_format = request.query_params.get('file_format', 'svg')
+    if file_format not in GRAPH_CONTENT_TYPES:
+        raise ValidationError({'file_format': [f"Must be one of {', '.join(GRAPH_CONTENT_TYPES)}"]})
+    with span('render'):
+        content = log_graph_renderer.render(sheets, file_format)
+    response = HttpResponse(content, content_type=GRAPH_CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'inline; filename="{filename}.{file_format}"'
+    return response
+
+def metrics(request):
+    """Prometheus text exposition of request timings and upstream and cache statistics"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
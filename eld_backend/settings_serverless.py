@@ -0,0 +1,34 @@
+"""Settings for the serverless (Vercel) deployment of the JSON API.
+
+Everything in settings.py, minus what a cold start would load for nothing: the admin,
+sessions, messages and auth apps, their middleware, templates and the browsable API.
+Select it with DJANGO_SETTINGS_MODULE=eld_backend.settings_serverless. Run migrations
+with the full settings, which still know about the contrib apps' tables.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import REST_FRAMEWORK
+
+INSTALLED_APPS = [
+    'rest_framework',
+    'corsheaders',
+    'api',
+]
+
+# No sessions, so no CSRF, auth or messages middleware; DRF views are CSRF-exempt anyway
+MIDDLEWARE = [
+    'api.middleware.TimingMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+# Only the browsable API renders templates
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    # Without django.contrib.auth there are no users: requests are anonymous and request.user is None
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'UNAUTHENTICATED_USER': None,
+}
@@ -1,13 +1,21 @@
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from api.views import TripViewSet, LogSheetViewSet
+from api.views import TripViewSet, LogSheetViewSet, PlanJobViewSet, plan_route_async, metrics
 
 router = DefaultRouter()
 router.register(r'trips', TripViewSet)
 router.register(r'logsheets', LogSheetViewSet, basename='logsheet')
+router.register(r'jobs', PlanJobViewSet, basename='planjob')
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    path('metrics', metrics, name='metrics'),
+    path('api/trips/plan_route_async/', plan_route_async, name='trip-plan-route-async'),
     path('api/', include(router.urls)),
-]
\ No newline at end of file
+]
+
+# The serverless settings leave the admin out
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.append(path('admin/', admin.site.urls))